@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+
+# Deterministic synthetic telemetry for load testing OTK's parsers.
+#
+# Every format is generated from the same simulated flight (a seeded random
+# walk of position, attitude and speed) and written out in chunks until the
+# file reaches the requested size, so multi-GB inputs never have to fit in
+# memory. The same seed always produces the same bytes.
+#
+#   klv         MISB ST 0601 packets, optionally with injected corruption
+#               (bit flips, truncated packets, junk between packets and bad
+#               checksums)
+#   ts          the same packets carried in an MPEG transport stream
+#               (synchronous KLV, stream_type 0x15) next to filler video
+#   srt         DJI style subtitles, in any dialect SRTParser handles:
+#               labeled_comma, labeled, labeled_latlon, bracket, unlabeled
+#   ass         DJI style ASS subtitles
+#   csv, gpx, kml
+#   blackvue    MP4 with a BlackVue 'gps ' box of NMEA sentences (limited to
+#               4 GB by the 32 bit box size)
+#
+# Usage: python3 benchmarks/corpus.py out_dir [--size 64M] [--seed 0]
+#          [--formats klv,srt,...] [--srt-dialect bracket] [--corruption 0.01]
+
+import argparse
+import math
+import os
+import random
+import struct
+import sys
+from datetime import datetime, timezone
+from typing import BinaryIO, Callable, Dict, Iterator, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from open_telemetry_kit.klv_common import misb_checksum
+from open_telemetry_kit.tsdemux import crc32_mpeg
+
+MISB_KEY = bytes.fromhex("06 0E 2B 34 02 0B 01 01 0E 01 03 01 01 00 00 00")
+
+START_TIME = 1600000000.0
+# Bytes buffered before each write
+CHUNK_SIZE = 1 << 20
+
+SRT_DIALECTS = ["labeled_comma", "labeled", "labeled_latlon", "bracket", "unlabeled"]
+
+# One sample of the simulated flight
+Sample = Tuple[float, float, float, float, float, float, float, float]
+
+def flight(seed: int, rate: float = 30.0) -> Iterator[Sample]:
+  rng = random.Random(seed)
+  lat = rng.uniform(-60, 60)
+  lon = rng.uniform(-170, 170)
+  alt = rng.uniform(50, 500)
+  heading = rng.uniform(0, 360)
+  speed = rng.uniform(5, 25)
+  i = 0
+  while True:
+    heading = (heading + rng.gauss(0, 1)) % 360
+    speed = min(max(speed + rng.gauss(0, 0.2), 0), 60)
+    alt = min(max(alt + rng.gauss(0, 0.5), 0), 5000)
+    step = speed / rate / 111320
+    lat = min(max(lat + step * math.cos(math.radians(heading)), -89), 89)
+    lon = (lon + step * math.sin(math.radians(heading)) / max(math.cos(math.radians(lat)), 0.01) + 180) % 360 - 180
+    pitch = rng.gauss(0, 3)
+    roll = rng.gauss(0, 5)
+    # (time, lat, lon, alt, heading, pitch, roll, speed)
+    yield (START_TIME + i / rate, lat, lon, alt, heading, pitch, roll, speed)
+    i += 1
+
+def _write_until(out: BinaryIO, size: int, records: Iterator[bytes]) -> int:
+  written = 0
+  count = 0
+  chunk = []
+  chunk_len = 0
+  for record in records:
+    chunk.append(record)
+    chunk_len += len(record)
+    count += 1
+    if chunk_len >= CHUNK_SIZE or written + chunk_len >= size:
+      out.write(b"".join(chunk))
+      written += chunk_len
+      chunk = []
+      chunk_len = 0
+      if written >= size:
+        break
+  if chunk:
+    out.write(b"".join(chunk))
+  return count
+
+# random.Random.randbytes() needs Python 3.9
+def _random_bytes(rng: random.Random, n: int) -> bytes:
+  return rng.getrandbits(8 * n).to_bytes(n, byteorder="big")
+
+def _datetime(t: float) -> datetime:
+  return datetime.fromtimestamp(t, tz=timezone.utc)
+
+# MISB ST 0601
+
+def _to_int(value: float, domain: Tuple[int, int], value_range: Tuple[float, float]) -> int:
+  x0, x1 = domain
+  y0, y1 = value_range
+  return min(max(round(x0 + (value - y0) * (x1 - x0) / (y1 - y0)), x0), x1)
+
+_U16 = (0, 2**16 - 1)
+_I16 = (-(2**15 - 1), 2**15 - 1)
+_U32 = (0, 2**32 - 1)
+_I32 = (-(2**31 - 1), 2**31 - 1)
+
+_MISSION_ID = b"OTK CORPUS"
+_DESIGNATION = b"OTK Synthetic"
+
+# Every packet has the same layout so it is packed with a single struct
+_KLV_BODY = [(2, 'Q'), (3, "{}s".format(len(_MISSION_ID))), (5, 'H'), (6, 'h'), (7, 'h'),
+             (10, "{}s".format(len(_DESIGNATION))), (13, 'i'), (14, 'i'), (15, 'H'), (16, 'H'),
+             (17, 'H'), (18, 'I'), (19, 'i'), (20, 'I'), (21, 'I'), (23, 'i'), (24, 'i'),
+             (25, 'H'), (65, 'B'), (1, 'H')]
+_KLV_LENGTHS = [struct.calcsize(">" + fmt) for _, fmt in _KLV_BODY]
+_KLV_BODY_LEN = sum(2 + length for length in _KLV_LENGTHS)
+_KLV_STRUCT = struct.Struct(">16sB" + "".join("BB" + fmt for _, fmt in _KLV_BODY))
+
+def klv_packet(sample: Sample, rng: random.Random) -> bytes:
+  t, lat, lon, alt, heading, pitch, roll, _ = sample
+  fc_lat = lat + rng.uniform(-0.01, 0.01)
+  fc_lon = lon + rng.uniform(-0.01, 0.01)
+  values = {2 : int(t * 1e6),
+            3 : _MISSION_ID,
+            5 : _to_int(heading, _U16, (0, 360)),
+            6 : _to_int(pitch, _I16, (-20, 20)),
+            7 : _to_int(roll, _I16, (-50, 50)),
+            10 : _DESIGNATION,
+            13 : _to_int(lat, _I32, (-90, 90)),
+            14 : _to_int(lon, _I32, (-180, 180)),
+            15 : _to_int(alt, _U16, (-900, 19000)),
+            16 : _to_int(rng.uniform(5, 60), _U16, (0, 180)),
+            17 : _to_int(rng.uniform(3, 40), _U16, (0, 180)),
+            18 : _to_int(rng.uniform(0, 360), _U32, (0, 360)),
+            19 : _to_int(rng.uniform(-90, 0), _I32, (-180, 180)),
+            20 : _to_int(0, _U32, (0, 360)),
+            21 : _to_int(alt * 2 + 100, _U32, (0, 5000000)),
+            23 : _to_int(fc_lat, _I32, (-90, 90)),
+            24 : _to_int(fc_lon, _I32, (-180, 180)),
+            25 : _to_int(0, _U16, (-900, 19000)),
+            65 : 17,
+            1 : 0}
+  args = [MISB_KEY, _KLV_BODY_LEN]
+  for (tag, _), length in zip(_KLV_BODY, _KLV_LENGTHS):
+    args += [tag, length, values[tag]]
+  packet = bytearray(_KLV_STRUCT.pack(*args))
+  checksum = misb_checksum(memoryview(packet), 0, len(packet) - 2)
+  packet[-2] = checksum >> 8
+  packet[-1] = checksum & 0xFF
+  return bytes(packet)
+
+CORRUPTIONS = ["bitflip", "truncate", "junk", "checksum"]
+
+def corrupt_packet(packet: bytes, rng: random.Random) -> Tuple[str, bytes]:
+  kind = rng.choice(CORRUPTIONS)
+  if kind == "bitflip":
+    data = bytearray(packet)
+    pos = rng.randrange(len(MISB_KEY) + 1, len(data))
+    data[pos] ^= 1 << rng.randrange(8)
+    return kind, bytes(data)
+  if kind == "truncate":
+    return kind, packet[:rng.randrange(1, len(packet))]
+  if kind == "junk":
+    return kind, packet + _random_bytes(rng, rng.randrange(1, 64))
+  return kind, packet[:-2] + bytes([packet[-2] ^ 0xFF, packet[-1]])
+
+def klv_records(seed: int, corruption: float, stats: Dict) -> Iterator[bytes]:
+  rng = random.Random(seed + 1)
+  for sample in flight(seed):
+    packet = klv_packet(sample, rng)
+    if corruption and rng.random() < corruption:
+      kind, packet = corrupt_packet(packet, rng)
+      stats[kind] = stats.get(kind, 0) + 1
+    yield packet
+
+def write_klv(out: BinaryIO, size: int, seed: int = 0, corruption: float = 0.0, **_) -> Dict:
+  stats = {}
+  stats["packets"] = _write_until(out, size, klv_records(seed, corruption, stats))
+  return stats
+
+# MPEG-TS
+
+_TS_PMT_PID = 0x1000
+_TS_VIDEO_PID = 0x100
+_TS_KLV_PID = 0x101
+
+def _psi_section(table_id: int, ext_id: int, body: bytes) -> bytes:
+  section = bytes([table_id]) + (0xB000 | (len(body) + 9)).to_bytes(2, "big") \
+            + ext_id.to_bytes(2, "big") + b"\xC1\x00\x00" + body
+  return section + crc32_mpeg(section).to_bytes(4, "big")
+
+def _pat() -> bytes:
+  return _psi_section(0, 1, (1).to_bytes(2, "big") + (0xE000 | _TS_PMT_PID).to_bytes(2, "big"))
+
+def _pmt() -> bytes:
+  metadata_descriptor = b"\x26\x09\x01\x00\xFFKLVA\x00\x0F"
+  streams = bytes([0x1B]) + (0xE000 | _TS_VIDEO_PID).to_bytes(2, "big") + b"\xF0\x00"
+  streams += bytes([0x15]) + (0xE000 | _TS_KLV_PID).to_bytes(2, "big") \
+             + (0xF000 | len(metadata_descriptor)).to_bytes(2, "big") + metadata_descriptor
+  return _psi_section(2, 1, (0xE000 | _TS_VIDEO_PID).to_bytes(2, "big") + b"\xF0\x00" + streams)
+
+def _pts(pts: int) -> bytes:
+  return bytes([0x21 | ((pts >> 29) & 0x0E), (pts >> 22) & 0xFF, ((pts >> 14) & 0xFE) | 1,
+                (pts >> 7) & 0xFF, ((pts << 1) & 0xFE) | 1])
+
+def _pes(stream_id: int, payload: bytes, pts: int) -> bytes:
+  body = b"\x80\x80\x05" + _pts(pts) + payload
+  return b"\x00\x00\x01" + bytes([stream_id]) + (len(body) if len(body) < 65536 else 0).to_bytes(2, "big") + body
+
+class _TSMuxer():
+  def __init__(self):
+    self.continuity = {}
+
+  def packets(self, pid: int, data: bytes, psi: bool = False) -> List[bytes]:
+    if psi:
+      data = b"\x00" + data
+    packets = []
+    first = True
+    while data or first:
+      cc = self.continuity.get(pid, 0)
+      self.continuity[pid] = (cc + 1) & 0x0F
+      chunk = data[:184]
+      data = data[184:]
+      header = bytes([0x47, (0x40 if first else 0) | (pid >> 8), pid & 0xFF])
+      if len(chunk) == 184:
+        header += bytes([0x10 | cc])
+      elif psi:
+        header += bytes([0x10 | cc])
+        chunk += b"\xFF" * (184 - len(chunk))
+      else:
+        # Pad with adaptation field stuffing
+        stuffing = 183 - len(chunk)
+        header += bytes([0x30 | cc, stuffing])
+        if stuffing:
+          header += b"\x00" + b"\xFF" * (stuffing - 1)
+      packets.append(header + chunk)
+      first = False
+    return packets
+
+def ts_records(seed: int, corruption: float, stats: Dict) -> Iterator[bytes]:
+  rng = random.Random(seed + 2)
+  muxer = _TSMuxer()
+  for i, (packet, sample) in enumerate(zip(klv_records(seed, corruption, stats), flight(seed))):
+    out = []
+    if i % 30 == 0:
+      out += muxer.packets(0, _pat(), psi=True)
+      out += muxer.packets(_TS_PMT_PID, _pmt(), psi=True)
+    pts = int((sample[0] - START_TIME) * 90000) & ((1 << 33) - 1)
+    out += muxer.packets(_TS_VIDEO_PID, _pes(0xE0, _random_bytes(rng, rng.randrange(500, 4000)), pts))
+    # Synchronous metadata: a metadata AU cell before the KLV
+    cell = bytes([0, i & 0xFF, 0xDF]) + len(packet).to_bytes(2, "big") + packet
+    out += muxer.packets(_TS_KLV_PID, _pes(0xFC, cell, pts))
+    yield b"".join(out)
+
+def write_ts(out: BinaryIO, size: int, seed: int = 0, corruption: float = 0.0, **_) -> Dict:
+  stats = {}
+  stats["packets"] = _write_until(out, size, ts_records(seed, corruption, stats))
+  return stats
+
+# SRT
+
+def _srt_time(seconds: float) -> str:
+  ms = int(round(seconds * 1000))
+  return "{:02d}:{:02d}:{:02d},{:03d}".format(ms // 3600000, ms // 60000 % 60, ms // 1000 % 60, ms % 1000)
+
+def _srt_data(dialect: str, sample: Sample, home: Tuple[float, float], rng: random.Random) -> str:
+  t, lat, lon, alt, heading, pitch, roll, speed = sample
+  dt = _datetime(t)
+  if dialect == "labeled_comma":
+    return "F/2.8, SS {}, ISO {}, EV 0, GPS ({:.4f}, {:.4f}, 18), D {:.2f}m, H {:.2f}m, H.S {:.2f}m/s, V.S {:.2f}m/s\n".format(
+           rng.choice([120, 240, 320, 500]), rng.choice([100, 110, 200]), lon, lat,
+           rng.uniform(0, 500), alt, speed, rng.gauss(0, 0.5))
+  if dialect == "labeled":
+    return "HOME({:.4f},{:.4f}) {}\nGPS({:.4f},{:.4f},16) BAROMETER:{:.1f}\nISO:{} Shutter:{} EV: 0 Fnum:F2.8\n".format(
+           home[1], home[0], dt.strftime("%Y.%m.%d %H:%M:%S"), lon, lat, alt,
+           rng.choice([100, 110, 200]), rng.choice([60, 120, 240]))
+  if dialect == "labeled_latlon":
+    return "HOME({:.4f},{:.4f}) {}\nGPS({:.4f},{:.4f},{:.1f}M) BAROMETER:{:.1f}M\nISO:{} Shutter:{} EV: 0 Fnum:F2.8\n".format(
+           home[1], home[0], dt.strftime("%Y.%m.%d %H:%M:%S"), lat, lon, alt, alt,
+           rng.choice([100, 110, 200]), rng.choice([60, 120, 240]))
+  if dialect == "bracket":
+    return "{},{:03d},{:03d}\n[iso : {}] [shutter : 1/{}.0] [fnum : 280] [ev : 0.7] [ct : 5064] [color_md : default] " \
+           "[focal_len : 240] [latitude: {:.6f}] [longtitude: {:.6f}] [altitude: {:.6f}]\n".format(
+           dt.strftime("%Y-%m-%d %H:%M:%S"), dt.microsecond // 1000, dt.microsecond % 1000,
+           rng.choice([100, 110, 200]), rng.choice([100, 200, 400]), lat, lon, alt)
+  if dialect == "unlabeled":
+    return "{}\n{:.5f}, {:.5f}, {:.1f}m, {}°\n".format(dt.strftime("%b %d, %Y %I:%M:%S %p"), lat, lon, alt, int(heading))
+  raise ValueError("Unknown SRT dialect '{}'".format(dialect))
+
+def srt_records(seed: int, dialect: str) -> Iterator[bytes]:
+  rng = random.Random(seed + 3)
+  home = None
+  for i, sample in enumerate(flight(seed)):
+    if home is None:
+      home = (sample[1], sample[2])
+    begin = sample[0] - START_TIME
+    yield "{}\n{} --> {}\n{}\n".format(i + 1, _srt_time(begin), _srt_time(begin + 1 / 30),
+                                       _srt_data(dialect, sample, home, rng)).encode("utf-8")
+
+def write_srt(out: BinaryIO, size: int, seed: int = 0, srt_dialect: str = "bracket", **_) -> Dict:
+  return {"packets" : _write_until(out, size, srt_records(seed, srt_dialect))}
+
+# ASS
+
+_ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: 384
+PlayResY: 288
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,16,&Hffffff,&Hffffff,&H0,&H0,0,0,0,0,100,100,0,0,1,1,0,2,10,10,10,0
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+def _ass_time(seconds: float) -> str:
+  cs = int(round(seconds * 100))
+  return "{}:{:02d}:{:02d}.{:02d}".format(cs // 360000, cs // 6000 % 60, cs // 100 % 60, cs % 100)
+
+def _ass_coord(value: float, positive: str, negative: str) -> str:
+  return "{}: {:.6f}".format(positive if value >= 0 else negative, abs(value))
+
+def ass_records(seed: int) -> Iterator[bytes]:
+  rng = random.Random(seed + 4)
+  yield _ASS_HEADER.encode("utf-8")
+  home = None
+  for sample in flight(seed):
+    t, lat, lon, alt = sample[:4]
+    if home is None:
+      home = (lat, lon)
+    begin = t - START_TIME
+    text = "HOME({}, {}) {}\\NGPS({}, {}, {}) \\NISO:{} SHUTTER:{} EV:0.0 F-NUM:2.8".format(
+           _ass_coord(home[1], "E", "W"), _ass_coord(home[0], "N", "S"),
+           _datetime(t).strftime("%Y-%m-%d %H:%M:%S"),
+           _ass_coord(lon, "E", "W"), _ass_coord(lat, "N", "S"), int(alt),
+           rng.choice([100, 105, 200]), rng.choice([250, 500, 1000]))
+    yield "Dialogue: 0,{},{},Default,,0,0,0,,{}\n".format(_ass_time(begin), _ass_time(begin + 1 / 30), text).encode("utf-8")
+
+def write_ass(out: BinaryIO, size: int, seed: int = 0, **_) -> Dict:
+  return {"packets" : _write_until(out, size, ass_records(seed)) - 1}
+
+# CSV
+
+def csv_records(seed: int) -> Iterator[bytes]:
+  yield b"timestamp,latitude,longitude,altitude,speed,heading,pitch\n"
+  for t, lat, lon, alt, heading, pitch, _, speed in flight(seed):
+    yield "{:.3f},{:.7f},{:.7f},{:.2f},{:.2f},{:.2f},{:.2f}\n".format(t, lat, lon, alt, speed, heading, pitch).encode("utf-8")
+
+def write_csv(out: BinaryIO, size: int, seed: int = 0, **_) -> Dict:
+  return {"packets" : _write_until(out, size, csv_records(seed)) - 1}
+
+# GPX and KML. The closing tags are written after size is reached so the
+# documents stay well formed.
+
+_GPX_HEADER = b"""<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="OTK corpus" xmlns="http://www.topografix.com/GPX/1/1">
+<trk><name>OTK corpus</name><trkseg>
+"""
+_GPX_FOOTER = b"</trkseg></trk>\n</gpx>\n"
+
+def gpx_records(seed: int) -> Iterator[bytes]:
+  for t, lat, lon, alt, _, _, _, speed in flight(seed):
+    yield "<trkpt lat=\"{:.7f}\" lon=\"{:.7f}\"><ele>{:.2f}</ele><time>{}</time><speed>{:.2f}</speed></trkpt>\n".format(
+          lat, lon, alt, _datetime(t).strftime("%Y-%m-%dT%H:%M:%S.%fZ"), speed).encode("utf-8")
+
+def write_gpx(out: BinaryIO, size: int, seed: int = 0, **_) -> Dict:
+  out.write(_GPX_HEADER)
+  count = _write_until(out, size - len(_GPX_HEADER) - len(_GPX_FOOTER), gpx_records(seed))
+  out.write(_GPX_FOOTER)
+  return {"packets" : count}
+
+_KML_HEADER = b"""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">
+<Document><name>OTK corpus</name><Placemark><gx:Track>
+"""
+_KML_FOOTER = b"</gx:Track></Placemark></Document>\n</kml>\n"
+
+def kml_records(seed: int) -> Iterator[bytes]:
+  for t, lat, lon, alt in (sample[:4] for sample in flight(seed)):
+    yield "<when>{}</when><gx:coord>{:.7f} {:.7f} {:.2f}</gx:coord>\n".format(
+          _datetime(t).strftime("%Y-%m-%dT%H:%M:%S.%fZ"), lon, lat, alt).encode("utf-8")
+
+def write_kml(out: BinaryIO, size: int, seed: int = 0, **_) -> Dict:
+  out.write(_KML_HEADER)
+  count = _write_until(out, size - len(_KML_HEADER) - len(_KML_FOOTER), kml_records(seed))
+  out.write(_KML_FOOTER)
+  return {"packets" : count}
+
+# BlackVue MP4: ftyp, then a free box holding a 'gps ' box of
+# "[milliseconds]$GPxxx,..." lines, then mdat
+
+def _nmea(sentence: str) -> str:
+  checksum = 0
+  for c in sentence:
+    checksum ^= ord(c)
+  return "${}*{:02X}".format(sentence, checksum)
+
+def _nmea_coord(value: float, positive: str, negative: str, degree_digits: int) -> str:
+  degrees = int(abs(value))
+  minutes = (abs(value) - degrees) * 60
+  return "{:0{}d}{:07.4f},{}".format(degrees, degree_digits, minutes, positive if value >= 0 else negative)
+
+def blackvue_records(seed: int) -> Iterator[bytes]:
+  for t, lat, lon, alt, heading, _, _, speed in flight(seed, rate=1.0):
+    ms = int(t * 1000)
+    hhmmss = _datetime(t).strftime("%H%M%S.00")
+    gga = _nmea("GPGGA,{},{},{},1,08,0.9,{:.1f},M,46.9,M,,".format(
+                hhmmss, _nmea_coord(lat, "N", "S", 2), _nmea_coord(lon, "E", "W", 3), alt))
+    vtg = _nmea("GPVTG,{:.1f},T,,M,{:.1f},N,{:.1f},K".format(heading, speed * 1.943844, speed * 3.6))
+    yield "[{}]{}\n[{}]{}\n".format(ms, gga, ms, vtg).encode("ascii")
+
+def _box_header(box_type: bytes, data_len: int) -> bytes:
+  return struct.pack(">I", 8 + data_len) + box_type
+
+def write_blackvue(out: BinaryIO, size: int, seed: int = 0, **_) -> Dict:
+  size = min(size, 2**32 - 64)
+  ftyp = b"isom\x00\x00\x02\x00isomiso2mp41"
+  out.write(_box_header(b"ftyp", len(ftyp)) + ftyp)
+  # Box sizes come first, so write placeholders and fill them in afterwards
+  free_start = out.tell()
+  out.write(_box_header(b"free", 0) + _box_header(b"gps ", 0))
+  count = _write_until(out, size - 64, blackvue_records(seed))
+  end = out.tell()
+  out.seek(free_start)
+  out.write(_box_header(b"free", end - free_start - 8) + _box_header(b"gps ", end - free_start - 16))
+  out.seek(end)
+  out.write(_box_header(b"mdat", 0))
+  return {"packets" : count}
+
+FORMATS = {"klv" : (".klv", write_klv),
+           "ts" : (".ts", write_ts),
+           "srt" : (".srt", write_srt),
+           "ass" : (".ass", write_ass),
+           "csv" : (".csv", write_csv),
+           "gpx" : (".gpx", write_gpx),
+           "kml" : (".kml", write_kml),
+           "blackvue" : (".mp4", write_blackvue)}
+
+# Writes roughly size bytes of fmt telemetry to path. Returns the number of
+# packets written (and of each injected corruption, for klv and ts).
+def generate(fmt: str, path: str, size: int, seed: int = 0, **options) -> Dict:
+  _, writer = FORMATS[fmt]
+  with open(path, 'wb') as out:
+    stats = writer(out, size, seed=seed, **options)
+  stats["bytes"] = os.path.getsize(path)
+  return stats
+
+def parse_size(size: str) -> int:
+  units = {"K" : 1 << 10, "M" : 1 << 20, "G" : 1 << 30}
+  size = size.strip().upper().rstrip("B")
+  if size and size[-1] in units:
+    return int(float(size[:-1]) * units[size[-1]])
+  return int(size)
+
+def main():
+  arg_parser = argparse.ArgumentParser(description="Generate synthetic telemetry files")
+  arg_parser.add_argument("out_dir")
+  arg_parser.add_argument("--size", default="64M", help="size of each file, e.g. 512K, 64M, 4G")
+  arg_parser.add_argument("--seed", type=int, default=0)
+  arg_parser.add_argument("--formats", default=",".join(FORMATS), help="comma separated subset of " + ", ".join(FORMATS))
+  arg_parser.add_argument("--srt-dialect", default="all", choices=SRT_DIALECTS + ["all"])
+  arg_parser.add_argument("--corruption", type=float, default=0.0, help="fraction of KLV packets to corrupt")
+  args = arg_parser.parse_args()
+
+  os.makedirs(args.out_dir, exist_ok=True)
+  size = parse_size(args.size)
+  for fmt in args.formats.split(","):
+    ext, _ = FORMATS[fmt]
+    dialects = [None]
+    if fmt == "srt":
+      dialects = SRT_DIALECTS if args.srt_dialect == "all" else [args.srt_dialect]
+    for dialect in dialects:
+      name = "corpus_{}{}".format(fmt if dialect is None else "srt_" + dialect, ext)
+      path = os.path.join(args.out_dir, name)
+      stats = generate(fmt, path, size, seed=args.seed, corruption=args.corruption, srt_dialect=dialect)
+      print("{:<28} {:>12} bytes {:>10} packets {}".format(
+            name, stats.pop("bytes"), stats.pop("packets"), stats if stats else ""))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+# Compares the legacy BytesIO based KLV decoder (KLVParser._parse) against the
+# memoryview based decoder used by KLVParser.read() (KLVParser._decode), with
+# and without layout templates, and reports the cost of checksum validation.
+#
+# Usage: python3 benchmarks/klv_decode.py [num_packets] [repeats]
+
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+from io import BytesIO
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from open_telemetry_kit.klv_common import misb_checksum
+from open_telemetry_kit.klvparser import KLVParser
+from open_telemetry_kit.vmti import VMTITargets, pixel_to_row_col
+from open_telemetry_kit.writers import telemetryToJsonStream
+
+import corpus
+
+MISB_KEY = bytes.fromhex("06 0E 2B 34 02 0B 01 01 0E 01 03 01 01 00 00 00")
+
+def ber_len(length: int) -> bytes:
+  if length < 128:
+    return bytes([length])
+  num_bytes = (length.bit_length() + 7) // 8
+  return bytes([128 + num_bytes]) + length.to_bytes(num_bytes, byteorder="big")
+
+def element(tag: int, value: bytes) -> bytes:
+  return bytes([tag]) + ber_len(len(value)) + value
+
+def make_packet(rng: random.Random, timestamp: int) -> bytes:
+  body = element(2, timestamp.to_bytes(8, byteorder="big"))
+  body += element(3, b"BENCHMARK")
+  body += element(5, rng.getrandbits(16).to_bytes(2, byteorder="big"))
+  body += element(6, rng.getrandbits(15).to_bytes(2, byteorder="big"))
+  body += element(7, rng.getrandbits(15).to_bytes(2, byteorder="big"))
+  body += element(10, b"OTK Platform")
+  body += element(13, rng.getrandbits(31).to_bytes(4, byteorder="big"))
+  body += element(14, rng.getrandbits(31).to_bytes(4, byteorder="big"))
+  body += element(15, rng.getrandbits(16).to_bytes(2, byteorder="big"))
+  body += element(16, rng.getrandbits(16).to_bytes(2, byteorder="big"))
+  body += element(17, rng.getrandbits(16).to_bytes(2, byteorder="big"))
+  body += element(18, rng.getrandbits(32).to_bytes(4, byteorder="big"))
+  body += element(19, rng.getrandbits(31).to_bytes(4, byteorder="big"))
+  body += element(21, rng.getrandbits(32).to_bytes(4, byteorder="big"))
+  body += element(23, rng.getrandbits(31).to_bytes(4, byteorder="big"))
+  body += element(24, rng.getrandbits(31).to_bytes(4, byteorder="big"))
+  return misb_packet(body)
+
+# Wraps body, which must not include the checksum element, into a packet
+def misb_packet(body: bytes) -> bytes:
+  body += element(1, bytes(2))
+  packet = bytearray(MISB_KEY + ber_len(len(body)) + body)
+  checksum = misb_checksum(memoryview(packet), 0, len(packet) - 2)
+  packet[-2:] = checksum.to_bytes(2, byteorder="big")
+  return bytes(packet)
+
+def make_stream(num_packets: int, seed: int = 0) -> bytes:
+  rng = random.Random(seed)
+  start = 1600000000000000
+  return b"".join(make_packet(rng, start + i * 33333) for i in range(num_packets))
+
+# read_columns() must give one row per packet read() returns, sharded or not,
+# including empty packets (a key followed by a zero length) which have no
+# timestamp to template on
+def check_columns(klv: bytes) -> bool:
+  try:
+    import numpy
+  except ImportError:
+    return True
+
+  # Every packet make_stream() generates has the same size
+  packet_size = len(make_packet(random.Random(0), 0))
+  half = packet_size * (len(klv) // packet_size // 2)
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    path = os.path.join(tmp_dir, "columns.klv")
+    with open(path, 'wb') as klv_file:
+      klv_file.write(klv[:half] + MISB_KEY + b"\x00" + klv[half:])
+    num_packets = len(KLVParser(path).read())
+    for workers in (1, 2):
+      columns = KLVParser(path, workers=workers).read_columns()
+      if any(len(column) != num_packets for column in columns.values()):
+        return False
+  return True
+
+# A value that fails to decode (a code missing from Sensor Control Mode's
+# _code) must only cost its own packet. Lazy packets are only decoded on
+# access so lazy mode keeps it.
+def check_undecodable_value() -> bool:
+  body = element(2, (1600000000000000).to_bytes(8, byteorder="big"))
+  klv = misb_packet(body + element(126, bytes([99]))) + misb_packet(body + element(126, bytes([3])))
+  tel = KLVParser("benchmark")._decode(klv)
+  lazy_tel = KLVParser("benchmark", lazy=True)._decode(klv)
+  return len(tel) == 1 and tel[0]["Sensor Control Mode"].value == "Manual Control" and len(lazy_tel) == 2
+
+# read_columns() must give the values read() does, including for elements
+# that don't decode to a plain number (Sensor Control Mode is an enumeration)
+# and numeric values longer than 8 bytes, which don't fit in an int64. Each
+# packet is repeated so the template path is covered too.
+def check_column_values() -> bool:
+  try:
+    import numpy
+  except ImportError:
+    return True
+
+  packets = []
+  for i in range(3):
+    body = element(2, (1600000000000000 + i).to_bytes(8, byteorder="big"))
+    packets.append(misb_packet(body + element(13, (1 << 40).to_bytes(9, byteorder="big")) + element(126, bytes([3]))))
+    packets.append(misb_packet(body + element(126, bytes([5]))))
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    path = os.path.join(tmp_dir, "values.klv")
+    with open(path, 'wb') as klv_file:
+      klv_file.write(b"".join(packets))
+    tel = KLVParser(path).read()
+    columns = KLVParser(path).read_columns()
+  for key, column in columns.items():
+    for row, packet in enumerate(tel):
+      value = packet[key].value if key in packet else None
+      if value is None:
+        if not (column[row] is None or column[row] != column[row]):
+          return False
+      elif column[row] != value:
+        return False
+  return True
+
+# A string element holding invalid UTF-8 must not cost the packet
+def check_corrupted_string() -> bool:
+  klv = make_packet(random.Random(0), 1600000000000000).replace(b"BENCHMARK", b"BENCH\xff\xfeRK")
+  tel = KLVParser("benchmark")._decode(klv)
+  return len(tel) == 1 and tel[0]["Mission ID"].value == "BENCH\ufffd\ufffdRK"
+
+# Every POI of an RVT local set must be kept, not only the last one
+def check_repeated_poi() -> bool:
+  pois = [element(1, bytes([number])) + element(8, label) for number, label in [(1, b"Bridge"), (2, b"Tower")]]
+  timestamp = element(2, (1600000000000000).to_bytes(8, byteorder="big"))
+  rvt = timestamp + b"".join(element(12, poi) for poi in pois)
+  tel = KLVParser("benchmark")._decode(misb_packet(timestamp + element(73, rvt)))
+  if len(tel) != 1:
+    return False
+  found = tel[0]["RVT Local Set"].value["Point of Interest Local Set"]
+  return [(poi["POI/AOI Number"], poi["POI/AOI Label"]) for poi in found] == [(1, "Bridge"), (2, "Tower")]
+
+# read_range() on a transport stream must give the packets, pts included,
+# that read() does, and must demux the stream only once for all its calls
+def check_ts_range() -> bool:
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    path = os.path.join(tmp_dir, "range.ts")
+    with open(path, 'wb') as ts_file:
+      corpus.write_ts(ts_file, 1 << 20)
+    tel = KLVParser(path).read()
+    parser = KLVParser(path)
+    parser.load_index()
+    extracted = parser._extracted
+    windows = [(tel[i]["Precision Time Stamp"].value, tel[i + 9]["Precision Time Stamp"].value) for i in (0, 100)]
+    for window, expected in zip(windows, [tel[0:10], tel[100:110]]):
+      found = parser.read_range(*window)
+      if [(packet.metadata["pts"], packet["Precision Time Stamp"].value) for packet in found] != \
+         [(packet.metadata["pts"], packet["Precision Time Stamp"].value) for packet in expected]:
+        return False
+  return parser._extracted is extracted
+
+# VTarget packs that give their centroid as a row and column instead of a
+# pixel number (tag 1) must get the same centroid
+def check_vmti_centroid() -> bool:
+  timestamp = element(2, (1600000000000000).to_bytes(8, byteorder="big"))
+  packs = [bytes([1]) + element(1, (2 * 1280 + 5).to_bytes(3, byteorder="big")),
+           bytes([2]) + element(19, bytes([3])) + element(20, bytes([5])),
+           bytes([3]) + element(19, bytes([3]))]
+  vmti = element(8, (1280).to_bytes(2, byteorder="big")) + element(101, b"".join(ber_len(len(pack)) + pack for pack in packs))
+  targets = VMTITargets.fromTelemetry(KLVParser("benchmark")._decode(misb_packet(timestamp + element(74, vmti))))
+  return list(targets.columns["centroid"]) == [2 * 1280 + 5] * 2 + [0] and \
+         pixel_to_row_col(targets.columns["centroid"][1], 1280) == (2, 4)
+
+# The garbage collector is off while timing, like timeit does. Otherwise the
+# telemetry kept from earlier runs makes every collection slower, and each
+# decoder is slowed down by the ones measured before it.
+def timed(fn):
+  gc.collect()
+  gc.disable()
+  try:
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+  finally:
+    gc.enable()
+
+# Best time and last result of each of fns. The runs are interleaved so
+# their times can be compared on a machine whose speed drifts.
+def best_of_each(repeats: int, *fns) -> List[Tuple[float, object]]:
+  times = [None] * len(fns)
+  results = [None] * len(fns)
+  for _ in range(repeats):
+    for i, fn in enumerate(fns):
+      # Free the previous run's telemetry before timing the next one
+      results[i] = None
+      elapsed, results[i] = timed(fn)
+      if times[i] is None or elapsed < times[i]:
+        times[i] = elapsed
+  return list(zip(times, results))
+
+def best_of(repeats: int, fn):
+  return best_of_each(repeats, fn)[0]
+
+def main():
+  num_packets = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+  repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+  klv = make_stream(num_packets)
+  parser = KLVParser("benchmark")
+
+  def legacy():
+    parser.klv_stream = BytesIO(klv)
+    return parser._parse()
+
+  legacy_time, legacy_tel = best_of(repeats, legacy)
+  generic_parser = KLVParser("benchmark", use_templates=False)
+  decode_time, decode_tel = best_of(repeats, lambda: generic_parser._decode(klv))
+  checksum_parser = KLVParser("benchmark", validate_checksum=True)
+  # The checksum costs a few percent, less than the machine's drift between
+  # separate runs, so it is measured against interleaved template runs
+  (template_time, template_tel), (checksum_time, checksum_tel) = best_of_each(
+    repeats, lambda: parser._decode(klv), lambda: checksum_parser._decode(klv))
+
+  legacy_json = telemetryToJsonStream(legacy_tel)
+  if legacy_json != telemetryToJsonStream(decode_tel) or legacy_json != telemetryToJsonStream(template_tel):
+    print("ERROR: decoders produced different telemetry")
+    sys.exit(1)
+  if not all(packet.metadata["checksum_valid"] for packet in checksum_tel):
+    print("ERROR: checksum validation failed on a valid stream")
+    sys.exit(1)
+  if not check_corrupted_string():
+    print("ERROR: a corrupted string element failed its packet")
+    sys.exit(1)
+  if not check_columns(klv):
+    print("ERROR: read_columns() and read() disagree on the number of packets")
+    sys.exit(1)
+  if not check_undecodable_value():
+    print("ERROR: a value that fails to decode failed more than its packet")
+    sys.exit(1)
+  if not check_column_values():
+    print("ERROR: read_columns() and read() disagree on element values")
+    sys.exit(1)
+  if not check_ts_range():
+    print("ERROR: read_range() and read() disagree on a transport stream")
+    sys.exit(1)
+  if not check_vmti_centroid():
+    print("ERROR: a VTarget centroid given as a row and column was lost")
+    sys.exit(1)
+  if not check_repeated_poi():
+    print("ERROR: a repeated POI local set was dropped")
+    sys.exit(1)
+
+  mb = len(klv) / 1e6
+  print("{} packets, {:.2f} MB, best of {}".format(num_packets, mb, repeats))
+  for label, elapsed in [("BytesIO (_parse)", legacy_time),
+                         ("memoryview (_decode)", decode_time),
+                         ("memoryview + templates", template_time),
+                         ("templates + checksum", checksum_time)]:
+    print("{:<22} {:8.3f} s {:10.0f} packets/s {:8.2f} MB/s".format(
+          label, elapsed, num_packets / elapsed, mb / elapsed))
+  print("speedup: {:.2f}x, {:.2f}x with templates".format(legacy_time / decode_time, legacy_time / template_time))
+  print("checksum overhead: {:.1f}%".format(100 * (checksum_time - template_time) / template_time))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+# Throughput and memory benchmarks of OTK's parsers and writers over the
+# synthetic corpus of benchmarks/corpus.py.
+#
+# Each case runs in a fresh process so its peak RSS isn't inflated by the
+# cases before it. Parser cases time Parser.read() on a corpus file; writer
+# cases parse the KLV corpus first and time only the writer (their peak RSS
+# includes the parsed telemetry). Times are the best of --repeats runs.
+#
+# Results are written as JSON:
+#
+#   {"meta" : {"python" : ..., "platform" : ..., "size" : ..., "seed" : ..., ...},
+#    "results" : {"csv" : {"packets" : ..., "bytes" : ..., "seconds" : ...,
+#                          "packets_per_s" : ..., "mb_per_s" : ..., "peak_rss_mb" : ...},
+#                 ...}}
+#
+# With --baseline each case is compared against a stored results file and any
+# case whose packets/s fell or whose peak RSS grew by more than --threshold is
+# reported as a regression (and the exit status is 1).
+#
+# Usage: python3 benchmarks/run.py [--size 16M] [--seed 0] [--repeats 3]
+#          [--cases csv,klv,...] [--corpus DIR] [--output results.json]
+#          [--baseline baseline.json] [--threshold 0.1]
+#        python3 benchmarks/run.py --compare results.json --baseline baseline.json
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import queue as queue_module
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import corpus
+
+# name: (corpus format, options, parser class name)
+PARSER_CASES = {"csv" : ("csv", {}, "CSVParser"),
+                "ass" : ("ass", {}, "ASSParser"),
+                "gpx" : ("gpx", {}, "GPXParser"),
+                "kml" : ("kml", {}, "KMLParser"),
+                "klv" : ("klv", {}, "KLVParser"),
+                "blackvue" : ("blackvue", {}, "BlackvueParser")}
+for _dialect in corpus.SRT_DIALECTS:
+  PARSER_CASES["srt_" + _dialect] = ("srt", {"srt_dialect" : _dialect}, "SRTParser")
+
+# name: writer function name. Writers are given the telemetry of the KLV corpus.
+WRITER_CASES = {"write_json" : "telemetryToJson",
+                "write_csv" : "telemetryToCSV"}
+
+CASES = list(PARSER_CASES) + list(WRITER_CASES)
+
+def best_of(repeats: int, fn):
+  best = None
+  result = None
+  for _ in range(repeats):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best, result
+
+def peak_rss_mb() -> float:
+  import resource
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Kilobytes on Linux, bytes on macOS
+  if sys.platform == "darwin":
+    return peak / 2**20
+  return peak / 2**10
+
+def corpus_path(corpus_dir: str, fmt: str, options: dict) -> str:
+  ext, _ = corpus.FORMATS[fmt]
+  name = fmt if "srt_dialect" not in options else "srt_" + options["srt_dialect"]
+  return os.path.join(corpus_dir, "corpus_{}{}".format(name, ext))
+
+# Generates the corpus files the cases need unless files of about the right
+# size already exist
+def prepare_corpus(corpus_dir: str, cases: list, size: int, seed: int):
+  needed = set()
+  for case in cases:
+    if case in PARSER_CASES:
+      fmt, options, _ = PARSER_CASES[case]
+    else:
+      fmt, options, _ = PARSER_CASES["klv"]
+    needed.add((fmt, tuple(sorted(options.items()))))
+
+  for fmt, options in sorted(needed):
+    options = dict(options)
+    path = corpus_path(corpus_dir, fmt, options)
+    if not os.path.exists(path) or abs(os.path.getsize(path) - size) > 1 << 16:
+      print("Generating {}".format(os.path.basename(path)))
+      corpus.generate(fmt, path, size, seed=seed, **options)
+
+# Runs in its own process; puts the case's result on queue
+def run_case(case: str, corpus_dir: str, repeats: int, queue):
+  logging.disable(logging.WARNING)
+  import open_telemetry_kit
+  from open_telemetry_kit import writers
+
+  if case in PARSER_CASES:
+    fmt, options, parser_name = PARSER_CASES[case]
+    path = corpus_path(corpus_dir, fmt, options)
+    parser_cls = getattr(open_telemetry_kit, parser_name)
+    seconds, tel = best_of(repeats, lambda: parser_cls(path).read())
+    num_bytes = os.path.getsize(path)
+  else:
+    fmt, options, _ = PARSER_CASES["klv"]
+    tel = open_telemetry_kit.KLVParser(corpus_path(corpus_dir, fmt, options)).read()
+    writer = getattr(writers, WRITER_CASES[case])
+    out_path = os.path.join(corpus_dir, "output_" + case)
+    seconds, _ = best_of(repeats, lambda: writer(tel, out_path))
+    num_bytes = os.path.getsize(out_path)
+    os.remove(out_path)
+
+  queue.put({"packets" : len(tel),
+             "bytes" : num_bytes,
+             "seconds" : seconds,
+             "packets_per_s" : len(tel) / seconds,
+             "mb_per_s" : num_bytes / 1e6 / seconds,
+             "peak_rss_mb" : peak_rss_mb()})
+
+def run(cases: list, corpus_dir: str, repeats: int) -> dict:
+  context = multiprocessing.get_context("spawn")
+  results = {}
+  for case in cases:
+    queue = context.Queue()
+    process = context.Process(target=run_case, args=(case, corpus_dir, repeats, queue))
+    process.start()
+    result = None
+    while result is None:
+      try:
+        result = queue.get(timeout=1)
+      except queue_module.Empty:
+        if not process.is_alive():
+          break
+    process.join()
+    if result is None:
+      print("{:<22} failed (exit code {})".format(case, process.exitcode))
+      continue
+    results[case] = result
+    print("{:<22} {:8.3f} s {:12.0f} packets/s {:8.2f} MB/s {:8.1f} MB peak RSS".format(
+          case, result["seconds"], result["packets_per_s"], result["mb_per_s"], result["peak_rss_mb"]))
+  return results
+
+# Returns the cases that regressed against baseline by more than threshold
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+  regressions = []
+  print("{:<22} {:>14} {:>14}".format("", "packets/s", "peak RSS"))
+  for case, result in results["results"].items():
+    if case not in baseline["results"]:
+      continue
+    base = baseline["results"][case]
+    speed = result["packets_per_s"] / base["packets_per_s"] - 1
+    memory = result["peak_rss_mb"] / base["peak_rss_mb"] - 1
+    flags = []
+    if speed < -threshold:
+      flags.append("slower")
+    if memory > threshold:
+      flags.append("more memory")
+    print("{:<22} {:>+13.1f}% {:>+13.1f}%  {}".format(case, 100 * speed, 100 * memory, ", ".join(flags)))
+    if flags:
+      regressions.append(case)
+  return regressions
+
+def main():
+  arg_parser = argparse.ArgumentParser(description="Benchmark OTK's parsers and writers")
+  arg_parser.add_argument("--size", default="16M", help="size of each corpus file, e.g. 512K, 64M, 4G")
+  arg_parser.add_argument("--seed", type=int, default=0)
+  arg_parser.add_argument("--repeats", type=int, default=3)
+  arg_parser.add_argument("--cases", default=",".join(CASES), help="comma separated subset of " + ", ".join(CASES))
+  arg_parser.add_argument("--corpus", help="directory of corpus files, reused between runs (default: a temporary directory)")
+  arg_parser.add_argument("--output", default="benchmark_results.json")
+  arg_parser.add_argument("--baseline", help="results file to compare against")
+  arg_parser.add_argument("--threshold", type=float, default=0.1, help="relative change reported as a regression")
+  arg_parser.add_argument("--compare", help="compare this results file against --baseline instead of running")
+  args = arg_parser.parse_args()
+
+  if args.compare:
+    if not args.baseline:
+      arg_parser.error("--compare needs --baseline")
+    with open(args.compare) as results_file:
+      results = json.load(results_file)
+  else:
+    cases = args.cases.split(",")
+    for case in cases:
+      if case not in CASES:
+        arg_parser.error("unknown case '{}'".format(case))
+
+    size = corpus.parse_size(args.size)
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="otk_corpus_")
+    os.makedirs(corpus_dir, exist_ok=True)
+    try:
+      prepare_corpus(corpus_dir, cases, size, args.seed)
+      results = {"meta" : {"python" : platform.python_version(),
+                           "platform" : platform.platform(),
+                           "size" : size,
+                           "seed" : args.seed,
+                           "repeats" : args.repeats,
+                           "time" : time.strftime("%Y-%m-%dT%H:%M:%S")},
+                 "results" : run(cases, corpus_dir, args.repeats)}
+    finally:
+      if not args.corpus:
+        shutil.rmtree(corpus_dir)
+
+    with open(args.output, 'w') as results_file:
+      json.dump(results, results_file, indent=2)
+    print("Results written to {}".format(args.output))
+
+  if args.baseline:
+    with open(args.baseline) as baseline_file:
+      baseline = json.load(baseline_file)
+    if baseline["meta"].get("size") != results["meta"].get("size"):
+      print("WARNING: baseline was run with a different corpus size")
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+      print("Regressions: {}".format(", ".join(regressions)))
+      sys.exit(1)
+
+if __name__ == "__main__":
+  main()
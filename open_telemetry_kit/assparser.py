@@ -11,7 +11,7 @@ from datetime import timedelta
 from dateutil import parser as dup
 import re
 import os
-from typing import Dict
+from typing import Dict, Iterable, Set, Tuple, Union
 import logging
 
 class ASSParser(Parser):
@@ -20,20 +20,24 @@ class ASSParser(Parser):
   def __init__(self,
                source: str, 
                is_embedded: bool = False, 
-               convert_to_epoch: bool = False):
+               convert_to_epoch: bool = False,
+               detection: detector.Detection = None):
     super().__init__(source, 
-                     convert_to_epoch = convert_to_epoch)
+                     convert_to_epoch = convert_to_epoch,
+                     detection = detection)
     self.is_embedded = is_embedded
     self.beg_timestamp = 0
     self.convert_to_epoch = convert_to_epoch
     self.logger = logging.getLogger("OTK.ASSParser")
 
-  def read(self) -> Telemetry:
+  def read(self, fields: Set[str] = None) -> Telemetry:
+    self.fields = fields
     tel = Telemetry()
 
     _, _, ext = detector.split_path(self.source)
     if self.is_embedded and ext != ".ass":
-      ass = detector.read_embedded_subtitles(self.source, "ass")
+      stream_index = self.detection.stream_index if self.detection is not None else None
+      ass = detector.read_embedded_subtitles(self.source, "ass", stream_index)
       self._process(ass.splitlines(True), tel)
 
     else:
@@ -45,6 +49,20 @@ class ASSParser(Parser):
 
     return tel
 
+  # ass is the subtitles as a string or an iterable of lines (e.g. a text
+  # file)
+  def read_buffer(self, ass: Union[str, Iterable[str]], fields: Set[str] = None) -> Telemetry:
+    self.fields = fields
+    tel = Telemetry()
+    if isinstance(ass, str):
+      ass = ass.splitlines(True)
+    self._process(ass, tel)
+
+    if len(tel) == 0:
+      self.logger.warn("No telemetry was found. Returning empty Telemetry()")
+
+    return tel
+
   def _process(self, srt: str, tel: Telemetry):
     for line in srt:
       if "Dialogue" in line:
@@ -57,17 +75,25 @@ class ASSParser(Parser):
   def _parseLine(self, line: str, packet: Dict[str, Element]):
     line = line.replace("Dialogue: ", "")
     elements = line.split(',', maxsplit=9)
-    tfb = (dup.parse(elements[1]) - dup.parse("00:00:00")).total_seconds()
-    packet[TimeframeBeginElement.name] = TimeframeBeginElement(tfb)
-    tfe = (dup.parse(elements[2]) - dup.parse("00:00:00")).total_seconds()
-    packet[TimeframeEndElement.name] = TimeframeEndElement(tfe)
-    data = self._extractDatetime(elements[-1], packet)
+    timeframe = None
+    want_tfb = self._wants(TimeframeBeginElement.name)
+    want_tfe = self._wants(TimeframeEndElement.name)
+    # Other than being stored the timeframe is only used to estimate missing timestamps
+    if want_tfb or want_tfe or self.require_timestamp:
+      tfb = (dup.parse(elements[1]) - dup.parse("00:00:00")).total_seconds()
+      if want_tfb:
+        packet[TimeframeBeginElement.name] = TimeframeBeginElement(tfb)
+      tfe = (dup.parse(elements[2]) - dup.parse("00:00:00")).total_seconds()
+      if want_tfe:
+        packet[TimeframeEndElement.name] = TimeframeEndElement(tfe)
+      timeframe = (tfb, tfe)
+    data = self._extractDatetime(elements[-1], packet, timeframe)
     self._extractData(data, packet)
 
   # Example datetimes
   # 2019-09-25 01:22:35,118,697
   # Jun 19, 2019 4:47:39 PM
-  def _extractDatetime(self, data: str, packet: Dict[str, Element]):
+  def _extractDatetime(self, data: str, packet: Dict[str, Element], timeframe: Tuple[float, float]):
     # This should find any reasonably formatted (and some not so reasonably formatted) datetimes
     # Looks for:
     # 1+ alphanum, [space, tab, '/', '-',  or .'], 1+ digits, [space, tab, '/', '-',  or .']       Date 
@@ -87,10 +113,11 @@ class ASSParser(Parser):
         dt = dt[:dt.rfind(micro_syn)] + dt[dt.rfind(micro_syn)+1:]
       
       if (self.convert_to_epoch):
-        self.logger.debug("Converting datetime to epoch")
-        dt = dup.parse(dt).timestamp()
-        packet[TimestampElement.name] = TimestampElement(dt)
-      else:
+        if self._wants(TimestampElement.name):
+          self.logger.debug("Converting datetime to epoch")
+          dt = dup.parse(dt).timestamp()
+          packet[TimestampElement.name] = TimestampElement(dt)
+      elif self._wants(DatetimeElement.name):
         packet[DatetimeElement.name] = DatetimeElement(dt)
 
       return data[0 : match.start()] + data[match.end():]
@@ -98,10 +125,10 @@ class ASSParser(Parser):
     elif self.require_timestamp:
       if self.beg_timestamp != 0:
         self.logger.info("No datetime was found. Using timeframe and video creation time to estimate timestamp")
-        tfb = packet[TimeframeBeginElement.name].value
-        tfe = packet[TimeframeEndElement.name].value
+        tfb, tfe = timeframe
         avg = (tfb+tfe) / 2
-        packet[TimestampElement.name] = TimestampElement(self.beg_timestamp + avg)
+        if self._wants(TimestampElement.name):
+          packet[TimestampElement.name] = TimestampElement(self.beg_timestamp + avg)
 
       else:
         self.logger.critical("Could not find any time elements when require_timestamp was set")
@@ -137,16 +164,16 @@ class ASSParser(Parser):
         try:
           val = match[0]
           if label in self.element_dict:
-            packet[self.element_dict[label].name] = self.element_dict[label](val)
-          else:
+            if self._wants(self.element_dict[label].name):
+              packet[self.element_dict[label].name] = self.element_dict[label](val)
+          elif self._wants(label):
             self.logger.warn("Adding unknown element ({} : {})".format(label, val))
             packet[label] = UnknownElement(val)
         except:
           self.logger.info("Could not find valid value for '{}' element".format(label))
 
-    if LatitudeElement.name not in packet or  \
-       LongitudeElement.name not in packet or \
-       AltitudeElement.name not in packet:
+    if any(self._wants(name) and name not in packet
+           for name in (LatitudeElement.name, LongitudeElement.name, AltitudeElement.name)):
       self.logger.warn("No or only partial GPS data found")
 
         
@@ -166,27 +193,21 @@ class ASSParser(Parser):
       self.logger.error("Could not find GPS coordinates where expected")
 
     if label == "GPS":
-      packet[LongitudeElement.name] = LongitudeElement( numeric.search(coords[0])[0] )
-      if 'W' in coords[0]:
-        packet[LongitudeElement.name].value *= -1
-
-      packet[LatitudeElement.name] = LatitudeElement( numeric.search(coords[1])[0] )
-      if 'S' in coords[1]:
-        packet[LongitudeElement.name].value *= -1
-
-      if len(coords) == 3:
-        packet[AltitudeElement.name] = AltitudeElement(coords[2])
-
+      lat_cls, lon_cls, alt_cls = LatitudeElement, LongitudeElement, AltitudeElement
     else: #label == "HOME"
-      packet[HomeLongitudeElement.name] = HomeLongitudeElement(numeric.search(coords[0])[0])
+      lat_cls, lon_cls, alt_cls = HomeLatitudeElement, HomeLongitudeElement, HomeAltitudeElement
+
+    if self._wants(lon_cls.name):
+      packet[lon_cls.name] = lon_cls( numeric.search(coords[0])[0] )
       if 'W' in coords[0]:
-        packet[HomeLongitudeElement.name].value *= -1
+        packet[lon_cls.name].value *= -1
 
-      packet[HomeLatitudeElement.name] = HomeLatitudeElement(numeric.search(coords[1])[0])
+    if self._wants(lat_cls.name):
+      packet[lat_cls.name] = lat_cls( numeric.search(coords[1])[0] )
       if 'S' in coords[1]:
-        packet[HomeLongitudeElement.name].value *= -1
+        packet[lat_cls.name].value *= -1
 
-      if len(coords) == 3:
-        packet[HomeAltitudeElement.name] = HomeAltitudeElement(coords[2])
+    if len(coords) == 3 and self._wants(alt_cls.name):
+      packet[alt_cls.name] = alt_cls(coords[2])
 
     return gps_end
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+from . import detector
+from .detector import JSONType, find_klv_stream
+
+import asyncio
+import json
+import logging
+import os
+import signal
+from typing import AsyncIterator, List
+
+# asyncio counterparts of detector's ffprobe/ffmpeg helpers, for extracting
+# telemetry inside an event loop without blocking it:
+#
+#   metadata = await async_detector.read_video_metadata(src)
+#   klv = await async_detector.read_klv(src, metadata, timeout=60)
+#   async for chunk in async_detector.stream_klv(src, metadata):
+#     ...
+#
+# Commands are run with create_subprocess_exec (no shell, so paths need no
+# quoting) and share a ProcessPool that bounds how many ffmpeg and ffprobe
+# processes run at once; callers beyond the limit wait for a free slot.
+# Timeouts count from when the process starts (the wait for a slot is not
+# included); the process is killed and asyncio.TimeoutError raised when one
+# expires. Cancelling the awaiting task kills the process too.
+#
+# read_video_metadata shares detector's metadata cache.
+
+logger = logging.getLogger("OTK.async_detector")
+
+_POSIX = os.name == "posix"
+
+class ProcessPool():
+  def __init__(self, max_processes: int = 8):
+    self.max_processes = max_processes
+    # Created on first use so it belongs to the running event loop
+    self._semaphore = None
+    self._loop = None
+
+  def _slots(self) -> asyncio.Semaphore:
+    # get_event_loop() rather than get_running_loop(), which needs Python 3.7
+    loop = asyncio.get_event_loop()
+    if self._semaphore is None or self._loop is not loop:
+      self._semaphore = asyncio.Semaphore(self.max_processes)
+      self._loop = loop
+    return self._semaphore
+
+  # Returns the command's stdout. timeout bounds the whole run.
+  async def run(self, cmd: List[str], timeout: float = None) -> bytes:
+    async with self._slots():
+      proc = await asyncio.create_subprocess_exec(*cmd, stdin=asyncio.subprocess.DEVNULL,
+                                                  stdout=asyncio.subprocess.PIPE,
+                                                  stderr=asyncio.subprocess.DEVNULL,
+                                                  start_new_session=_POSIX)
+      try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout)
+      finally:
+        await _reap(proc)
+
+    if proc.returncode != 0:
+      logger.warn("{} exited with code {}".format(cmd[0], proc.returncode))
+    return stdout
+
+  # Yields the command's stdout in chunks of at most chunk_size bytes as soon
+  # as they are available. timeout bounds the wait for each chunk, so a
+  # stalled process is killed without limiting the length of the stream.
+  async def stream(self, cmd: List[str], chunk_size: int = 65536, timeout: float = None) -> AsyncIterator[bytes]:
+    async with self._slots():
+      proc = await asyncio.create_subprocess_exec(*cmd, stdin=asyncio.subprocess.DEVNULL,
+                                                  stdout=asyncio.subprocess.PIPE,
+                                                  stderr=asyncio.subprocess.DEVNULL,
+                                                  start_new_session=_POSIX)
+      try:
+        chunk = await asyncio.wait_for(proc.stdout.read(chunk_size), timeout)
+        while chunk:
+          yield chunk
+          chunk = await asyncio.wait_for(proc.stdout.read(chunk_size), timeout)
+      finally:
+        await _reap(proc)
+
+# Kills proc if it is still running and waits for it to exit. On POSIX the
+# whole process group goes, so wrapper scripts don't leave ffmpeg running
+# (and holding stdout open).
+async def _reap(proc):
+  if proc.returncode is None:
+    try:
+      if _POSIX:
+        os.killpg(proc.pid, signal.SIGKILL)
+      else:
+        proc.kill()
+    except ProcessLookupError:
+      pass
+  await proc.wait()
+
+_pool = ProcessPool()
+
+def get_process_pool() -> ProcessPool:
+  return _pool
+
+def set_process_pool(pool: ProcessPool):
+  global _pool
+  _pool = pool
+
+async def read_video_metadata(src: str, use_cache: bool = True, timeout: float = None) -> JSONType:
+  cache = detector.get_metadata_cache() if use_cache else None
+  stamp = None
+  if cache is not None:
+    metadata = cache.get(src)
+    if metadata is not None:
+      return metadata
+    # Taken before probing, as in MetadataCache.get_or_probe
+    stamp = cache.stamp(src)
+
+  cmd = ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", "-show_streams", src]
+  metadata = json.loads(await _pool.run(cmd, timeout))
+  if stamp is not None:
+    cache.put(src, metadata, stamp)
+  return metadata
+
+# stream_index selects the subtitle stream, by default ffmpeg's choice
+async def read_embedded_subtitles(src: str, file_format: str, stream_index: int = None,
+                                  timeout: float = None) -> str:
+  cmd = ["ffmpeg", "-loglevel", "quiet", "-y", "-i", src]
+  if stream_index is not None:
+    cmd += ["-map", "0:" + str(stream_index)]
+  cmd += ["-f", file_format, "-"]
+  subtitles = await _pool.run(cmd, timeout)
+  return subtitles.decode("utf-8", "replace")
+
+def _klv_cmd(src: str, metadata: JSONType, stream_index: int) -> List[str]:
+  klv_idx = find_klv_stream(metadata) if stream_index is None else str(stream_index)
+  if klv_idx is None:
+    raise ValueError("{} has no KLV stream".format(src))
+  return ["ffmpeg", "-loglevel", "quiet", "-i", src, "-map", "0:" + klv_idx, "-codec", "copy", "-f", "data", "-"]
+
+# stream_index is the KLV stream's index if already known, otherwise it is
+# looked up in metadata
+async def read_klv(src: str, metadata: JSONType, stream_index: int = None, timeout: float = None) -> bytes:
+  return await _pool.run(_klv_cmd(src, metadata, stream_index), timeout)
+
+async def stream_klv(src: str, metadata: JSONType, chunk_size: int = 65536, stream_index: int = None,
+                     timeout: float = None) -> AsyncIterator[bytes]:
+  async for chunk in _pool.stream(_klv_cmd(src, metadata, stream_index), chunk_size, timeout):
+    yield chunk
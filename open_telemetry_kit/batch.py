@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+from . import detector
+from . import writers
+from .parser import Parser
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+# Converts every telemetry file under a directory tree.
+#
+#   convert_tree("uploads/", "converted/", formats=["json", "csv"], workers=8)
+#
+# writes converted/<relative path>.<format> for every source under uploads/
+# (uploads/a/DJI_0001.SRT becomes converted/a/DJI_0001.SRT.json, so a video
+# and its telemetry sidecar never write to the same output). Each source is
+# detected, parsed and written by one worker process, so telemetry never has
+# to be sent back to the parent.
+# Outputs are written to a temporary file and renamed into place, so an
+# interrupted run never leaves a partial output behind.
+#
+# Progress is appended to a manifest (dst_dir/.otk_manifest.jsonl by
+# default), one JSON line per finished source. A later run skips sources the
+# manifest records as converted, as long as they are unchanged and their
+# outputs still exist, so an interrupted run picks up where it stopped.
+# Sources not in the manifest are checked with skip:
+#
+#   "mtime"  skip if every output is newer than the source
+#   "hash"   skip if the manifest holds the same SHA-256 for the source
+#            (only rehashed if its size or mtime changed)
+#   None     always convert
+
+logger = logging.getLogger("OTK.batch")
+
+MANIFEST_NAME = ".otk_manifest.jsonl"
+
+# format: (extension, writer)
+WRITERS = {"json" : (".json", writers.telemetryToJson),
+           "csv" : (".csv", writers.telemetryToCSV),
+           "klv" : (".klv", writers.telemetryToKLV)}
+
+# Videos that may carry embedded telemetry; independent telemetry files are
+# found by their parser's tel_type
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".ts", ".m2ts", ".mts", ".mkv"}
+
+def source_extensions() -> Set[str]:
+  return VIDEO_EXTENSIONS | {"." + cls.tel_type for cls in Parser.__subclasses__()}
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+  digest = hashlib.sha256()
+  with open(path, 'rb') as src_file:
+    chunk = src_file.read(chunk_size)
+    while chunk:
+      digest.update(chunk)
+      chunk = src_file.read(chunk_size)
+  return digest.hexdigest()
+
+def iter_sources(src_dir: str, extensions: Set[str]) -> Iterator[str]:
+  for root, dirs, files in os.walk(src_dir):
+    dirs.sort()
+    for name in sorted(files):
+      if os.path.splitext(name)[1].lower() in extensions:
+        yield os.path.relpath(os.path.join(root, name), src_dir)
+
+def output_paths(rel_path: str, dst_dir: str, formats: Iterable[str]) -> Dict[str, str]:
+  base = os.path.join(dst_dir, rel_path)
+  return {fmt : base + WRITERS[fmt][0] for fmt in formats}
+
+class Manifest():
+  def __init__(self, path: str):
+    self.path = path
+    # Latest record of each source (relative path)
+    self.records = {}
+    self._load()
+    self._file = None
+
+  def _load(self):
+    try:
+      with open(self.path, 'r') as manifest_file:
+        for line in manifest_file:
+          try:
+            record = json.loads(line)
+          except ValueError:
+            # A line cut short by an interrupted run
+            continue
+          self.records[record["source"]] = record
+    except FileNotFoundError:
+      pass
+
+  def get(self, rel_path: str) -> Dict[str, Any]:
+    return self.records.get(rel_path)
+
+  def add(self, record: Dict[str, Any]):
+    if self._file is None:
+      os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+      self._file = open(self.path, 'a')
+    self.records[record["source"]] = record
+    self._file.write(json.dumps(record) + "\n")
+    self._file.flush()
+    os.fsync(self._file.fileno())
+
+  def close(self):
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+# Statuses of sources that don't need converting again while unchanged
+_DONE = ("converted", "empty", "unsupported")
+
+def _outputs_exist(outputs: Dict[str, str]) -> bool:
+  return all(os.path.exists(path) for path in outputs.values())
+
+# Returns whether src can be skipped without looking at its contents, and the
+# SHA-256 the worker should compare against (None to always convert)
+def _check_source(src: str, rel_path: str, outputs: Dict[str, str], formats: List[str],
+                  manifest: Manifest, skip: str) -> Tuple[bool, str]:
+  stat = os.stat(src)
+  record = manifest.get(rel_path)
+  if record is not None and record["status"] in _DONE \
+     and record["size"] == stat.st_size and record["mtime_ns"] == stat.st_mtime_ns \
+     and set(formats) <= set(record["formats"]) \
+     and (record["status"] != "converted" or _outputs_exist(outputs)):
+    return True, None
+
+  if skip == "mtime":
+    if _outputs_exist(outputs) and \
+       all(os.stat(path).st_mtime_ns >= stat.st_mtime_ns for path in outputs.values()):
+      return True, None
+  elif skip == "hash":
+    if record is not None and record.get("sha256") and record["status"] in _DONE \
+       and set(formats) <= set(record["formats"]) and _outputs_exist(outputs):
+      return False, record["sha256"]
+  elif skip is not None:
+    raise ValueError("Unknown skip mode '{}'".format(skip))
+  return False, None
+
+# Runs in a worker process. Returns the source's manifest record.
+def convert_file(src: str, rel_path: str, outputs: Dict[str, str], fields: Set[str] = None,
+                 known_hash: str = None, compute_hash: bool = False) -> Dict[str, Any]:
+  stat = os.stat(src)
+  record = {"source" : rel_path,
+            "size" : stat.st_size,
+            "mtime_ns" : stat.st_mtime_ns,
+            "formats" : sorted(outputs),
+            "outputs" : {fmt : path for fmt, path in outputs.items()}}
+  try:
+    if compute_hash or known_hash is not None:
+      record["sha256"] = file_hash(src)
+      if record["sha256"] == known_hash:
+        record["status"] = "unchanged"
+        return record
+
+    parser = detector.create_telemetry_parser(src)
+    if parser is None:
+      record["status"] = "unsupported"
+      return record
+
+    tel = parser.read(fields=fields)
+    if len(tel) == 0:
+      record["status"] = "empty"
+      return record
+
+    for fmt, path in outputs.items():
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      tmp_path = "{}.{}.tmp".format(path, os.getpid())
+      try:
+        WRITERS[fmt][1](tel, tmp_path)
+        os.replace(tmp_path, path)
+      finally:
+        if os.path.exists(tmp_path):
+          os.remove(tmp_path)
+    record["packets"] = len(tel)
+    record["status"] = "converted"
+  except Exception as err:
+    logger.error("Failed to convert {}: {}".format(src, err))
+    record["status"] = "failed"
+    record["error"] = "{}: {}".format(type(err).__name__, err)
+  return record
+
+# Converts every source under src_dir with one of extensions (default:
+# source_extensions()) to each of formats under dst_dir. Returns the number
+# of sources per status: converted, skipped, unchanged (same hash), empty,
+# unsupported and failed.
+def convert_tree(src_dir: str,
+                 dst_dir: str,
+                 formats: Iterable[str] = ("json",),
+                 workers: int = 1,
+                 skip: str = "mtime",
+                 manifest_path: str = None,
+                 fields: Set[str] = None,
+                 extensions: Set[str] = None) -> Dict[str, int]:
+  formats = list(formats)
+  for fmt in formats:
+    if fmt not in WRITERS:
+      raise ValueError("Unknown output format '{}'. Expected one of {}".format(fmt, ", ".join(WRITERS)))
+  if extensions is None:
+    extensions = source_extensions()
+  if manifest_path is None:
+    manifest_path = os.path.join(dst_dir, MANIFEST_NAME)
+
+  manifest = Manifest(manifest_path)
+  counts = {"converted" : 0, "skipped" : 0, "unchanged" : 0, "empty" : 0, "unsupported" : 0, "failed" : 0}
+
+  def tasks() -> Iterator[Tuple]:
+    for rel_path in iter_sources(src_dir, extensions):
+      src = os.path.join(src_dir, rel_path)
+      outputs = output_paths(rel_path, dst_dir, formats)
+      try:
+        up_to_date, known_hash = _check_source(src, rel_path, outputs, formats, manifest, skip)
+      except OSError as err:
+        logger.error("Unable to stat {}: {}".format(src, err))
+        counts["failed"] += 1
+        continue
+      if up_to_date:
+        counts["skipped"] += 1
+        continue
+      yield (src, rel_path, outputs, fields, known_hash, skip == "hash")
+
+  def finish(record: Dict[str, Any]):
+    counts[record["status"]] += 1
+    if record["status"] == "unchanged":
+      # Remember the new mtime so the next run skips it without hashing
+      record["status"] = "converted"
+    manifest.add(record)
+
+  try:
+    if workers <= 1:
+      for task in tasks():
+        finish(convert_file(*task))
+    else:
+      with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Bounded number of tasks in flight so huge trees aren't queued up front
+        pending = set()
+        for task in tasks():
+          pending.add(executor.submit(convert_file, *task))
+          if len(pending) >= 4 * workers:
+            done = next(as_completed(pending))
+            pending.remove(done)
+            finish(done.result())
+        for future in as_completed(pending):
+          finish(future.result())
+  finally:
+    manifest.close()
+
+  logger.info("Batch conversion of {}: {}".format(src_dir, counts))
+  return counts
+
+def main():
+  arg_parser = argparse.ArgumentParser(description="Convert every telemetry file under a directory")
+  arg_parser.add_argument("src_dir")
+  arg_parser.add_argument("dst_dir")
+  arg_parser.add_argument("--formats", default="json", help="comma separated subset of " + ", ".join(WRITERS))
+  arg_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+  arg_parser.add_argument("--skip", default="mtime", choices=["mtime", "hash", "none"])
+  arg_parser.add_argument("--manifest", help="manifest path (default: dst_dir/{})".format(MANIFEST_NAME))
+  args = arg_parser.parse_args()
+
+  counts = convert_tree(args.src_dir, args.dst_dir, args.formats.split(","), workers=args.workers,
+                        skip=None if args.skip == "none" else args.skip, manifest_path=args.manifest)
+  print(", ".join("{} {}".format(count, status) for status, count in counts.items()))
+  if counts["failed"]:
+    sys.exit(1)
+
+if __name__ == "__main__":
+  main()
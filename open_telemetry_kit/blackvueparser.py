@@ -44,6 +44,7 @@ import pynmea2
 from pymp4.parser import Box
 from construct.core import RangeError, ConstError
 from dateutil import parser as dup
+from typing import Set
 
 '''
 Pulls geo data out of a BlackVue video files
@@ -51,11 +52,22 @@ Pulls geo data out of a BlackVue video files
 class BlackvueParser(Parser):
   tel_type = "blackvue"
 
-  def __init__(self, source):
-    super().__init__(source)
+  # BlackVue telemetry is always read straight from the MP4; is_embedded and
+  # detection are accepted for create_telemetry_parser
+  def __init__(self, source, is_embedded: bool = True, detection: 'Detection' = None):
+    super().__init__(source, detection=detection)
     self.logger = logging.getLogger("OTK.BlackvueParser")
     
-  def read(self) -> Telemetry:
+  def read(self, fields: Set[str] = None) -> Telemetry:
+    self.fields = fields
+    # Only GGA (position) and VTG (speed) sentences are used. Sentences that
+    # would not produce a requested element are skipped before pynmea2 parses them
+    sentence_types = set()
+    if any(self._wants(name) for name in (LatitudeElement.name, LongitudeElement.name, AltitudeElement.name)):
+      sentence_types.add('GGA')
+    if self._wants(SpeedElement.name):
+      sentence_types.add('VTG')
+
     tel = Telemetry()
     with open(self.source, 'rb') as fd:
 
@@ -96,7 +108,8 @@ class BlackvueParser(Parser):
                     tel.append(packet)
                   packet = Packet()
                   timestamp = match.group(1)
-                  packet[TimestampElement.name] = TimestampElement(float(timestamp) * 1e-3)
+                  if self._wants(TimestampElement.name):
+                    packet[TimestampElement.name] = TimestampElement(float(timestamp) * 1e-3)
 
                 #remove timestamp on tail if it exists
                 try:
@@ -109,12 +122,18 @@ class BlackvueParser(Parser):
                 except:
                   pass
 
+                # Sentences look like $GPGGA,... where GGA is the sentence type
+                if m[3:6] not in sentence_types:
+                  continue
+
                 try:
                   nmea_data = pynmea2.parse(m)
                   if nmea_data and nmea_data.sentence_type == 'GGA':
-                    packet[LatitudeElement.name] = LatitudeElement(nmea_data.latitude)
-                    packet[LongitudeElement.name] = LongitudeElement(nmea_data.longitude)
-                    if nmea_data.altitude:
+                    if self._wants(LatitudeElement.name):
+                      packet[LatitudeElement.name] = LatitudeElement(nmea_data.latitude)
+                    if self._wants(LongitudeElement.name):
+                      packet[LongitudeElement.name] = LongitudeElement(nmea_data.longitude)
+                    if nmea_data.altitude and self._wants(AltitudeElement.name):
                       packet[AltitudeElement.name] = AltitudeElement(nmea_data.altitude)
                   if nmea_data and nmea_data.sentence_type == 'VTG':
                     packet[SpeedElement.name] = SpeedElement(nmea_data.spd_over_grnd_kmph / 3.6) #convert to m/s
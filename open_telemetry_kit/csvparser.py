@@ -7,6 +7,7 @@ from .elements import TimestampElement, DatetimeElement
 import csv
 from dateutil import parser as dup
 import logging
+from typing import Set
 
 class CSVParser(Parser):
   tel_type = "csv"
@@ -19,7 +20,8 @@ class CSVParser(Parser):
                      require_timestamp = require_timestamp)
     self.logger = logging.getLogger("OTK.CSVParser")
 
-  def read(self) -> Telemetry:
+  def read(self, fields: Set[str] = None) -> Telemetry:
+    self.fields = fields
     tel = Telemetry()
     with open(self.source, newline='') as csvfile:
       reader =  csv.DictReader(csvfile)
@@ -27,10 +29,15 @@ class CSVParser(Parser):
       for idx, name in enumerate(reader.fieldnames):
         reader.fieldnames[idx] = name.strip()
 
+      skipped = {key for key in reader.fieldnames if not self._wants(self._column_name(key))}
+
       for row in reader:
         packet = Packet()
           
         for key, val in row.items():
+          if key in skipped:
+            continue
+
           if key in self.element_dict:
             #element_dict[key] returns a class
             element_cls = self.element_dict[key]
@@ -71,6 +78,17 @@ class CSVParser(Parser):
       self.logger.warn("No telemetry was found. Returning empty Telemetry()")
     return tel
 
+  # Name of the element a column will be stored under
+  def _column_name(self, key: str) -> str:
+    if key not in self.element_dict:
+      return key
+
+    element_cls = self.element_dict[key]
+    if element_cls == DatetimeElement and self.convert_to_epoch:
+      return TimestampElement.name
+
+    return element_cls.name
+
   def convert_to_metric(self, key: str, val: float):
     if ("feet" in key):
       return  val * 0.3048
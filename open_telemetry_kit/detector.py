@@ -1,12 +1,29 @@
 from .parser import Parser
+from .telemetry import Telemetry
+from .profiling import stage
+from .metadata_cache import MetadataCache
+from . import isobmff
+import io
 import os
 import json
 import logging
 import subprocess
-from typing import Dict, Tuple, Union, List
+import threading
+from typing import Any, Dict, Iterator, Set, Tuple, Union, List
 JSONType = Dict[str, Union[List[Dict[str, Union[str, int]]], Dict[str,Union[str, int]]]]
 logger = logging.getLogger("OTK.detector")
 
+# ffprobe output shared by the detector and every parser. None disables
+# caching.
+_metadata_cache = MetadataCache()
+
+def get_metadata_cache() -> MetadataCache:
+  return _metadata_cache
+
+def set_metadata_cache(cache: MetadataCache):
+  global _metadata_cache
+  _metadata_cache = cache
+
 def split_path(src: str) -> Tuple[str, str, str]:
   path, filename = os.path.split(src)
 
@@ -16,86 +33,299 @@ def split_path(src: str) -> Tuple[str, str, str]:
 
   return (path, "", "")
 
-def read_video_metadata(src: str) -> JSONType:
-  data_raw = os.popen("ffprobe -v quiet -print_format json -show_format -show_streams " + src).read()
-  return json.loads(data_raw)
+def read_video_metadata(src: str, use_cache: bool = True) -> JSONType:
+  if use_cache and _metadata_cache is not None:
+    return _metadata_cache.get_or_probe(src, _probe)
+  return _probe(src)
+
+def _probe(src: str) -> JSONType:
+  with stage("detector.read_video_metadata", source=src) as s:
+    data_raw = os.popen("ffprobe -v quiet -print_format json -show_format -show_streams " + src).read()
+    s.count(num_bytes=len(data_raw))
+    return json.loads(data_raw)
 
 def read_video_metadata_file(src: str):
   with open(src, 'r') as fl:
     metadata = json.load(fl)
   return metadata
 
+# The telemetry type of a single probed stream, None if it doesn't carry
+# telemetry OTK supports
+def classify_stream(stream: Dict) -> str:
+  codec_type = stream.get("codec_type")
+  codec_tag = stream.get("codec_tag_string")
+  handler_name = stream.get("tags", {}).get("handler_name")
+  if codec_type == "subtitle":
+    if codec_tag == "text":
+      return "srt"
+    elif codec_tag == "tx3g":
+      return "ass"
+  elif codec_type == "data":
+    if codec_tag == "KLVA":
+      return "klv"
+    elif codec_tag == "gpmd":
+      return "gopro"
+    elif handler_name == "ParrotVideoMetadata":
+      return "parrot"
+  elif codec_type == "video":
+    if handler_name == "PittaSoft Video Media Handler":
+      return "blackvue"
+  return None
+
+class TelemetryStream():
+  def __init__(self, tel_type: str, index: int, codec_tag: str):
+    self.tel_type = tel_type
+    # Absolute stream index, as used by ffmpeg's -map 0:<index>
+    self.index = index
+    self.codec_tag = codec_tag
+
+  def __repr__(self) -> str:
+    return "TelemetryStream('{}', {}, '{}')".format(self.tel_type, self.index, self.codec_tag)
+
+# Every telemetry stream in the probe output, in stream order
+def classify_streams(metadata: JSONType) -> List[TelemetryStream]:
+  streams = []
+  if metadata and "streams" in metadata:
+    for position, stream in enumerate(metadata["streams"]):
+      tel_type = classify_stream(stream)
+      if tel_type is not None:
+        streams.append(TelemetryStream(tel_type, stream.get("index", position), stream.get("codec_tag_string")))
+  return streams
+
 def get_embedded_telemetry_type(metadata: JSONType) -> str:
-  if "streams" in metadata:
-    for stream in metadata["streams"]:
-      if stream["codec_type"] == "subtitle":
-        if stream["codec_tag_string"] == "text":
-          return "srt"
-        elif stream["codec_tag_string"] == "tx3g":
-          return "ass"
-      elif stream["codec_type"] == "data":
-        if "codec_tag_string" in stream and stream["codec_tag_string"] == "KLVA":
-          return "klv"
-        elif "codec_tag_string" in stream and stream["codec_tag_string"] == "gpmd":
-          return "gopro"
-        elif "tags" in stream and "handler_name" in stream["tags"]:
-          if stream["tags"]["handler_name"] == "ParrotVideoMetadata":
-            return "parrot"
-      elif stream["codec_type"] == "video":
-        if "tags" in stream and "handler_name" in stream["tags"] and \
-           stream["tags"]["handler_name"] == "PittaSoft Video Media Handler":
-            return "blackvue"
+  streams = classify_streams(metadata)
+  if streams:
+    return streams[0].tel_type
 
   logger.error("Unsupported embedded telemetry type.")
   return None
 
-# If supported return the extension and bool
-#   False: Telemetry is not embedded in video file (in it's own file)
-#   True: Telemetry is embedded in video file
-# TODO: Rewrite so we're not doing the same search twice.
-# Not a huge deal now, but as more types get supported will get worse
-def get_telemetry_type(src: str) -> Tuple[str, bool]:
+def _creation_time(metadata: JSONType) -> str:
+  if not metadata:
+    return None
+  streams = metadata.get("streams")
+  if streams and "creation_time" in streams[0].get("tags", {}):
+    return streams[0]["tags"]["creation_time"]
+  return metadata.get("format", {}).get("tags", {}).get("creation_time")
+
+# Result of detect(). Parsers given one use its probe output and stream index
+# instead of probing the source again.
+class Detection():
+  def __init__(self,
+               source: str,
+               tel_type: str = None,
+               is_embedded: bool = False,
+               metadata: JSONType = None,
+               streams: List[TelemetryStream] = None):
+    self.source = source
+    self.tel_type = tel_type
+    self.is_embedded = is_embedded
+    # ffprobe output, None for independent telemetry files
+    self.metadata = metadata
+    # Every telemetry stream found, in stream order; the first is the one
+    # that is read
+    self.streams = streams if streams is not None else []
+    stream = self.streams[0] if self.streams else None
+    self.stream_index = stream.index if stream is not None else None
+    self.codec_tag = stream.codec_tag if stream is not None else None
+    # Creation time of the first stream (or of the container) as reported by
+    # ffprobe, None if unknown
+    self.creation_time = _creation_time(metadata)
+
+  def __bool__(self) -> bool:
+    return self.tel_type is not None
+
+  def __repr__(self) -> str:
+    return "Detection('{}', tel_type={}, is_embedded={}, stream_index={})".format(
+           self.source, self.tel_type, self.is_embedded, self.stream_index)
+
+# Classifies src with at most one probe: independent telemetry files by
+# extension, videos by a single pass over their streams. With
+# inspect_container MP4/MOV files are classified from their boxes without
+# ffprobe; the Detection's metadata is then the partial stream listing of
+# isobmff.probe() rather than ffprobe output.
+def detect(src: str, inspect_container: bool = True) -> Detection:
   _, _, ext = split_path(src)
   supported = [cls.tel_type for cls in Parser.__subclasses__()]
   if ext.strip('.') in supported:
     logger.info("Found independent telemetry of type '{}'".format(ext.strip('.')))
-    return (ext.strip('.'), False)
+    return Detection(src, ext.strip('.'), is_embedded=False)
 
-  metadata = read_video_metadata(src)
-  if metadata:
-    tel_type = get_embedded_telemetry_type(metadata)
+  metadata = None
+  if inspect_container:
+    metadata = isobmff.probe(src)
+  if metadata is None:
+    metadata = read_video_metadata(src)
+  streams = classify_streams(metadata)
+  if streams:
+    logger.info("Found embedded telemetry of type '{}'".format(streams[0].tel_type))
+    return Detection(src, streams[0].tel_type, is_embedded=True, metadata=metadata, streams=streams)
 
-    if tel_type:
-      logger.info("Found embedded telemetry of type '{}'".format(tel_type))
-      return (tel_type, True)
-  
   logger.error("{} contains an unsupported telemetry type".format(src))
-  return (None, False)
+  return Detection(src, metadata=metadata)
+
+# If supported return the extension and bool
+#   False: Telemetry is not embedded in video file (in it's own file)
+#   True: Telemetry is embedded in video file
+def get_telemetry_type(src: str) -> Tuple[str, bool]:
+  detection = detect(src)
+  return (detection.tel_type, detection.is_embedded)
     
-def create_telemetry_parser(src: str) -> Parser:
-  tel_type, embedded = get_telemetry_type(src)
+def create_telemetry_parser(src: str, detection: Detection = None) -> Parser:
+  if detection is None:
+    detection = detect(src)
 
   for cls in Parser.__subclasses__():
-    if tel_type == cls.tel_type:
+    if detection.tel_type == cls.tel_type:
       logger.info("Creating parser objecet: {}".format(cls.__name__))
-      if not embedded:
+      if not detection.is_embedded:
         return cls(src)
       else:
-        return cls(src, is_embedded=embedded)
+        return cls(src, is_embedded=True, detection=detection)
 
-def read_embedded_subtitles(src: str, file_format: str) -> str:
-  cmd = "ffmpeg -y -i " + src + " -f " + file_format + " - " 
-  subtitles = os.popen(cmd).read()
+# stream_index selects the subtitle stream, by default ffmpeg's choice
+def read_embedded_subtitles(src: str, file_format: str, stream_index: int = None) -> str:
+  stream_map = "" if stream_index is None else "-map 0:" + str(stream_index) + " "
+  cmd = "ffmpeg -y -i " + src + " " + stream_map + "-f " + file_format + " - " 
+  with stage("detector.read_embedded_subtitles", source=src, format=file_format) as s:
+    subtitles = os.popen(cmd).read()
+    s.count(num_bytes=len(subtitles))
   return subtitles
 
-def read_klv(src: str, metadata: JSONType) -> bytes:
-  klv_idx = None
+def find_klv_stream(metadata: JSONType) -> str:
   if "streams" in metadata:
       for idx, stream in enumerate(metadata["streams"]):
         if stream["codec_type"] == "data" and stream["codec_tag_string"] == "KLVA":
-          klv_idx = str(idx)
-          break
+          return str(idx)
+
+  return None
+
+# stream_index is the KLV stream's index if already known, otherwise it is
+# looked up in metadata
+def read_klv(src: str, metadata: JSONType, stream_index: int = None) -> bytes:
+  klv_idx = find_klv_stream(metadata) if stream_index is None else str(stream_index)
 
   cmd = ["ffmpeg", "-loglevel", "quiet", "-i" , src , "-map", "0:" + klv_idx, "-codec", "copy", "-f", "data", "-"]
-  klv = subprocess.run(cmd, stdout=subprocess.PIPE).stdout
-  return klv
\ No newline at end of file
+  with stage("detector.read_klv", source=src) as s:
+    klv = subprocess.run(cmd, stdout=subprocess.PIPE).stdout
+    s.count(num_bytes=len(klv))
+  return klv
+
+# Same as read_klv but yields ffmpeg's output in chunks of at most chunk_size
+# bytes as soon as they are available instead of buffering the whole track
+def stream_klv(src: str, metadata: JSONType, chunk_size: int = 65536, stream_index: int = None) -> Iterator[bytes]:
+  klv_idx = find_klv_stream(metadata) if stream_index is None else str(stream_index)
+
+  cmd = ["ffmpeg", "-loglevel", "quiet", "-i" , src , "-map", "0:" + klv_idx, "-codec", "copy", "-f", "data", "-"]
+  proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+  try:
+    chunk = proc.stdout.read1(chunk_size)
+    while chunk:
+      yield chunk
+      chunk = proc.stdout.read1(chunk_size)
+  finally:
+    proc.stdout.close()
+    if proc.poll() is None:
+      proc.kill()
+    proc.wait()
+
+# ffmpeg output options of each telemetry type that read_all_telemetry() can
+# extract and parse with Parser.read_buffer()
+_PIPE_FORMATS = {"klv" : ["-codec", "copy", "-f", "data"],
+                 "srt" : ["-f", "srt"],
+                 "ass" : ["-f", "ass"]}
+
+def _parser_class(tel_type: str):
+  for cls in Parser.__subclasses__():
+    if cls.tel_type == tel_type:
+      return cls
+  return None
+
+# Reads every KLV, SRT and ASS telemetry stream of src with a single ffmpeg
+# run and returns their Telemetry keyed by stream index. Each stream is
+# written to its own pipe (pipe:<fd>, passed to ffmpeg with pass_fds) and
+# parsed by its own thread while ffmpeg is still demuxing, so the container
+# is only read once however many telemetry streams it has. Streams of other
+# types are left out, as are streams whose parser fails. parser_args holds
+# the extra constructor arguments of each telemetry type's parser, e.g.
+# {"srt" : {"require_timestamp" : True}}, since the parsers take different
+# ones. Elsewhere than POSIX the streams are extracted one ffmpeg run at a
+# time.
+def read_all_telemetry(src: str, detection: Detection = None, fields: Set[str] = None,
+                       parser_args: Dict[str, Dict[str, Any]] = None) -> Dict[int, Telemetry]:
+  if parser_args is None:
+    parser_args = {}
+
+  if detection is None:
+    detection = detect(src)
+
+  streams = []
+  for stream in detection.streams:
+    if stream.tel_type in _PIPE_FORMATS:
+      streams.append(stream)
+    else:
+      logger.info("Skipping {} stream {}: not extractable to a pipe".format(stream.tel_type, stream.index))
+  parsers = {stream.index : _parser_class(stream.tel_type)(src, is_embedded=True, detection=detection,
+                                                           **parser_args.get(stream.tel_type, {}))
+             for stream in streams}
+  if not streams:
+    return {}
+
+  if os.name != "posix":
+    tels = {}
+    for stream in streams:
+      if stream.tel_type == "klv":
+        data = read_klv(src, detection.metadata, stream.index)
+      else:
+        data = read_embedded_subtitles(src, stream.tel_type, stream.index)
+      tels[stream.index] = parsers[stream.index].read_buffer(data, fields)
+    return tels
+
+  tels = {}
+
+  def consume(stream: TelemetryStream, read_fd: int):
+    with os.fdopen(read_fd, 'rb') as pipe:
+      try:
+        if stream.tel_type == "klv":
+          data = pipe.read()
+        else:
+          data = io.TextIOWrapper(pipe, encoding="utf-8", errors="replace")
+        tels[stream.index] = parsers[stream.index].read_buffer(data, fields)
+      except Exception as err:
+        logger.error("Failed to parse {} stream {} of {}: {}".format(stream.tel_type, stream.index, src, err))
+        # Keep draining so ffmpeg isn't blocked writing to this pipe
+        while pipe.read(65536):
+          pass
+
+  cmd = ["ffmpeg", "-loglevel", "quiet", "-i", src]
+  read_fds = []
+  write_fds = []
+  try:
+    for stream in streams:
+      read_fd, write_fd = os.pipe()
+      read_fds.append(read_fd)
+      write_fds.append(write_fd)
+      cmd += ["-map", "0:" + str(stream.index)] + _PIPE_FORMATS[stream.tel_type] + ["pipe:" + str(write_fd)]
+
+    with stage("detector.read_all_telemetry", source=src, streams=len(streams)) as s:
+      proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, pass_fds=write_fds)
+      # Only ffmpeg may hold the write ends, or the readers never see EOF
+      while write_fds:
+        os.close(write_fds.pop())
+
+      threads = []
+      while read_fds:
+        stream = streams[len(threads)]
+        thread = threading.Thread(target=consume, args=(stream, read_fds.pop(0)),
+                                  name="OTK {} stream {}".format(stream.tel_type, stream.index))
+        thread.start()
+        threads.append(thread)
+      for thread in threads:
+        thread.join()
+      proc.wait()
+      s.count(num_packets=sum(len(tel) for tel in tels.values()))
+  finally:
+    for fd in read_fds + write_fds:
+      os.close(fd)
+
+  return {stream.index : tels[stream.index] for stream in streams if stream.index in tels}
@@ -1,5 +1,7 @@
 from .element import Element, FloatElement, IntElement, StrElement
-from .misb_0601 import MISB0601, IntMISB, FloatMISB, StrMISB 
+from .misb_0601 import MISB0601, IntMISB, FloatMISB, StrMISB, LocalSetMISB
+from .local_sets import ST_0102, ST_0806, ST_0903, ST_1206, ST_1002, ST_1601, ST_1602
+from .local_sets import ST_1607_SEGMENT, ST_1607_AMEND
 from .klv_common import bytes_to_int, bytes_to_float, bytes_to_str, read_len, read_ber_oid
 from datetime import datetime
 from dateutil import parser as dup
@@ -768,7 +770,7 @@ class GenericFlagDataElement(IntElement, IntMISB):
   misb_tag = 47
   misb_units = "None"
 
-class SecurityLocalSetElement(StrElement, MISB0601):
+class SecurityLocalSetElement(Element, LocalSetMISB):
   name = "securityLocalSet"
   names = {"securityLocalSet"}
 
@@ -777,11 +779,8 @@ class SecurityLocalSetElement(StrElement, MISB0601):
   misb_tag = 48
   misb_units = "None"
 
-  @classmethod
-  def fromMISB(cls, value: bytes):
-    # This contains elements from a different standard so this will have
-    # to have its own special procedures because it's a fancy boi
-    pass
+  # MISB ST 0102
+  _spec = ST_0102
 
 class DifferentialPressureElement(FloatElement, FloatMISB):
   name = "differentialPressure"
@@ -1029,7 +1028,7 @@ class EventStartTimeUTCElement(StrElement, IntMISB):
   misb_tag = 72
   misb_units = "Microseconds"
 
-class RVTLocalSetElement(StrElement, MISB0601):
+class RVTLocalSetElement(Element, LocalSetMISB):
   name = "RVTLocalSet"
   names = {"RVTLocalSet"}
 
@@ -1038,14 +1037,10 @@ class RVTLocalSetElement(StrElement, MISB0601):
   misb_tag = 73
   misb_units = "None"
 
-  @classmethod
-  def fromMISB(cls, value: bytes):
-    # MISB ST 0806
-    # This contains elements from a different standard so this will have
-    # to have its own special procedures because it's a fancy boi
-    pass
+  # MISB ST 0806
+  _spec = ST_0806
 
-class VMTILocalSetElement(StrElement, MISB0601):
+class VMTILocalSetElement(Element, LocalSetMISB):
   name = "VMTILocalSet"
   names = {"VMTILocalSet"}
 
@@ -1054,12 +1049,8 @@ class VMTILocalSetElement(StrElement, MISB0601):
   misb_tag = 74
   misb_units = "None"
 
-  @classmethod
-  def fromMISB(cls, value: bytes):
-    # MISB ST 0903
-    # This contains elements from a different standard so this will have
-    # to have its own special procedures because it's a fancy boi
-    pass
+  # MISB ST 0903
+  _spec = ST_0903
 
 class AlternatePlatformEllipsoidHeightElement(FloatElement, FloatMISB):
   name = "alternatePlatformEllipsoidHeight"
@@ -1267,7 +1258,7 @@ class MIISCoreIdentifierElement(StrElement, MISB0601):
     # to have its own special procedures because it's a fancy boi
     pass
 
-class SARMotionImageryLocalSetElement(StrElement, MISB0601):
+class SARMotionImageryLocalSetElement(Element, LocalSetMISB):
   name = "SARMotionImageryLocalSet"
   names = {"SARMotionImageryLocalSet"}
 
@@ -1276,14 +1267,10 @@ class SARMotionImageryLocalSetElement(StrElement, MISB0601):
   misb_tag = 95
   misb_units = "None"
 
-  @classmethod
-  def fromMISB(cls, value: bytes):
-    # MISB 1206
-    # This contains elements from a different standard so this will have
-    # to have its own special procedures because it's a fancy boi
-    pass
+  # MISB 1206
+  _spec = ST_1206
 
-class RangeImageLocalSetElement(StrElement, MISB0601):
+class RangeImageLocalSetElement(Element, LocalSetMISB):
   name = "rangeImageLocalSet"
   names = {"rangeImageLocalSet"}
 
@@ -1292,14 +1279,10 @@ class RangeImageLocalSetElement(StrElement, MISB0601):
   misb_tag = 97
   misb_units = "None"
 
-  @classmethod
-  def fromMISB(cls, value: bytes):
-    # MISB 1002
-    # This contains elements from a different standard so this will have
-    # to have its own special procedures because it's a fancy boi
-    pass
+  # MISB 1002
+  _spec = ST_1002
 
-class GeoRegistrationLocalSetElement(StrElement, MISB0601):
+class GeoRegistrationLocalSetElement(Element, LocalSetMISB):
   name = "geoRegistrationLocalSet"
   names = {"geoRegistrationLocalSet"}
 
@@ -1308,14 +1291,10 @@ class GeoRegistrationLocalSetElement(StrElement, MISB0601):
   misb_tag = 98
   misb_units = "None"
 
-  @classmethod
-  def fromMISB(cls, value: bytes):
-    # MISB 1601
-    # This contains elements from a different standard so this will have
-    # to have its own special procedures because it's a fancy boi
-    pass
+  # MISB 1601
+  _spec = ST_1601
 
-class CompositeImagingLocalSetElement(StrElement, MISB0601):
+class CompositeImagingLocalSetElement(Element, LocalSetMISB):
   name = "compositeImagingLocalSet"
   names = {"compositeImagingLocalSet"}
 
@@ -1324,14 +1303,10 @@ class CompositeImagingLocalSetElement(StrElement, MISB0601):
   misb_tag = 99
   misb_units = "None"
 
-  @classmethod
-  def fromMISB(cls, value: bytes):
-    # MISB 1602
-    # This contains elements from a different standard so this will have
-    # to have its own special procedures because it's a fancy boi
-    pass
+  # MISB 1602
+  _spec = ST_1602
 
-class SegmentLocalSetElement(StrElement, MISB0601):
+class SegmentLocalSetElement(Element, LocalSetMISB):
   name = "segmentLocalSet"
   names = {"segmentLocalSet"}
 
@@ -1340,14 +1315,10 @@ class SegmentLocalSetElement(StrElement, MISB0601):
   misb_tag = 100
   misb_units = "None"
 
-  @classmethod
-  def fromMISB(cls, value: bytes):
-    # MISB 1607
-    # This contains elements from a different standard so this will have
-    # to have its own special procedures because it's a fancy boi
-    pass
+  # MISB 1607
+  _spec = ST_1607_SEGMENT
 
-class AmendLocalSetElement(StrElement, MISB0601):
+class AmendLocalSetElement(Element, LocalSetMISB):
   name = "amendLocalSet"
   names = {"amendLocalSet"}
 
@@ -1356,12 +1327,8 @@ class AmendLocalSetElement(StrElement, MISB0601):
   misb_tag = 101
   misb_units = "None"
 
-  @classmethod
-  def fromMISB(cls, value: bytes):
-    # MISB 1607
-    # This contains elements from a different standard so this will have
-    # to have its own special procedures because it's a fancy boi
-    pass
+  # MISB 1607
+  _spec = ST_1607_AMEND
 
 class SDCCFLPElement(StrElement, MISB0601):
   name = "SDCCFLP"
@@ -7,6 +7,7 @@ from .elements import TimestampElement, DatetimeElement
 import xml.etree.ElementTree as ET
 from dateutil import parser as dup
 import logging
+from typing import Set
 
 # Reference: http://www.topografix.com/GPX/1/1/
 class GPXParser(Parser):
@@ -20,7 +21,8 @@ class GPXParser(Parser):
                      require_timestamp = require_timestamp)
     self.logger = logging.getLogger("OTK.GPXParser")
 
-  def read(self):
+  def read(self, fields: Set[str] = None):
+    self.fields = fields
     tree = ET.parse(self.source)
     tel = Telemetry()
     self._traverse_tree(tree.getroot(), tel)
@@ -65,10 +67,11 @@ class GPXParser(Parser):
       if key in self.element_dict:
         element_cls = self.element_dict[key]
         if element_cls == DatetimeElement and self.convert_to_epoch:
-          val = dup.parse(val).timestamp()
-          packet[TimestampElement.name] = TimestampElement(val)
-        else:
+          if self._wants(TimestampElement.name):
+            val = dup.parse(val).timestamp()
+            packet[TimestampElement.name] = TimestampElement(val)
+        elif self._wants(element_cls.name):
           packet[element_cls.name] = element_cls(val)
-      else: 
+      elif self._wants(key):
         self.logger.warn("Adding unknown element ({} : {})".format(key, val))
         packet[key] = UnknownElement(val)
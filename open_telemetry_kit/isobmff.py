@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import logging
+import mmap
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Tuple
+
+# In-process stream listing of MP4/MOV (ISO-BMFF) files, used by
+# detector.detect() to classify containers without launching ffprobe.
+#
+# The file is memory mapped and only box headers are read on the way to
+# moov/trak. For every track the handler type and name (mdia/hdlr), the
+# creation time (mdia/mdhd) and the fourcc of the first sample entry
+# (mdia/minf/stbl/stsd) are collected into a dict shaped like the subset of
+# ffprobe's -show_streams output that detector.classify_streams() uses:
+#
+#   {"streams" : [{"index" : 0, "codec_type" : "video", "codec_tag_string" : "avc1",
+#                  "tags" : {"handler_name" : "...", "creation_time" : "..."}}, ...],
+#    "format" : {}}
+#
+# probe() returns None whenever it can't decide (not an ISO-BMFF file, no
+# moov, truncated or malformed boxes) and the caller falls back to ffprobe.
+
+logger = logging.getLogger("OTK.isobmff")
+
+# codec_type ffprobe reports for each handler type
+_CODEC_TYPES = {b"vide" : "video",
+                b"soun" : "audio",
+                b"sbtl" : "subtitle",
+                b"subt" : "subtitle",
+                b"text" : "subtitle",
+                b"clcp" : "subtitle"}
+
+# Box types a file can start with
+_FIRST_BOXES = {b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot", b"uuid"}
+
+# Seconds between 1904-01-01 (the ISO-BMFF epoch) and 1970-01-01
+_EPOCH_OFFSET = 2082844800
+
+class BoxError(Exception):
+  pass
+
+# Yields the (type, payload start, payload end) of the boxes in [start, end)
+def iter_boxes(buf, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+  offset = start
+  while offset + 8 <= end:
+    size, box_type = struct.unpack_from(">I4s", buf, offset)
+    header = 8
+    if size == 1:
+      if offset + 16 > end:
+        raise BoxError("truncated box header")
+      size, = struct.unpack_from(">Q", buf, offset + 8)
+      header = 16
+    elif size == 0:
+      size = end - offset
+    if size < header or offset + size > end:
+      raise BoxError("box '{}' at {} overruns its parent".format(box_type, offset))
+    yield box_type, offset + header, offset + size
+    offset += size
+
+def find_box(buf, start: int, end: int, box_type: bytes) -> Tuple[int, int]:
+  for found_type, payload_start, payload_end in iter_boxes(buf, start, end):
+    if found_type == box_type:
+      return payload_start, payload_end
+  return None
+
+def _handler(buf, start: int, end: int) -> Tuple[bytes, str]:
+  # version/flags, pre_defined, handler_type, 3 reserved words, name
+  if end - start < 24:
+    raise BoxError("truncated hdlr")
+  handler_type = bytes(buf[start + 8:start + 12])
+  name = bytes(buf[start + 24:end])
+  # QuickTime names are length prefixed, ISO-BMFF names null terminated
+  if name and name[0] == len(name) - 1:
+    name = name[1:]
+  name = name.split(b"\x00", 1)[0]
+  return handler_type, name.decode("utf-8", "replace").strip()
+
+def _creation_time(buf, start: int, end: int) -> str:
+  version = buf[start]
+  if version == 1:
+    seconds, = struct.unpack_from(">Q", buf, start + 4)
+  else:
+    seconds, = struct.unpack_from(">I", buf, start + 4)
+  if seconds == 0:
+    return None
+  try:
+    created = datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=seconds - _EPOCH_OFFSET)
+  except OverflowError:
+    return None
+  return created.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+def _sample_entry(buf, start: int, end: int) -> str:
+  # version/flags, entry_count, then the first entry's size and fourcc
+  if end - start < 16:
+    return None
+  entry_count, = struct.unpack_from(">I", buf, start + 4)
+  if entry_count == 0:
+    return None
+  return bytes(buf[start + 12:start + 16]).decode("latin-1")
+
+def _track(buf, start: int, end: int, index: int) -> Dict:
+  mdia = find_box(buf, start, end, b"mdia")
+  if mdia is None:
+    raise BoxError("trak without mdia")
+
+  stream = {"index" : index, "codec_type" : "data", "tags" : {}}
+  for box_type, box_start, box_end in iter_boxes(buf, *mdia):
+    if box_type == b"hdlr":
+      handler_type, name = _handler(buf, box_start, box_end)
+      stream["codec_type"] = _CODEC_TYPES.get(handler_type, "data")
+      if name:
+        stream["tags"]["handler_name"] = name
+    elif box_type == b"mdhd":
+      creation_time = _creation_time(buf, box_start, box_end)
+      if creation_time is not None:
+        stream["tags"]["creation_time"] = creation_time
+    elif box_type == b"minf":
+      stbl = find_box(buf, box_start, box_end, b"stbl")
+      stsd = find_box(buf, *stbl, b"stsd") if stbl is not None else None
+      if stsd is not None:
+        codec_tag = _sample_entry(buf, *stsd)
+        if codec_tag is not None:
+          stream["codec_tag_string"] = codec_tag
+  return stream
+
+def probe_buffer(buf) -> Dict:
+  if len(buf) < 8 or bytes(buf[4:8]) not in _FIRST_BOXES:
+    return None
+
+  try:
+    moov = find_box(buf, 0, len(buf), b"moov")
+    if moov is None:
+      return None
+    streams = []
+    for box_type, box_start, box_end in iter_boxes(buf, *moov):
+      if box_type == b"trak":
+        streams.append(_track(buf, box_start, box_end, len(streams)))
+  except (BoxError, struct.error, IndexError) as err:
+    logger.info("Unable to walk ISO-BMFF boxes: {}".format(err))
+    return None
+
+  return {"streams" : streams, "format" : {}}
+
+# ffprobe-like stream listing of src, None if src isn't an ISO-BMFF file
+# this can read
+def probe(src: str) -> Dict:
+  try:
+    with open(src, 'rb') as fd:
+      with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        return probe_buffer(buf)
+  except (OSError, ValueError):
+    # Missing, unreadable, empty or unmappable (pipes, URLs)
+    return None
@@ -0,0 +1,228 @@
+from .packet import LazyPacket
+from .element import UnknownElement, FloatElement, IntElement
+from .misb_0601 import IntMISB, FloatMISB
+from .elements import TimestampElement
+from .klv_template import LayoutTemplate
+from .klv_common import imapb_reverse_array
+
+from typing import Dict, List, Tuple, Union
+
+# Column-wise decoding of MISB packets with NumPy
+#
+# KLVParser.read_columns() only frames the stream. Packets matching a
+# LayoutTemplate are recorded as a PacketSpan; their values sit at the same
+# offsets in every packet so each element is gathered across all of them with
+# a single fancy index into the buffer. Any other packet is framed as a
+# LazyPacket. The raw values of each element are then converted in one
+# vectorized pass instead of calling fromMISB once per value.
+#
+# Column dtypes:
+#   FloatMISB elements               float64, NaN where missing or _invalid
+#                                    (or a reserved IMAPB value)
+#   IntMISB elements and timestamps  int64, or float64 with NaN if any packet
+#                                    is missing the element or has a value
+#                                    longer than 8 bytes
+#   Everything else (including       object, holding each Element's value
+#   enumerations such as Sensor      (None where missing)
+#   Control Mode)
+
+class PacketSpan():
+  def __init__(self, template: LayoutTemplate, offset: int):
+    self.template = template
+    self.offset = offset
+    self.metadata = {}
+
+def _kind(element_cls) -> str:
+  if element_cls is None:
+    return "object"
+
+  from_misb = element_cls.fromMISB.__func__
+  if from_misb is TimestampElement.fromMISB.__func__:
+    return "timestamp"
+  # Elements that turn the decoded number into something else (enumerations
+  # mapped through _code, strings) keep the value fromMISB gives them
+  if hasattr(element_cls, "_code") or element_cls.__init__ not in (FloatElement.__init__, IntElement.__init__):
+    return "object"
+  if from_misb is FloatMISB.fromMISB.__func__ and isinstance(element_cls._domain, tuple):
+    return "float"
+  if from_misb is FloatMISB.fromMISB.__func__ and element_cls._domain == 'IMAPB':
+    return "imapb"
+  if from_misb is IntMISB.fromMISB.__func__:
+    return "int"
+  return "object"
+
+def _object_value(element_cls, value: memoryview):
+  if element_cls is None:
+    return UnknownElement(bytes(value)).value
+
+  # Corrupted values (e.g. a code missing from _code) are left missing
+  try:
+    element = element_cls.fromMISB(value)
+  except Exception:
+    return None
+  return element.value if element is not None else None
+
+# Converts an (n, length) uint8 array of big endian values to int64
+def _bytes_to_ints(raw: "numpy.ndarray", signed: bool):
+  import numpy as np
+
+  length = raw.shape[1]
+  if length in (1, 2, 4, 8):
+    dtype = ">{}{}".format('i' if signed else 'u', length)
+    return np.ascontiguousarray(raw).view(dtype).ravel().astype(np.int64)
+
+  # Odd lengths are right aligned into 8 bytes and sign extended afterwards
+  padded = np.zeros((raw.shape[0], 8), dtype=np.uint8)
+  padded[:, 8 - length:] = raw
+  ints = padded.view(">u8").ravel().astype(np.int64)
+  if signed:
+    bits = 8 * length
+    ints = np.where(ints >= (1 << (bits - 1)), ints - (1 << bits), ints)
+  return ints
+
+def _decode_raw(element_cls, kind: str, raw: "numpy.ndarray"):
+  import numpy as np
+
+  # Values longer than 8 bytes don't fit in an int64 so they are decoded one
+  # at a time, into a float64 column
+  if raw.shape[1] > 8:
+    values = [_object_value(element_cls, bytes(value)) for value in raw]
+    return np.asarray([np.nan if value is None else value for value in values], dtype=float)
+
+  if kind == "float":
+    x0, x1 = element_cls._domain
+    y0, y1 = element_cls._range
+    ints = _bytes_to_ints(raw, x0 < 0)
+    # Same arithmetic as klv_common.lerp so results match fromMISB exactly
+    t = (ints - x0) / (x1 - x0)
+    floats = (1 - t) * y0 + t * y1
+    invalid = element_cls._invalid
+    if isinstance(invalid, bytes) and len(invalid) == raw.shape[1]:
+      floats[ints == int.from_bytes(invalid, byteorder="big", signed=(x0 < 0))] = np.nan
+    return floats
+
+  if kind == "imapb":
+    params = element_cls.imapbParams(raw.shape[1])
+    if raw.shape[1] == 8:
+      ys = np.ascontiguousarray(raw).view(">u8").ravel().astype(np.uint64)
+    else:
+      ys = _bytes_to_ints(raw, False)
+    return imapb_reverse_array(ys, element_cls._range[0], params)
+
+  if kind == "int":
+    return _bytes_to_ints(raw, bool(element_cls._signed))
+
+  return _bytes_to_ints(raw, False)
+
+def decode_columns(buf: memoryview,
+                   entries: List[Union[PacketSpan, LazyPacket]]) -> Dict[str, "numpy.ndarray"]:
+  import numpy as np
+
+  num_packets = len(entries)
+  data = np.frombuffer(buf, dtype=np.uint8)
+  # key -> (element class, [(rows, values)]) where values is an (n, length)
+  # uint8 array for numeric elements and a list of decoded values otherwise
+  pieces = {}
+
+  def add(key, element_cls, rows, values):
+    pieces.setdefault(key, (element_cls, []))[1].append((rows, values))
+
+  spans = {}
+  irregular = []
+  for row, entry in enumerate(entries):
+    if isinstance(entry, PacketSpan):
+      group = spans.get(id(entry.template))
+      if group is None:
+        group = spans[id(entry.template)] = (entry.template, [], [])
+      group[1].append(row)
+      group[2].append(entry.offset)
+    else:
+      irregular.append((row, entry))
+
+  for template, rows, offsets in spans.values():
+    rows = np.asarray(rows)
+    offsets = np.asarray(offsets)
+    for key, element_cls, value_offset, length in template.columns:
+      starts = offsets + value_offset
+      if _kind(element_cls) == "object":
+        add(key, element_cls, rows,
+            [_object_value(element_cls, buf[start:start + length]) for start in starts.tolist()])
+      else:
+        add(key, element_cls, rows, data[starts[:, None] + np.arange(length)])
+
+  # (key, length) -> (element class, [rows], [raw values])
+  gathered = {}
+  for row, packet in irregular:
+    for key, value in packet.data.items():
+      if type(value) is not tuple:
+        # Already an Element (e.g. an UnknownElement)
+        add(key, None, np.asarray([row]), [value.value])
+        continue
+
+      element_cls, offset, length = value
+      group = gathered.get((key, length))
+      if group is None:
+        group = gathered[(key, length)] = (element_cls, [], [])
+      group[1].append(row)
+      group[2].append(packet.buf[offset:offset + length])
+
+  for (key, length), (element_cls, rows, values) in gathered.items():
+    if _kind(element_cls) == "object":
+      add(key, element_cls, np.asarray(rows), [_object_value(element_cls, value) for value in values])
+    else:
+      raw = np.frombuffer(b"".join(values), dtype=np.uint8).reshape(-1, length)
+      add(key, element_cls, np.asarray(rows), raw)
+
+  columns = {}
+  for key, (element_cls, parts) in pieces.items():
+    kind = _kind(element_cls)
+    if kind == "object":
+      column = np.full(num_packets, None, dtype=object)
+      for rows, values in parts:
+        for row, value in zip(rows.tolist(), values):
+          column[row] = value
+      columns[key] = column
+      continue
+
+    num_rows = sum(len(rows) for rows, _ in parts)
+    wide = any(raw.shape[1] > 8 for _, raw in parts)
+    if kind in ("float", "imapb") or wide or num_rows != num_packets:
+      column = np.full(num_packets, np.nan)
+    else:
+      column = np.zeros(num_packets, dtype=np.int64)
+
+    for rows, raw in parts:
+      column[rows] = _decode_raw(element_cls, kind, raw)
+    columns[key] = column
+
+  return columns
+
+# Concatenates the columns of consecutive parts of a stream, given as
+# (number of packets, columns) pairs. A column missing from some of the parts
+# is filled the same way decode_columns fills missing elements.
+def concat_columns(parts: List[Tuple[int, Dict[str, "numpy.ndarray"]]]) -> Dict[str, "numpy.ndarray"]:
+  import numpy as np
+
+  num_packets = sum(num_rows for num_rows, _ in parts)
+  keys = {}
+  for _, part in parts:
+    keys.update(dict.fromkeys(part))
+
+  columns = {}
+  for key in keys:
+    dtypes = [part[key].dtype for _, part in parts if key in part]
+    if np.dtype(object) in dtypes:
+      column = np.full(num_packets, None, dtype=object)
+    elif len(dtypes) == len(parts) and all(dtype == np.int64 for dtype in dtypes):
+      column = np.zeros(num_packets, dtype=np.int64)
+    else:
+      column = np.full(num_packets, np.nan)
+
+    row = 0
+    for num_rows, part in parts:
+      if key in part:
+        column[row:row + num_rows] = part[key]
+      row += num_rows
+    columns[key] = column
+
+  return columns
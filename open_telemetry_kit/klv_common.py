@@ -1,5 +1,6 @@
 from io import BytesIO
-from typing import Tuple
+import math
+from typing import List, Tuple
 
 def lerp(x: int, x0: int, x1: int, y0: float, y1: float):
   t = (x - x0) / (x1 - x0)
@@ -13,7 +14,10 @@ def bytes_to_float(byte, src: Tuple[int, int], dest: Tuple[float, float]):
   return lerp(i, src[0], src[1], dest[0], dest[1])
 
 def bytes_to_str(byte):
-  return byte.decode("utf-8")
+  # str() rather than byte.decode() so memoryview slices work without a copy.
+  # Corrupted strings get replacement characters rather than failing the
+  # whole packet.
+  return str(byte, "utf-8", "replace")
 
 def read_len(klv_stream: BytesIO):
   length = bytes_to_int(klv_stream.read(1))
@@ -36,3 +40,158 @@ def read_ber_oid(klv_stream: BytesIO):
 
   val = (val << 7) + (byte)
   return val
+
+# MISB ST 1201 IMAPB (Integer Mapping Byte) encoding of floats in [a, b]
+# into length bytes. The constants only depend on the range and the length so
+# they are computed once per element class and length and passed around as
+# (bPow, dPow, sF, sR, zOffset).
+IMAPBParams = Tuple[int, int, float, float, float]
+
+# Leading 5 bits of encoded special values
+_IMAPB_POS_INF = 0b11001
+_IMAPB_NEG_INF = 0b11101
+_IMAPB_NAN = 0b11010
+
+def imapb_params(a: float, b: float, length: int) -> IMAPBParams:
+  b_pow = math.ceil(math.log2(b - a))
+  d_pow = 8 * length - 1
+  s_f = 2.0 ** (d_pow - b_pow)
+  s_r = 2.0 ** (b_pow - d_pow)
+  z_offset = 0.0
+  if a < 0 and b > 0:
+    z_offset = s_f * a - math.floor(s_f * a)
+  return (b_pow, d_pow, s_f, s_r, z_offset)
+
+# Infinities and NaN are encoded as their special values
+def imapb_forward(x: float, a: float, params: IMAPBParams) -> int:
+  _, d_pow, s_f, _, z_offset = params
+  if math.isnan(x):
+    return _IMAPB_NAN << (d_pow - 4)
+  if math.isinf(x):
+    return (_IMAPB_POS_INF if x > 0 else _IMAPB_NEG_INF) << (d_pow - 4)
+  return math.floor(s_f * (x - a) + z_offset)
+
+# Values with the high bit set are special: returns +/-inf or nan for those
+# and None for the remaining (reserved and user defined) ones
+def imapb_reverse(y: int, a: float, params: IMAPBParams) -> float:
+  _, d_pow, _, s_r, z_offset = params
+  if y >= (1 << d_pow):
+    flags = y >> (d_pow - 4)
+    if flags == _IMAPB_POS_INF:
+      return math.inf
+    if flags == _IMAPB_NEG_INF:
+      return -math.inf
+    if flags & _IMAPB_NAN == _IMAPB_NAN:
+      return math.nan
+    return None
+
+  return s_r * (y - z_offset) + a
+
+# Vectorized imapb_reverse over an array of unsigned integers. Reserved
+# values decode to nan.
+def imapb_reverse_array(ys: "numpy.ndarray", a: float, params: IMAPBParams) -> "numpy.ndarray":
+  import numpy as np
+
+  _, d_pow, _, s_r, z_offset = params
+  xs = s_r * (ys - z_offset) + a
+  special = ys >= (1 << d_pow)
+  if special.any():
+    flags = ys >> (d_pow - 4)
+    xs[special] = np.nan
+    xs[special & (flags == _IMAPB_POS_INF)] = np.inf
+    xs[special & (flags == _IMAPB_NEG_INF)] = -np.inf
+  return xs
+
+# MISB ST 0601 checksum: 16-bit running sum where bytes at even offsets from
+# the start of the packet are the high byte and bytes at odd offsets the low
+# byte. Summing the two strided slices avoids a Python level loop per byte.
+def misb_checksum(buf: memoryview, start: int, end: int) -> int:
+  high = sum(buf[start:end:2])
+  low = sum(buf[start + 1:end:2])
+  return ((high << 8) + low) & 0xFFFF
+
+# Sums of values[starts[i]:ends[i]] for spans in order, not overlapping and
+# not empty, with a single np.add.reduceat (which also sums the gaps between
+# spans; those are dropped)
+def _span_sums(values: "numpy.ndarray", starts: "numpy.ndarray", ends: "numpy.ndarray") -> "numpy.ndarray":
+  import numpy as np
+
+  bounds = np.empty(2 * len(starts), dtype=np.int64)
+  bounds[0::2] = starts
+  bounds[1::2] = ends
+  if bounds[-1] == len(values):
+    # The last span runs to the end, which reduceat can't be given as an index
+    bounds = bounds[:-1]
+  return np.add.reduceat(values, bounds, dtype=np.int64)[0::2]
+
+# misb_checksum of each [starts[i], ends[i]) span of buf. Spans must be in
+# stream order, not overlap and be at least 2 bytes long. With NumPy the
+# bytes at even and at odd offsets of buf are summed per span in one pass
+# each, instead of a Python level pass over every packet.
+def misb_checksums(buf: memoryview, starts: List[int], ends: List[int]) -> List[int]:
+  # A few packets (e.g. one UDP datagram) aren't worth the NumPy setup
+  if len(starts) < 16:
+    return [misb_checksum(buf, start, end) for start, end in zip(starts, ends)]
+  try:
+    import numpy as np
+  except ImportError:
+    return [misb_checksum(buf, start, end) for start, end in zip(starts, ends)]
+
+  data = np.frombuffer(buf, dtype=np.uint8)
+  starts = np.asarray(starts, dtype=np.int64)
+  ends = np.asarray(ends, dtype=np.int64)
+  even = _span_sums(data[0::2], (starts + 1) // 2, (ends + 1) // 2)
+  odd = _span_sums(data[1::2], starts // 2, ends // 2)
+  # The byte at a span's start is the high byte
+  odd_start = (starts & 1).astype(bool)
+  high = np.where(odd_start, odd, even)
+  low = np.where(odd_start, even, odd)
+  return (((high << 8) + low) & 0xFFFF).tolist()
+
+def write_len(length: int) -> bytes:
+  if length < 128:
+    return bytes([length])
+
+  num_bytes = (length.bit_length() + 7) // 8
+  return bytes([128 + num_bytes]) + length.to_bytes(num_bytes, byteorder="big")
+
+def write_ber_oid(value: int) -> bytes:
+  if value < 128:
+    return bytes([value])
+
+  oid = [value & 0x7F]
+  value >>= 7
+  while value:
+    oid.append(0x80 | (value & 0x7F))
+    value >>= 7
+  return bytes(reversed(oid))
+
+# The *_at variants work directly on an indexable buffer (bytes or memoryview)
+# and return the parsed value along with the offset just past it.
+# Indexing past the end of the buffer raises IndexError.
+def read_len_at(buf: memoryview, offset: int) -> Tuple[int, int]:
+  length = buf[offset]
+  offset += 1
+
+  if length >= 128:
+    num_bytes = length - 128
+    length = int.from_bytes(buf[offset:offset + num_bytes], byteorder="big")
+    offset += num_bytes
+
+  return (length, offset)
+
+def read_ber_oid_at(buf: memoryview, offset: int) -> Tuple[int, int]:
+  byte = buf[offset]
+  offset += 1
+
+  if byte < 128:
+    return (byte, offset)
+
+  val = 0
+  while byte >= 128:
+    val = (val << 7) + (byte - 128)
+    byte = buf[offset]
+    offset += 1
+
+  val = (val << 7) + (byte)
+  return (val, offset)
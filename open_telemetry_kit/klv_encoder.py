@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+
+from .telemetry import Telemetry
+from .packet import Packet, LazyPacket
+from .misb_0601 import MISB0601, IntMISB, FloatMISB, StrMISB, LocalSetMISB
+from .elements import TimestampElement, ChecksumElement
+from .local_sets import LocalSet
+from .klv_common import misb_checksum, write_len, write_ber_oid, imapb_params, imapb_forward
+
+import logging
+import math
+import struct
+from typing import Any, Callable, Dict, List, Tuple
+
+# MISB ST 0601 encoding of Telemetry, the inverse of KLVParser.
+#
+# The encoding of each element class is worked out once from the same class
+# metadata the decoder uses (misb_tag, _domain, _range, _invalid, _code). Packets
+# are laid out as
+#
+#   universal key, BER length, Precision Time Stamp, other elements in packet
+#   order, Checksum
+#
+# with the checksum computed over the packet as written. Like the decoder's
+# LayoutTemplate, packets with the same elements share a PackTemplate that
+# writes each run of fixed length elements with one struct call, so mostly
+# only the values have to be converted per packet. encode() then copies every
+# packet into a single preallocated bytearray and fills in the checksums.
+#
+# Elements with no MISB encoding (such as the list and pack elements) are
+# left out of every packet, with a warning. Values that can't be represented
+# (None without an _invalid value, non-numeric values, names missing from
+# _code) are left out of their packet and counted in elements_dropped.
+# Packets without a timestamp are skipped and counted in packets_skipped.
+
+UAS_LOCAL_SET_KEY = bytes.fromhex("06 0E 2B 34 02 0B 01 01 0E 01 03 01 01 00 00 00")
+
+# Lengths of the IntMISB elements with a fixed size; the rest are variable
+# length and written in as few bytes as the value needs
+_INT_LENGTHS = {1 : 2, 8 : 1, 9 : 1, 39 : 1, 47 : 1, 56 : 1, 60 : 2, 61 : 1,
+                62 : 2, 65 : 1, 72 : 8, 123 : 1, 124 : 1, 125 : 1, 126 : 1, 131 : 8}
+
+# Lengths of the IMAPB elements
+_IMAPB_LENGTHS = {96 : 3, 103 : 3, 104 : 3, 105 : 3, 109 : 3, 112 : 2, 113 : 3,
+                  114 : 3, 117 : 2, 118 : 2, 119 : 2, 120 : 3, 132 : 3, 134 : 1}
+_DEFAULT_IMAPB_LENGTH = 4
+
+_INT_FORMATS = {1 : 'b', 2 : 'h', 4 : 'i', 8 : 'q'}
+
+_TIMESTAMP_SCALE = {"seconds" : 1e6,
+                    "milliseconds" : 1e3,
+                    "microseconds" : 1}
+
+_TIMESTAMP_HEADER = write_ber_oid(TimestampElement.misb_tag) + write_len(8)
+_CHECKSUM_HEADER = write_ber_oid(ChecksumElement.misb_tag) + write_len(2)
+
+# (header, length, signed, convert). Fixed length elements have their length
+# in header and convert(value) returns the integer to write. Variable length
+# elements (length None) only have their tag in header and convert(value)
+# returns the value's bytes. convert returns None to leave the element out.
+ElementEncoder = Tuple[bytes, int, bool, Callable[[Any], Any]]
+
+def _float_converter(element_cls) -> Callable[[Any], int]:
+  x0, x1 = element_cls._domain
+  y0, y1 = element_cls._range
+  scale = (x1 - x0) / (y1 - y0)
+  invalid = None
+  if isinstance(element_cls._invalid, bytes):
+    invalid = int.from_bytes(element_cls._invalid, byteorder="big", signed=x0 < 0)
+
+  def convert_float(value) -> int:
+    if value is None or value != value:
+      return invalid
+    if math.isinf(value):
+      # round() can't convert infinities, so they are invalid or clamped
+      if invalid is not None:
+        return invalid
+      return x1 if (value > 0) == (scale > 0) else x0
+    i = round(x0 + (value - y0) * scale)
+    if i < x0:
+      return x0
+    if i > x1:
+      return x1
+    return i
+
+  return convert_float
+
+def _imapb_converter(element_cls, length: int) -> Callable[[Any], int]:
+  a, b = element_cls._range
+  params = imapb_params(a, b, length)
+  largest = (1 << params[1]) - 1
+
+  def convert_imapb(value) -> int:
+    if value is None:
+      return None
+    value = float(value)
+    i = imapb_forward(value, a, params)
+    if math.isfinite(value):
+      i = min(max(i, 0), largest)
+    return i
+
+  return convert_imapb
+
+# Enumerations hold the name of their code, or a list of names for bit flags
+# (Positioning Method Source)
+def _code_converter(element_cls) -> Callable[[Any], int]:
+  codes = {name : code for code, name in element_cls._code.items()}
+
+  def convert_code(value) -> int:
+    if isinstance(value, list):
+      if not all(name in codes for name in value):
+        return None
+      return sum(1 << codes[name] for name in value)
+    return codes.get(value)
+
+  return convert_code
+
+def _convert_int(value) -> int:
+  return None if value is None else int(value)
+
+def _convert_var_int(value) -> bytes:
+  if value is None:
+    return None
+  value = int(value)
+  # IntMISB.fromMISB reads values as signed so leave room for the sign bit
+  return value.to_bytes(value.bit_length() // 8 + 1, byteorder="big", signed=True)
+
+def _convert_str(value) -> bytes:
+  return value.encode("utf-8") if isinstance(value, str) else None
+
+def _convert_local_set(value) -> bytes:
+  return bytes(value.buf) if isinstance(value, LocalSet) else None
+
+# Returns the ElementEncoder of element_cls, None if it can't be encoded
+def element_encoder(element_cls) -> ElementEncoder:
+  if not issubclass(element_cls, MISB0601) or not isinstance(element_cls.misb_tag, int):
+    return None
+
+  tag = write_ber_oid(element_cls.misb_tag)
+  from_misb = element_cls.fromMISB.__func__
+  if from_misb is FloatMISB.fromMISB.__func__ and isinstance(element_cls._domain, tuple):
+    x0, x1 = element_cls._domain
+    length = (max(abs(x0), abs(x1)).bit_length() + (x0 < 0) + 7) // 8
+    return (tag + write_len(length), length, x0 < 0, _float_converter(element_cls))
+
+  if from_misb is FloatMISB.fromMISB.__func__ and element_cls._domain == 'IMAPB':
+    length = _IMAPB_LENGTHS.get(element_cls.misb_tag, _DEFAULT_IMAPB_LENGTH)
+    return (tag + write_len(length), length, False, _imapb_converter(element_cls, length))
+
+  if from_misb is IntMISB.fromMISB.__func__ and hasattr(element_cls, "_code"):
+    length = _INT_LENGTHS.get(element_cls.misb_tag, 1)
+    return (tag + write_len(length), length, False, _code_converter(element_cls))
+
+  if from_misb is IntMISB.fromMISB.__func__:
+    length = _INT_LENGTHS.get(element_cls.misb_tag)
+    if length is None:
+      return (tag, None, True, _convert_var_int)
+    return (tag + write_len(length), length, True, _convert_int)
+
+  if from_misb is StrMISB.fromMISB.__func__:
+    return (tag, None, False, _convert_str)
+
+  if from_misb is LocalSetMISB.fromMISB.__func__:
+    return (tag, None, False, _convert_local_set)
+
+  return None
+
+def _timestamp_us(element: TimestampElement) -> int:
+  # Converted here rather than with to_microseconds(), which would change
+  # the element in place
+  return int(element.value * _TIMESTAMP_SCALE[element.state])
+
+# A compiled packet layout: the element classes of a packet, in order.
+# Consecutive fixed length elements (with their headers) are packed by a
+# single struct call; variable length elements are written in between.
+class PackTemplate():
+  def __init__(self, layout: Tuple[type, ...], encoders: Dict[type, ElementEncoder]):
+    # (struct, arguments, slots, None) for runs of fixed length elements, where
+    # slots are the (argument index, element index, convert) of their values,
+    # and (None, header, element index, convert) for variable length elements
+    self.runs = []
+    fmt = ">{}sQ".format(len(_TIMESTAMP_HEADER))
+    args = [_TIMESTAMP_HEADER, 0]
+    slots = [(1, layout.index(TimestampElement), None)]
+    for index, element_cls in enumerate(layout):
+      if element_cls is TimestampElement or element_cls is ChecksumElement:
+        continue
+
+      header, length, signed, convert = encoders[element_cls]
+      if length is None:
+        self.runs.append((struct.Struct(fmt), args, slots, None))
+        self.runs.append((None, header, index, convert))
+        fmt, args, slots = ">", [], []
+        continue
+
+      fmt += "{}s{}".format(len(header), _INT_FORMATS[length] if signed else _INT_FORMATS[length].upper())
+      args.append(header)
+      slots.append((len(args), index, convert))
+      args.append(0)
+
+    fmt += "{}s".format(len(_CHECKSUM_HEADER))
+    args.append(_CHECKSUM_HEADER)
+    self.runs.append((struct.Struct(fmt), args, slots, None))
+
+  # Returns the packet's bytes up to the checksum value, None if a value is
+  # left out or doesn't fit its field
+  def pack(self, elements: List) -> bytes:
+    pieces = []
+    try:
+      for run_struct, args, slots, convert in self.runs:
+        if run_struct is None:
+          value = convert(elements[slots].value)
+          if value is None:
+            return None
+          pieces.append(args + write_len(len(value)) + value)
+          continue
+
+        args = args.copy()
+        for arg_index, element_index, convert in slots:
+          if convert is None:
+            value = _timestamp_us(elements[element_index])
+          else:
+            value = convert(elements[element_index].value)
+            if value is None:
+              return None
+          args[arg_index] = value
+        pieces.append(run_struct.pack(*args))
+    except (struct.error, OverflowError):
+      return None
+
+    body = b"".join(pieces)
+    return UAS_LOCAL_SET_KEY + write_len(len(body) + 2) + body
+
+class KLVEncoder():
+  # Number of times a layout must be seen before it gets a template
+  template_threshold = 2
+  # Distinct layouts tracked (and templates kept)
+  max_layouts = 64
+
+  def __init__(self):
+    self.logger = logging.getLogger("OTK.KLVEncoder")
+    self.packets_skipped = 0
+    # Values left out of their packet, by element name
+    self.elements_dropped = {}
+    self._encoders = {}
+    self._layout_counts = {}
+    self._templates = {}
+
+  def _encoder(self, element_cls) -> ElementEncoder:
+    try:
+      return self._encoders[element_cls]
+    except KeyError:
+      encoder = element_encoder(element_cls)
+      if encoder is None and element_cls is not TimestampElement:
+        self.logger.warn("'{}' has no MISB ST 0601 encoding and will be left out".format(element_cls.name))
+      self._encoders[element_cls] = encoder
+      return encoder
+
+  def _template(self, layout: Tuple[type, ...]) -> PackTemplate:
+    if layout in self._templates:
+      return self._templates[layout]
+
+    count = self._layout_counts.get(layout, 0) + 1
+    if count < self.template_threshold:
+      if len(self._layout_counts) < self.max_layouts:
+        self._layout_counts[layout] = count
+      return None
+    if len(self._templates) >= self.max_layouts:
+      return None
+
+    template = None
+    if layout.count(TimestampElement) == 1:
+      encoders = {}
+      for element_cls in layout:
+        if element_cls is TimestampElement or element_cls is ChecksumElement:
+          continue
+        encoder = self._encoder(element_cls)
+        if encoder is None or (encoder[1] is not None and encoder[1] not in _INT_FORMATS):
+          break
+        encoders[element_cls] = encoder
+      else:
+        template = PackTemplate(layout, encoders)
+
+    self._templates[layout] = template
+    return template
+
+  # Returns the packet's bytes up to the checksum value, None if it has no
+  # timestamp
+  def _pack(self, elements: List) -> bytes:
+    timestamp = None
+    parts = []
+    for element in elements:
+      element_cls = type(element)
+      if element_cls is TimestampElement:
+        timestamp = _timestamp_us(element)
+        continue
+      if element_cls is ChecksumElement:
+        continue
+
+      encoder = self._encoder(element_cls)
+      if encoder is None:
+        continue
+      header, length, _, convert = encoder
+      try:
+        value = convert(element.value)
+        if value is None:
+          self._dropped(element_cls)
+          continue
+        if length is None:
+          parts.append(header + write_len(len(value)) + value)
+        else:
+          # Values too large for the signed range (e.g. a uint8 of 200) are
+          # written unsigned
+          parts.append(header + value.to_bytes(length, byteorder="big", signed=value < 0))
+      except (TypeError, ValueError, OverflowError):
+        self._dropped(element_cls)
+        continue
+
+    if timestamp is None:
+      return None
+    body = _TIMESTAMP_HEADER + timestamp.to_bytes(8, byteorder="big") + b"".join(parts) + _CHECKSUM_HEADER
+    return UAS_LOCAL_SET_KEY + write_len(len(body) + 2) + body
+
+  def _dropped(self, element_cls):
+    self.elements_dropped[element_cls.name] = self.elements_dropped.get(element_cls.name, 0) + 1
+
+  def encode_packet(self, packet: Packet) -> bytes:
+    return bytes(self.encode([packet]))
+
+  def encode(self, tel: Telemetry) -> bytearray:
+    self.packets_skipped = 0
+    self.elements_dropped = {}
+    packed = []
+    total = 0
+    for packet in tel:
+      # LazyPacket decodes its elements on access, other packets hold them
+      elements = list(packet.values() if isinstance(packet, LazyPacket) else packet.data.values())
+      data = None
+      template = self._template(tuple(map(type, elements)))
+      if template is not None:
+        try:
+          data = template.pack(elements)
+        except (TypeError, ValueError, OverflowError):
+          data = None
+      if data is None:
+        data = self._pack(elements)
+        if data is None:
+          self.packets_skipped += 1
+          continue
+      packed.append(data)
+      total += len(data) + 2
+
+    if self.packets_skipped:
+      self.logger.warn("Skipped {} packets without a Precision Time Stamp".format(self.packets_skipped))
+    for name, count in self.elements_dropped.items():
+      self.logger.warn("Left out {} '{}' values that can't be encoded".format(count, name))
+
+    klv = bytearray(total)
+    buf = memoryview(klv)
+    offset = 0
+    for data in packed:
+      end = offset + len(data)
+      buf[offset:end] = data
+      checksum = misb_checksum(buf, offset, end)
+      klv[end] = checksum >> 8
+      klv[end + 1] = checksum & 0xFF
+      offset = end + 2
+
+    return klv
@@ -0,0 +1,147 @@
+from .packet import Packet
+from .element import UnknownElement
+from .misb_0601 import IntMISB, FloatMISB
+from .klv_common import lerp, imapb_reverse, read_len_at, read_ber_oid_at
+
+import struct
+from typing import Any, Callable, Dict, Set, Tuple
+
+# A layout is the ordered (tag, header bytes, value length) of every element in
+# a packet, where the header bytes are the element's encoded tag and length.
+Layout = Tuple[Tuple[int, bytes, int], ...]
+
+_INT_FORMATS = {1 : 'b', 2 : 'h', 4 : 'i', 8 : 'q'}
+
+# Returns the layout of the packet body spanning [offset, packet_end) or None
+# if the packet contains anything a template can't reproduce exactly
+# (zero length elements, lengths that overrun the packet)
+def packet_layout(buf: memoryview, offset: int, packet_end: int) -> Layout:
+  layout = []
+  while offset < packet_end:
+    header_start = offset
+    tag, offset = read_ber_oid_at(buf, offset)
+    elem_len, offset = read_len_at(buf, offset)
+    if elem_len == 0 or offset + elem_len > packet_end:
+      return None
+
+    layout.append((tag, bytes(buf[header_start:offset]), elem_len))
+    offset += elem_len
+
+  if offset != packet_end:
+    return None
+
+  return tuple(layout)
+
+def _int_format(length: int, signed: bool) -> str:
+  fmt = _INT_FORMATS[length]
+  return fmt if signed else fmt.upper()
+
+# Returns the struct format used to unpack a value of the given length along
+# with the function converting the unpacked value into an Element. Plain
+# IntMISB and FloatMISB values are unpacked as integers and converted exactly
+# as their fromMISB would; anything else is unpacked as bytes and handed to
+# fromMISB.
+def _converter(element_cls, length: int) -> Tuple[str, Callable[[Any], Any]]:
+  from_misb = element_cls.fromMISB.__func__
+  if length in _INT_FORMATS:
+    if from_misb is FloatMISB.fromMISB.__func__ and isinstance(element_cls._domain, tuple):
+      x0, x1 = element_cls._domain
+      y0, y1 = element_cls._range
+      signed = x0 < 0
+      invalid = None
+      if isinstance(element_cls._invalid, bytes) and len(element_cls._invalid) == length:
+        invalid = int.from_bytes(element_cls._invalid, byteorder="big", signed=signed)
+
+      def convert_float(i: int):
+        if i == invalid:
+          c = element_cls(0)
+          c.value = None
+          return c
+        return element_cls(lerp(i, x0, x1, y0, y1))
+
+      return (_int_format(length, signed), convert_float)
+
+    if from_misb is FloatMISB.fromMISB.__func__ and element_cls._domain == 'IMAPB':
+      a = element_cls._range[0]
+      params = element_cls.imapbParams(length)
+
+      def convert_imapb(i: int):
+        value = imapb_reverse(i, a, params)
+        if value is None:
+          c = element_cls(0)
+          c.value = None
+          return c
+        return element_cls(value)
+
+      return (_int_format(length, False), convert_imapb)
+
+    if from_misb is IntMISB.fromMISB.__func__:
+      return (_int_format(length, bool(element_cls._signed)), element_cls)
+
+  return ("{}s".format(length), element_cls.fromMISB)
+
+# A compiled packet layout. decode() unpacks every header and value of a
+# matching packet with a single struct call and only has to convert the
+# values, instead of walking the packet tag by tag.
+class LayoutTemplate():
+  def __init__(self, layout: Layout,
+               element_dict: Dict[int, type],
+               use_misb_name: bool = True,
+               tags: Set[int] = None):
+    fmt = ">"
+    header_fmt = ">"
+    headers = []
+    fields = []
+    # (key, element class, value offset, value length) of every requested
+    # element, offsets relative to the start of the packet body. The element
+    # class is None for unrecognized tags.
+    columns = []
+    value_offset = 0
+    for tag, header, elem_len in layout:
+      headers.append(header)
+      fmt += "{}s".format(len(header))
+      header_fmt += "{}s{}x".format(len(header), elem_len)
+      value_offset += len(header)
+
+      if tags is not None and tag not in tags:
+        fmt += "{}s".format(elem_len)
+        fields.append((None, None))
+      elif tag in element_dict:
+        element_cls = element_dict[tag]
+        value_fmt, convert = _converter(element_cls, elem_len)
+        fmt += value_fmt
+        key = element_cls.misb_name if use_misb_name else element_cls.name
+        fields.append((key, convert))
+        columns.append((key, element_cls, value_offset, elem_len))
+      else:
+        fmt += "{}s".format(elem_len)
+        fields.append(("Tag " + str(tag), UnknownElement))
+        columns.append(("Tag " + str(tag), None, value_offset, elem_len))
+
+      value_offset += elem_len
+
+    self.layout = layout
+    self.struct = struct.Struct(fmt)
+    self.header_struct = struct.Struct(header_fmt)
+    self.headers = tuple(headers)
+    self.fields = fields
+    self.columns = columns
+
+  # Whether the packet body starting at offset has this template's layout
+  def matches(self, buf: memoryview, offset: int) -> bool:
+    return self.header_struct.unpack_from(buf, offset) == self.headers
+
+  # Returns the decoded Packet, or None if the packet starting at offset
+  # does not have this template's layout
+  def decode(self, buf: memoryview, offset: int) -> Packet:
+    values = self.struct.unpack_from(buf, offset)
+    if values[0::2] != self.headers:
+      return None
+
+    packet = Packet()
+    data = packet.data
+    for (key, convert), value in zip(self.fields, values[1::2]):
+      if convert is not None:
+        data[key] = convert(value)
+
+    return packet
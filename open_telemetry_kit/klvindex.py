@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+from array import array
+from bisect import bisect_left, bisect_right
+import os
+import struct
+import sys
+from typing import List, Tuple
+
+# Sidecar index of the MISB packets in a KLV stream, built by
+# KLVParser.build_index() and used by KLVParser.read_range().
+#
+# Every packet read() would return is recorded as its Precision Time Stamp
+# (microseconds since epoch), the offset of its universal key in the KLV
+# stream and its length including key and BER length. Entries are sorted by
+# timestamp so the packets of a time window are found with two binary searches.
+#
+# File layout (little endian):
+#   header      magic, number of packets, source size, source mtime_ns
+#   timestamps  int64[number of packets]
+#   offsets     uint64[number of packets]
+#   lengths     uint32[number of packets]
+#
+# The source's size and mtime are stored so a stale index is never used.
+
+_MAGIC = b"OTKKLVI1"
+_HEADER = struct.Struct("<8sQQq")
+
+def sidecar_path(source: str) -> str:
+  return source + ".otkidx"
+
+def _source_stat(source: str) -> Tuple[int, int]:
+  stat = os.stat(source)
+  return stat.st_size, stat.st_mtime_ns
+
+class KLVIndex():
+  def __init__(self, entries: List[Tuple[int, int, int]], source_size: int, source_mtime: int):
+    entries = sorted(entries)
+    self.timestamps = array('q', [entry[0] for entry in entries])
+    self.offsets = array('Q', [entry[1] for entry in entries])
+    self.lengths = array('I', [entry[2] for entry in entries])
+    self.source_size = source_size
+    self.source_mtime = source_mtime
+
+  def __len__(self) -> int:
+    return len(self.timestamps)
+
+  @classmethod
+  def for_source(cls, entries: List[Tuple[int, int, int]], source: str) -> 'KLVIndex':
+    return cls(entries, *_source_stat(source))
+
+  # Returns the (offset, length) of every packet with start_ts <= timestamp
+  # <= end_ts, in stream order
+  def lookup(self, start_ts: int, end_ts: int) -> List[Tuple[int, int]]:
+    lo = bisect_left(self.timestamps, start_ts)
+    hi = bisect_right(self.timestamps, end_ts)
+    return sorted(zip(self.offsets[lo:hi], self.lengths[lo:hi]))
+
+  def is_current(self, source: str) -> bool:
+    try:
+      return _source_stat(source) == (self.source_size, self.source_mtime)
+    except OSError:
+      return False
+
+  def save(self, path: str):
+    with open(path, 'wb') as index_file:
+      index_file.write(_HEADER.pack(_MAGIC, len(self), self.source_size, self.source_mtime))
+      for values in [self.timestamps, self.offsets, self.lengths]:
+        if sys.byteorder == "big":
+          values = array(values.typecode, values)
+          values.byteswap()
+        values.tofile(index_file)
+
+  # Returns None if path is not a readable index
+  @classmethod
+  def load(cls, path: str) -> 'KLVIndex':
+    try:
+      with open(path, 'rb') as index_file:
+        magic, count, source_size, source_mtime = _HEADER.unpack(index_file.read(_HEADER.size))
+        if magic != _MAGIC:
+          return None
+
+        index = cls([], source_size, source_mtime)
+        for values in [index.timestamps, index.offsets, index.lengths]:
+          values.fromfile(index_file, count)
+          if sys.byteorder == "big":
+            values.byteswap()
+    except (OSError, EOFError, struct.error):
+      return None
+
+    return index
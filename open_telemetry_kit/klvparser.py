@@ -1,19 +1,28 @@
 from .parser import Parser
 from .telemetry import Telemetry
-from .packet import Packet
+from .packet import Packet, LazyPacket
 from .element import UnknownElement
 # from .elements import LatitudeElement, LongitudeElement, AltitudeElement
 from .elements import TimestampElement, ChecksumElement
 from .misb_0601 import MISB0601
-from .detector import read_video_metadata, read_klv
-from .klv_common import bytes_to_int
+from .detector import Detection, read_video_metadata, read_klv, stream_klv, split_path
+from .klv_common import bytes_to_int, misb_checksum, misb_checksums, read_len_at, read_ber_oid_at
+from .klv_template import LayoutTemplate, packet_layout
+from .klv_columns import PacketSpan, decode_columns, concat_columns
+from .klvindex import KLVIndex, sidecar_path
+from .tsdemux import TSDemuxer, PESOffsets, read_ts_klv
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
 import xml.etree.ElementTree as ET
 from dateutil import parser as dup
 import logging
+import mmap
 import os
-from typing import List
+import re
+import tempfile
+from typing import Callable, Dict, Iterator, List, Set, Tuple, Union
 
 class KLVParser(Parser):
   tel_type = 'klv'
@@ -21,12 +30,69 @@ class KLVParser(Parser):
           bytes.fromhex("06 0E 2B 34 01 01 01 01 0F 00 00 00 00 00 00 00") : "old_misb",
           bytes.fromhex("06 0E 2B 34 02 05 01 01 0E 01 01 03 11 00 00 00") : "misb_comm_time"}
 
+  _key_pattern = re.compile(b"|".join(re.escape(key) for key in keys))
+
+  # Largest packet iter_packets() will wait for before treating its key as noise
+  max_packet_len = 1 << 20
+  # Number of times a packet layout must be seen before it gets a template
+  template_threshold = 3
+  # Distinct layouts tracked while looking for recurring ones
+  max_layouts = 64
+  # Templates kept per packet length
+  max_templates = 4
+  # Smallest shard worth handing to a separate process when workers > 1
+  min_shard_size = 1 << 20
+  # Extensions of MPEG transport streams, demuxed without ffmpeg
+  ts_extensions = {".ts", ".m2ts", ".mts"}
+
   def __init__(self, source: str,
                is_embedded: bool = True,
-               use_misb_name: bool = True):
+               use_misb_name: bool = True,
+               validate_checksum: bool = False,
+               drop_invalid_checksum: bool = False,
+               lazy: bool = False,
+               use_templates: bool = True,
+               workers: int = 1,
+               detection: Detection = None):
     self.source = source
-    self.use_misb_name = use_misb_name
+    # With a Detection of source its probe output and KLV stream index are
+    # used instead of probing the video again
+    self.detection = detection
+    self.is_embedded = is_embedded
     self.logger = logging.getLogger("OTK.KLVParser")
+    # With workers > 1 read() splits the stream into shards starting at
+    # packet boundaries and decodes them in a pool of worker processes
+    self.workers = workers
+    # With lazy packets are LazyPackets that only record where each element
+    # is and call fromMISB the first time the element is read
+    if lazy and workers > 1:
+      self.logger.warn("Lazy decoding is not supported with multiple workers. Packets will be fully decoded.")
+      lazy = False
+    self.lazy = lazy
+    self.fields = None
+    # misb_tags of the elements requested by fields, None to decode every tag
+    self.tags = None
+    # Packet layouts seen template_threshold times are compiled into a
+    # LayoutTemplate and later packets with the same layout are decoded with
+    # it, falling back to the tag by tag decoder on any mismatch
+    self.use_templates = use_templates
+    self._layout_counts = {}
+    self._templates = {}
+    # With validate_checksum each packet gets packet.metadata["checksum_valid"]
+    # (None if the packet has no checksum). drop_invalid_checksum implies
+    # validation and discards packets whose checksum does not match.
+    self.validate_checksum = validate_checksum or drop_invalid_checksum
+    self.drop_invalid_checksum = drop_invalid_checksum
+    # Number of bytes discarded while searching for a known key during the
+    # last read() or iter_packets()
+    self.bytes_skipped = 0
+    # Where each PES payload starts in the KLV loaded from a transport stream
+    self._pes_offsets = None
+    # (source size, mtime_ns, KLV, PES offsets) of the KLV last extracted
+    # from an embedded source by build_index() or read_range(), so later
+    # read_range() calls don't extract it again
+    self._extracted = None
+    self.use_misb_name = use_misb_name
     self.element_dict = {}
     self._build_dict(MISB0601)
 
@@ -37,13 +103,648 @@ class KLVParser(Parser):
 
       self._build_dict(subcls)
 
-  def read(self):
-    metadata = read_video_metadata(self.source)
-    klv = read_klv(self.source, metadata)
-    self.klv_stream = BytesIO(klv)
+  def read(self, fields: Set[str] = None):
+    self._set_fields(fields)
 
-    return self._parse()
-    
+    self.bytes_skipped = 0
+    if self.workers > 1:
+      tel = Telemetry()
+      for packets in self._read_sharded(columns=False):
+        tel.extend(packets)
+    else:
+      tel = self._decode(self._load())
+    if self.bytes_skipped:
+      self.logger.info("Skipped {} bytes while resynchronising".format(self.bytes_skipped))
+
+    return tel
+
+  # Decodes a KLV stream that is already in memory, e.g. one extracted by
+  # detector.read_all_telemetry(). Always decoded in this process.
+  def read_buffer(self, klv: bytes, fields: Set[str] = None) -> Telemetry:
+    self._set_fields(fields)
+
+    self.bytes_skipped = 0
+    self._pes_offsets = None
+    tel = self._decode(klv)
+    if self.bytes_skipped:
+      self.logger.info("Skipped {} bytes while resynchronising".format(self.bytes_skipped))
+
+    return tel
+
+  # Decodes the stream into one NumPy array per element instead of a
+  # Telemetry, with one row per packet. Keys are the same as the Packet keys
+  # read() would produce. See klv_columns for the dtype of each column.
+  #
+  # With workers > 1 this is the better choice for large captures: shards
+  # come back from the workers as arrays, whereas the Packets read() returns
+  # have to be unpickled one Element at a time by the parent process.
+  def read_columns(self, fields: Set[str] = None) -> Dict[str, "numpy.ndarray"]:
+    self._set_fields(fields)
+
+    self.bytes_skipped = 0
+    if self.workers > 1:
+      return concat_columns(self._read_sharded(columns=True))
+
+    (_, columns), _ = self._decode_range(memoryview(self._load()), 0, None, columns=True)
+    return columns
+
+  # Decodes only the packets whose Precision Time Stamp (microseconds since
+  # epoch) is within [start_ts, end_ts], using the index returned by
+  # load_index(). Packets are returned in stream order.
+  def read_range(self, start_ts: int, end_ts: int, fields: Set[str] = None) -> Telemetry:
+    index = self.load_index()
+    self._set_fields(fields)
+
+    self.bytes_skipped = 0
+    tel = Telemetry()
+    for buf, base, offsets in self._read_runs(index.lookup(start_ts, end_ts)):
+      # Packets demuxed from a transport stream get their pts, as with read()
+      decode_packet = None
+      if self._pes_offsets is not None:
+        decode_packet = self._pts_decoder(self._pes_offsets)
+      for offset in offsets:
+        self._decode_chunk(buf, tel, final=True, decode_packet=decode_packet,
+                           offset=offset - base, stop=offset - base + 1)
+
+    return tel
+
+  # Returns the index stored next to the source, building and saving it
+  # first if it is missing or the source has changed since it was built
+  def load_index(self) -> KLVIndex:
+    path = sidecar_path(self.source)
+    index = KLVIndex.load(path)
+    if index is not None and index.is_current(self.source):
+      return index
+
+    index = self.build_index()
+    try:
+      index.save(path)
+    except OSError:
+      self.logger.warn("Unable to save KLV index to '{}'".format(path))
+    return index
+
+  # Indexes every packet read() would return. Only the timestamp of each
+  # packet is decoded and the packets themselves are discarded.
+  def build_index(self) -> KLVIndex:
+    self._set_fields({TimestampElement.misb_name})
+    entries = []
+
+    def index_packet(buf: memoryview, packet_start: int, packet_end: int) -> Packet:
+      packet = self._decode_misb_packet(buf, packet_start, packet_end)
+      if packet is not None and len(packet):
+        key_start = self._key_start(buf, packet_start, packet_end)
+        timestamp = next(iter(packet.values())).value
+        entries.append((timestamp, key_start, packet_end - key_start))
+      return packet
+
+    self.bytes_skipped = 0
+    self._decode_chunk(memoryview(self._load_extracted()), deque(maxlen=0), final=True, decode_packet=index_packet)
+    return KLVIndex.for_source(entries, self.source)
+
+  # Offset of the key of the packet whose body spans [packet_start, packet_end)
+  def _key_start(self, buf: memoryview, packet_start: int, packet_end: int) -> int:
+    # BER lengths take between 1 and 9 bytes
+    for key_start in range(packet_start - 17, max(packet_start - 26, -1), -1):
+      if bytes(buf[key_start:key_start + 16]) in self.keys and \
+         read_len_at(buf, key_start + 16) == (packet_end - packet_start, packet_start):
+        return key_start
+
+  # Groups the (offset, length) of indexed packets into runs that are read
+  # with a single call. Yields each run's buffer, the stream offset the
+  # buffer starts at and the offsets of its packets.
+  def _read_runs(self, entries: List[Tuple[int, int]]) -> Iterator[Tuple[memoryview, int, List[int]]]:
+    if not entries:
+      return
+
+    _, _, ext = split_path(self.source)
+    if self.is_embedded and ext != ".klv":
+      yield memoryview(self._load_extracted()), 0, [offset for offset, _ in entries]
+      return
+
+    self._pes_offsets = None
+
+    runs = []
+    for offset, length in entries:
+      if runs and offset - runs[-1][1] <= self.max_packet_len:
+        runs[-1][1] = max(runs[-1][1], offset + length)
+        runs[-1][2].append(offset)
+      else:
+        runs.append([offset, offset + length, [offset]])
+
+    with open(self.source, 'rb') as klv_file:
+      for run_start, run_end, offsets in runs:
+        klv_file.seek(run_start)
+        yield memoryview(klv_file.read(run_end - run_start)), run_start, offsets
+
+  # KLV is demuxed from transport streams directly, falling back to ffmpeg if
+  # no KLV stream is found. Packets decoded by read() and iter_packets() from
+  # a transport stream get the PTS of the PES packet that carried them in
+  # packet.metadata["pts"] (90 kHz ticks, None if the PES had no PTS).
+  def _load(self) -> bytes:
+    self._pes_offsets = None
+    _, _, ext = split_path(self.source)
+    if self.is_embedded and ext in self.ts_extensions:
+      pes = read_ts_klv(self.source)
+      if pes is not None:
+        self._pes_offsets = PESOffsets()
+        for pts, payload in pes:
+          self._pes_offsets.append(pts, len(payload))
+        return b"".join(payload for _, payload in pes)
+      self.logger.info("No KLV stream found by the MPEG-TS demuxer. Falling back to ffmpeg...")
+
+    if self.is_embedded and ext != ".klv":
+      metadata, stream_index = self._klv_stream()
+      return read_klv(self.source, metadata, stream_index)
+
+    with open(self.source, 'rb') as klv_file:
+      return klv_file.read()
+
+  # _load(), except that the KLV of an embedded source is kept and reused
+  # until the source changes. Index offsets of an embedded source are offsets
+  # into its extracted KLV, so read_range() can't seek in the video itself.
+  def _load_extracted(self) -> bytes:
+    _, _, ext = split_path(self.source)
+    if not self.is_embedded or ext == ".klv":
+      return self._load()
+
+    stat = os.stat(self.source)
+    signature = (stat.st_size, stat.st_mtime_ns)
+    if self._extracted is None or self._extracted[:2] != signature:
+      self._extracted = None
+      klv = self._load()
+      self._extracted = signature + (klv, self._pes_offsets)
+    self._pes_offsets = self._extracted[3]
+    return self._extracted[2]
+
+  # The probe output of the source and the index of its KLV stream (None to
+  # look it up in the probe output)
+  def _klv_stream(self) -> Tuple[Dict, int]:
+    detection = self.detection
+    if detection is not None and detection.metadata is not None:
+      klv_indices = [stream.index for stream in detection.streams if stream.tel_type == "klv"]
+      return detection.metadata, klv_indices[0] if klv_indices else None
+    return read_video_metadata(self.source), None
+
+  # Decodes the packets starting in [offset, stop) of buf. Returns either a
+  # Telemetry or, with columns, the number of packets and their columns, along
+  # with the offset decoding stopped at.
+  def _decode_range(self, buf: memoryview, offset: int, stop: int, columns: bool):
+    if not columns:
+      tel = Telemetry()
+      stop = self._decode_chunk(buf, tel, final=True, offset=offset, stop=stop)
+      return tel, stop
+
+    entries = []
+    stop = self._decode_chunk(buf, entries, final=True, decode_packet=self._frame_misb_packet,
+                              offset=offset, stop=stop)
+    return (len(entries), decode_columns(buf, entries)), stop
+
+  # Returns the result of _decode_range for every shard of the stream, in
+  # order. Workers map the KLV file rather than receive their shard through a
+  # pipe, so KLV extracted from a video is written to a temporary file first.
+  def _read_sharded(self, columns: bool) -> List:
+    _, _, ext = split_path(self.source)
+    if not self.is_embedded or ext == ".klv":
+      return self._decode_sharded(self.source, columns)
+
+    with tempfile.NamedTemporaryFile(suffix=".klv", delete=False) as klv_file:
+      klv_file.write(self._load())
+    try:
+      return self._decode_sharded(klv_file.name, columns)
+    finally:
+      os.remove(klv_file.name)
+
+  def _decode_sharded(self, path: str, columns: bool) -> List:
+    with open(path, 'rb') as klv_file:
+      size = os.fstat(klv_file.fileno()).st_size
+      if size < 2 * self.min_shard_size:
+        result, _ = self._decode_range(memoryview(klv_file.read()), 0, None, columns)
+        return [result]
+
+      with mmap.mmap(klv_file.fileno(), 0, access=mmap.ACCESS_READ) as klv_map:
+        buf = memoryview(klv_map)
+        try:
+          return self._decode_shards(path, buf, columns)
+        finally:
+          buf.release()
+
+  # Each worker decodes from the start of its shard until it reaches a packet
+  # starting at or after the end of its shard. Shard boundaries are validated
+  # keys but a key can still occur inside a packet; if the previous shard's
+  # last packet ran past the start of a shard, that shard is decoded again
+  # from where the previous one stopped so the result is always identical to
+  # a single process read().
+  def _decode_shards(self, path: str, buf: memoryview, columns: bool) -> List:
+    bounds = self._shard_bounds(buf)
+    options = {"use_misb_name" : self.use_misb_name,
+               "validate_checksum" : self.validate_checksum,
+               "drop_invalid_checksum" : self.drop_invalid_checksum,
+               "use_templates" : self.use_templates}
+
+    results = []
+    with ProcessPoolExecutor(max_workers=self.workers) as executor:
+      futures = [executor.submit(_decode_shard, path, start, end, options, self.fields, columns)
+                 for start, end in zip(bounds, bounds[1:])]
+
+      offset = 0
+      for start, end, future in zip(bounds, bounds[1:], futures):
+        result, stop, bytes_skipped = future.result()
+        if offset != start:
+          self.logger.info("Packet crossed a shard boundary. Decoding shard again...")
+          result, stop = self._decode_range(buf, offset, end, columns)
+        else:
+          self.bytes_skipped += bytes_skipped
+
+        results.append(result)
+        offset = stop
+
+    return results
+
+  # Offsets splitting buf into at most workers shards of at least
+  # min_shard_size bytes, each starting at a known key
+  def _shard_bounds(self, buf: memoryview) -> List[int]:
+    size = len(buf)
+    num_shards = max(1, min(self.workers, size // self.min_shard_size))
+    bounds = [0]
+    for shard in range(1, num_shards):
+      boundary = self._find_boundary(buf, size * shard // num_shards)
+      if boundary is None:
+        break
+      if boundary > bounds[-1]:
+        bounds.append(boundary)
+
+    bounds.append(size)
+    return bounds
+
+  # Returns the offset of the first key at or after offset whose packet is
+  # followed by another key or the end of the stream, or None
+  def _find_boundary(self, buf: memoryview, offset: int) -> int:
+    match = self._key_pattern.search(buf, offset)
+    while match:
+      try:
+        packet_len, packet_start = read_len_at(buf, match.end())
+      except IndexError:
+        return None
+
+      packet_end = packet_start + packet_len
+      if packet_end == len(buf) or bytes(buf[packet_end:packet_end + 16]) in self.keys:
+        return match.start()
+      match = self._key_pattern.search(buf, match.start() + 1)
+
+    return None
+
+  # Incrementally decodes the KLV stream, yielding each Packet as soon as the
+  # chunk containing its last byte has been read. Only the bytes of a partially
+  # received packet are carried over between chunks, so memory use is bounded
+  # by chunk_size + max_packet_len regardless of the length of the stream.
+  def iter_packets(self, fields: Set[str] = None, chunk_size: int = 65536) -> Iterator[Packet]:
+    self._set_fields(fields)
+    _, _, ext = split_path(self.source)
+    pes_offsets = None
+    decode_packet = None
+    if self.is_embedded and ext in self.ts_extensions:
+      pes_offsets = PESOffsets()
+      decode_packet = self._pts_decoder(pes_offsets)
+      chunks = self._demux_chunks(chunk_size, pes_offsets)
+    elif self.is_embedded and ext != ".klv":
+      metadata, stream_index = self._klv_stream()
+      chunks = stream_klv(self.source, metadata, chunk_size, stream_index)
+    else:
+      chunks = self._read_chunks(chunk_size)
+
+    self.bytes_skipped = 0
+    pending = bytearray()
+    for chunk in chunks:
+      pending += chunk
+      packets = []
+      consumed = self._decode_chunk(memoryview(pending), packets, final=False, decode_packet=decode_packet)
+      del pending[:consumed]
+      if pes_offsets is not None:
+        pes_offsets.consume(consumed)
+      yield from packets
+
+    packets = []
+    self._decode_chunk(memoryview(pending), packets, final=True, decode_packet=decode_packet)
+    yield from packets
+
+  # Yields the KLV payloads of the transport stream as they are demuxed,
+  # recording where each PES payload starts in pes_offsets
+  def _demux_chunks(self, chunk_size: int, pes_offsets: PESOffsets) -> Iterator[bytes]:
+    demuxer = TSDemuxer()
+    for data in self._read_chunks(chunk_size):
+      pes = demuxer.feed(data)
+      for pts, payload in pes:
+        pes_offsets.append(pts, len(payload))
+      yield b"".join(payload for _, payload in pes)
+
+    pes = demuxer.flush()
+    for pts, payload in pes:
+      pes_offsets.append(pts, len(payload))
+    yield b"".join(payload for _, payload in pes)
+
+    if not demuxer.klv_pids:
+      self.logger.info("No KLV stream found by the MPEG-TS demuxer. Falling back to ffmpeg...")
+      metadata, stream_index = self._klv_stream()
+      yield from stream_klv(self.source, metadata, chunk_size, stream_index)
+
+  # Wraps _decode_misb_packet to record the PTS of the PES each packet starts in
+  def _pts_decoder(self, pes_offsets: PESOffsets) -> Callable[[memoryview, int, int], Packet]:
+    def decode_with_pts(buf: memoryview, packet_start: int, packet_end: int) -> Packet:
+      packet = self._decode_misb_packet(buf, packet_start, packet_end)
+      if packet is not None:
+        packet.metadata["pts"] = pes_offsets.pts_at(packet_start)
+      return packet
+
+    return decode_with_pts
+
+  # Elements can be requested by either their canonical name or misb_name.
+  # Unrecognized tags are requested as "Tag <n>", matching their packet key.
+  def _set_fields(self, fields: Set[str]):
+    self.fields = fields
+    self._layout_counts = {}
+    self._templates = {}
+    if fields is None:
+      self.tags = None
+      return
+
+    self.tags = {tag for tag, element_cls in self.element_dict.items()
+                 if element_cls.name in fields or element_cls.misb_name in fields}
+    self.tags.update(int(field[4:]) for field in fields
+                     if field.startswith("Tag ") and field[4:].isdigit())
+
+  def _read_chunks(self, chunk_size: int) -> Iterator[bytes]:
+    with open(self.source, 'rb') as klv_file:
+      chunk = klv_file.read(chunk_size)
+      while chunk:
+        yield chunk
+        chunk = klv_file.read(chunk_size)
+
+  # Decodes a complete KLV buffer. Works on a memoryview of the buffer and
+  # tracks an integer offset so element values are handed to fromMISB as
+  # slices of the original buffer rather than copies.
+  def _decode(self, klv: bytes) -> Telemetry:
+    decode_packet = None
+    if self._pes_offsets is not None:
+      decode_packet = self._pts_decoder(self._pes_offsets)
+
+    tel = Telemetry()
+    self._decode_chunk(memoryview(klv), tel, final=True, decode_packet=decode_packet)
+    return tel
+
+  # Appends every packet found in buf to packets and returns the offset up to
+  # which buf has been consumed. When final is False buf is assumed to be
+  # followed by more data: decoding stops at the first packet that is not yet
+  # fully contained in buf so it can be retried once more bytes arrive.
+  #
+  # decode_packet(buf, packet_start, packet_end) decodes a single packet body
+  # and returns None if the packet is invalid. Defaults to _decode_misb_packet.
+  #
+  # Decoding starts at offset and, if stop is given, ends before the first
+  # packet starting at or after stop.
+  def _decode_chunk(self, buf: memoryview, packets: List[Packet], final: bool,
+                    decode_packet: Callable[[memoryview, int, int], Packet] = None,
+                    offset: int = 0, stop: int = None) -> int:
+    if decode_packet is None:
+      decode_packet = self._decode_misb_packet
+
+    # Without drop_invalid_checksum the checksums only annotate the packets,
+    # so they are computed together once the chunk is framed:
+    # (packet, key start, packet end)
+    unchecked = []
+    stream_end = len(buf)
+    while offset < stream_end:
+      if stop is not None and offset >= stop:
+        break
+      if not final and offset + 16 >= stream_end:
+        break
+
+      key = bytes(buf[offset:offset + 16])
+      if key in self.keys:
+        try:
+          packet_len, packet_start = read_len_at(buf, offset + 16)
+        except IndexError:
+          if final:
+            self.logger.warn("Stream ended while reading packet length.")
+            offset = stream_end
+          break
+
+        packet_end = packet_start + packet_len
+        if not final and packet_end > stream_end:
+          if packet_len <= self.max_packet_len:
+            break
+          self.logger.warn("Packet length exceeds max_packet_len. Skipping Packet...")
+          offset = self._resync(buf, offset, final)
+        elif self.keys[key] in ["misb", "old_misb"]:
+          packet = None
+          if packet_end > stream_end:
+            self.logger.warn("Packet extends past the end of the stream. Skipping Packet...")
+          elif not self.validate_checksum:
+            packet = decode_packet(buf, packet_start, packet_end)
+          elif not self.drop_invalid_checksum:
+            packet = decode_packet(buf, packet_start, packet_end)
+            if packet is not None:
+              if self._has_checksum(buf, packet_start, packet_end):
+                unchecked.append((packet, offset, packet_end))
+              else:
+                packet.metadata["checksum_valid"] = None
+          else:
+            checksum_valid = self._check_checksum(buf, offset, packet_start, packet_end)
+            if checksum_valid is False and self.drop_invalid_checksum:
+              self.logger.warn("Packet checksum does not match. Skipping Packet...")
+            else:
+              packet = decode_packet(buf, packet_start, packet_end)
+              if packet is not None:
+                packet.metadata["checksum_valid"] = checksum_valid
+
+          if packet is not None:
+            packets.append(packet)
+            offset = packet_end
+          else:
+            offset = self._resync(buf, offset, final)
+        elif self.keys[key] in ["misb_comm_time"]:
+          self.logger.warn("Unsupported MISB key found. Skipping packet...")
+          offset = packet_end
+      else:
+        offset = self._resync(buf, offset, final)
+
+    if unchecked:
+      checksums = misb_checksums(buf, [key_start for _, key_start, _ in unchecked],
+                                 [packet_end - 2 for _, _, packet_end in unchecked])
+      for (packet, _, packet_end), checksum in zip(unchecked, checksums):
+        packet.metadata["checksum_valid"] = checksum == (buf[packet_end - 2] << 8) | buf[packet_end - 1]
+
+    return min(offset, stream_end)
+
+  # Jumps from a position that does not hold a usable packet to the next
+  # occurrence of any known universal key using a single regex search over
+  # the buffer. If no key is found the rest of the buffer is skipped, except
+  # for a possible partial key at its end when more data is still to come.
+  def _resync(self, buf: memoryview, offset: int, final: bool) -> int:
+    match = self._key_pattern.search(buf, offset + 1)
+    if match:
+      resync_offset = match.start()
+    elif final:
+      resync_offset = len(buf)
+    else:
+      resync_offset = max(offset + 1, len(buf) - 15)
+
+    self.bytes_skipped += resync_offset - offset
+    return resync_offset
+
+  def _has_checksum(self, buf: memoryview, packet_start: int, packet_end: int) -> bool:
+    checksum_start = packet_end - 4
+    if checksum_start < packet_start or buf[checksum_start] != ChecksumElement.misb_tag \
+       or buf[checksum_start + 1] != 2:
+      self.logger.info("Packet does not end with a checksum. Unable to validate.")
+      return False
+    return True
+
+  # Returns whether the checksum of the packet spanning [key_start, packet_end)
+  # matches, or None if the packet does not end with a checksum element
+  def _check_checksum(self, buf: memoryview, key_start: int, packet_start: int, packet_end: int) -> bool:
+    if not self._has_checksum(buf, packet_start, packet_end):
+      return None
+
+    return misb_checksum(buf, key_start, packet_end - 2) == (buf[packet_end - 2] << 8) | buf[packet_end - 1]
+
+  def _decode_misb_packet(self, buf: memoryview, offset: int, packet_end: int) -> Packet:
+    if self.lazy or not self.use_templates:
+      return self._decode_elements(buf, offset, packet_end, self.lazy)
+
+    for template in self._templates.get(packet_end - offset, []):
+      try:
+        packet = template.decode(buf, offset)
+      except Exception as err:
+        self.logger.warn("Unable to decode packet ({}). Skipping Packet...".format(err))
+        return None
+      if packet is not None:
+        return packet
+
+    packet = self._decode_elements(buf, offset, packet_end, lazy=False)
+    if packet is not None:
+      self._learn_layout(buf, offset, packet_end)
+    return packet
+
+  # Used by read_columns: locates the values of a packet without decoding
+  # them. Every clean layout gets a template straight away since compiling
+  # one is much cheaper than framing packets one element at a time.
+  def _frame_misb_packet(self, buf: memoryview, offset: int, packet_end: int) -> Union[PacketSpan, LazyPacket]:
+    templates = self._templates.setdefault(packet_end - offset, [])
+    for template in templates:
+      if template.matches(buf, offset):
+        return PacketSpan(template, offset)
+
+    layout = packet_layout(buf, offset, packet_end)
+    if not layout or layout[0][0] != TimestampElement.misb_tag:
+      return self._decode_elements(buf, offset, packet_end, lazy=True)
+
+    if len(templates) >= self.max_templates:
+      templates.pop(0)
+    template = LayoutTemplate(layout, self.element_dict, self.use_misb_name, self.tags)
+    templates.append(template)
+    return PacketSpan(template, offset)
+
+  def _learn_layout(self, buf: memoryview, offset: int, packet_end: int):
+    layout = packet_layout(buf, offset, packet_end)
+    if layout is None:
+      return
+
+    count = self._layout_counts.get(layout, 0) + 1
+    if count < self.template_threshold:
+      # Keep noisy feeds with ever changing layouts from growing this forever
+      if len(self._layout_counts) >= self.max_layouts:
+        self._layout_counts.clear()
+      self._layout_counts[layout] = count
+      return
+
+    self._layout_counts.pop(layout, None)
+    templates = self._templates.setdefault(packet_end - offset, [])
+    if len(templates) >= self.max_templates:
+      templates.pop(0)
+    templates.append(LayoutTemplate(layout, self.element_dict, self.use_misb_name, self.tags))
+    self.logger.info("Compiled template for recurring {} element packet layout".format(len(layout)))
+
+  def _decode_elements(self, buf: memoryview, offset: int, packet_end: int, lazy: bool) -> Packet:
+    if not lazy:
+      packet = Packet()
+    elif buf.readonly:
+      packet = LazyPacket(buf)
+    else:
+      # The buffer is a view on iter_packets' pending bytes which get
+      # discarded once consumed, so lazy packets keep their own copy
+      packet_start = offset
+      packet = LazyPacket(memoryview(bytes(buf[packet_start:packet_end])))
+
+    # Eager packets are only decoded once the whole packet has been framed:
+    # (key, element class or None if unrecognized, value start, value end)
+    values = []
+    first_packet = True
+    try:
+      while offset < packet_end:
+        tag, offset = read_ber_oid_at(buf, offset)
+
+        if first_packet and tag != TimestampElement.misb_tag:
+          # Per MISB 0601 standard, first tag must be timestamp
+          self.logger.warn("First element in packet was not Timestamp. Skipping Packet...")
+          return None
+        first_packet = False
+
+        elem_len, offset = read_len_at(buf, offset)
+        if offset + elem_len > packet_end:
+          self.logger.warn("Have parsed more bytes than expected. Skipping Packet...")
+          break
+        if elem_len == 0:
+          self.logger.info("Element with 0 length detected. Skipping Element...")
+          continue
+
+        value_start = offset
+        offset += elem_len
+
+        if self.tags is not None and tag not in self.tags:
+          continue
+
+        if tag in self.element_dict:
+          element_cls = self.element_dict[tag]
+          if self.use_misb_name:
+            key = element_cls.misb_name
+          else:
+            key = element_cls.name
+
+          if not lazy:
+            values.append((key, element_cls, value_start, offset))
+          elif packet.buf is buf:
+            packet.data[key] = (element_cls, value_start, elem_len)
+          else:
+            packet.data[key] = (element_cls, value_start - packet_start, elem_len)
+        else:
+          self.logger.warn("Parsed an unrecognized tag. Creating an UnknownElement")
+          if not lazy:
+            values.append(("Tag " + str(tag), None, value_start, offset))
+          else:
+            packet["Tag " + str(tag)] = UnknownElement(bytes(buf[value_start:offset]))
+    except IndexError:
+      self.logger.warn("Stream ended in the middle of a packet. Skipping Packet...")
+      return None
+
+    if offset != packet_end:
+      self.logger.warn("Have not parsed the expected number of bytes. Skipping Packet...")
+      return None
+
+    for key, element_cls, value_start, value_end in values:
+      if element_cls is None:
+        packet[key] = UnknownElement(bytes(buf[value_start:value_end]))
+        continue
+      try:
+        packet[key] = element_cls.fromMISB(buf[value_start:value_end])
+      except Exception as err:
+        # A corrupted value (e.g. a code missing from _code) rejects the
+        # packet like a bad checksum does
+        self.logger.warn("Unable to decode '{}' ({}). Skipping Packet...".format(key, err))
+        return None
+    return packet
+
+  # Legacy BytesIO based decoder. Kept as the reference implementation for
+  # benchmarks/klv_decode.py; read() uses _decode().
   def _parse(self):
     stream_end = self.klv_stream.seek(0, os.SEEK_END)
     self.klv_stream.seek(0, os.SEEK_SET)
@@ -129,4 +830,19 @@ class KLVParser(Parser):
 
     tag = (tag << 7) + (tag_byte)
     return tag
-    
\ No newline at end of file
+    
+# Runs in a worker process of KLVParser._decode_shards: decodes the packets
+# starting in [start, end) of the KLV file at path. Returns the result of
+# KLVParser._decode_range and the number of bytes skipped.
+def _decode_shard(path: str, start: int, end: int, options: Dict, fields: Set[str], columns: bool):
+  parser = KLVParser(path, is_embedded=False, **options)
+  parser._set_fields(fields)
+  with open(path, 'rb') as klv_file:
+    with mmap.mmap(klv_file.fileno(), 0, access=mmap.ACCESS_READ) as klv_map:
+      buf = memoryview(klv_map)
+      try:
+        result, stop = parser._decode_range(buf, start, end, columns)
+      finally:
+        buf.release()
+
+  return result, stop, parser.bytes_skipped
@@ -8,7 +8,7 @@ import io
 import xml.etree.ElementTree as ET
 from dateutil import parser as dup
 import logging
-from typing import List
+from typing import List, Set
 
 class KMLParser(Parser):
   tel_type = 'kml'
@@ -22,7 +22,8 @@ class KMLParser(Parser):
     self.ns = dict()
     self.logger = logging.getLogger("OTK.KMLParser")
 
-  def read(self):
+  def read(self, fields: Set[str] = None):
+    self.fields = fields
     tel = Telemetry()
     tree = ET.parse(self.source)
     self._traverse_tree(tree.getroot(), tel)
@@ -64,9 +65,10 @@ class KMLParser(Parser):
       if tag == "when":
         packet = Packet()
         if self.convert_to_epoch:
-          val = dup.parse(child.text).timestamp()
-          packet[TimestampElement.name] = TimestampElement(val)
-        else:
+          if self._wants(TimestampElement.name):
+            val = dup.parse(child.text).timestamp()
+            packet[TimestampElement.name] = TimestampElement(val)
+        elif self._wants(DatetimeElement.name):
           packet[DatetimeElement.name] = DatetimeElement(child.text)
         packets.append(packet)
       elif tag == "coord":
@@ -86,7 +88,9 @@ class KMLParser(Parser):
           self.logger.warn("No telemetry was found in node. Packet is empty, skipping.")
 
   def _process_coords(self, coords: List[str], packet: Packet):
-      packet[LatitudeElement.name] = LatitudeElement(coords[0]) 
-      packet[LongitudeElement.name] = LongitudeElement(coords[1])
-      if len(coords) == 3:
+      if self._wants(LatitudeElement.name):
+        packet[LatitudeElement.name] = LatitudeElement(coords[0]) 
+      if self._wants(LongitudeElement.name):
+        packet[LongitudeElement.name] = LongitudeElement(coords[1])
+      if len(coords) == 3 and self._wants(AltitudeElement.name):
         packet[AltitudeElement.name] = AltitudeElement(coords[2])
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+from .packet import Packet
+from .klvparser import KLVParser
+from .tsdemux import TSDemuxer, PESOffsets
+
+import asyncio
+import logging
+import socket
+import struct
+import time
+from typing import Callable, Dict, Set
+
+# Live MISB ST 0601 ingest over UDP (unicast or multicast).
+#
+# Datagrams carry either an MPEG transport stream (mpegts=True, e.g. 7 TS
+# packets per datagram) or raw KLV. They are decoded on arrival with the same
+# decoder as KLVParser.iter_packets() and the resulting Packets are queued for
+# the consumer:
+#
+#   async with LiveKLVSource(15000, group="239.0.0.1") as source:
+#     async for packet in source:
+#       ...
+#
+# UDP can't be slowed down, so the queue is bounded: when the consumer falls
+# behind, new packets are dropped and counted in queue_dropped. Every
+# stats_interval seconds the counters and rates are logged, stored in
+# last_stats and passed to on_stats if given.
+
+class LiveKLVSource():
+  def __init__(self, port: int,
+               host: str = "0.0.0.0",
+               group: str = None,
+               interface: str = "0.0.0.0",
+               mpegts: bool = True,
+               fields: Set[str] = None,
+               queue_size: int = 1024,
+               recv_buffer_size: int = 1 << 22,
+               stats_interval: float = 1.0,
+               on_stats: Callable[[Dict[str, float]], None] = None,
+               **parser_args):
+    self.port = port
+    self.host = host
+    self.group = group
+    self.interface = interface
+    self.mpegts = mpegts
+    self.queue_size = queue_size
+    self.recv_buffer_size = recv_buffer_size
+    self.stats_interval = stats_interval
+    self.on_stats = on_stats
+    self.logger = logging.getLogger("OTK.LiveKLVSource")
+
+    source = "udp://{}:{}".format(group or host, port)
+    self.parser = KLVParser(source, is_embedded=False, **parser_args)
+    self.parser._set_fields(fields)
+    self.demuxer = TSDemuxer() if mpegts else None
+
+    # Totals since start()
+    self.datagrams = 0
+    self.bytes_received = 0
+    self.packets = 0
+    self.queue_dropped = 0
+    self.last_stats = None
+
+    self._pending = bytearray()
+    self._pes_offsets = PESOffsets()
+    self._decode_packet = self.parser._pts_decoder(self._pes_offsets) if mpegts else None
+    self._queue = None
+    self._transport = None
+    self._stats_task = None
+    self._closed = False
+
+  async def start(self):
+    # get_event_loop() rather than get_running_loop(), which needs Python 3.7
+    loop = asyncio.get_event_loop()
+    self._queue = asyncio.Queue(maxsize=self.queue_size)
+    self._transport, _ = await loop.create_datagram_endpoint(
+      lambda: _LiveProtocol(self), sock=self._open_socket())
+    self._stats_task = loop.create_task(self._report_stats())
+    self.logger.info("Listening for KLV on {}".format(self.parser.source))
+
+  async def close(self):
+    if self._closed:
+      return
+    self._closed = True
+    if self._transport is not None:
+      self._transport.close()
+    if self._stats_task is not None:
+      self._stats_task.cancel()
+    if self._queue is None:
+      # start() never got as far as creating the queue, so nobody is waiting
+      return
+
+    packets = []
+    self.parser._decode_chunk(memoryview(self._pending), packets, final=True,
+                              decode_packet=self._decode_packet)
+    self._pending.clear()
+    for packet in packets:
+      self._enqueue(packet)
+    # Wake up the consumer, making room for the end marker if needed
+    if self._queue.full():
+      self._queue.get_nowait()
+      self.queue_dropped += 1
+    self._queue.put_nowait(None)
+
+  async def __aenter__(self) -> 'LiveKLVSource':
+    await self.start()
+    return self
+
+  async def __aexit__(self, *exc):
+    await self.close()
+
+  def __aiter__(self) -> 'LiveKLVSource':
+    return self
+
+  async def __anext__(self) -> Packet:
+    packet = await self._queue.get()
+    if packet is None:
+      # Leave the end marker for any other consumer
+      self._queue.put_nowait(None)
+      raise StopAsyncIteration
+    return packet
+
+  def stats(self) -> Dict[str, int]:
+    return {"datagrams" : self.datagrams,
+            "bytes" : self.bytes_received,
+            "packets" : self.packets,
+            "queue_dropped" : self.queue_dropped,
+            "ts_dropped" : self.demuxer.packets_dropped if self.demuxer else 0,
+            "bytes_skipped" : self.parser.bytes_skipped,
+            "queued" : self._queue.qsize() if self._queue else 0}
+
+  def _open_socket(self) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer_size)
+    if self.group:
+      sock.bind(("", self.port))
+      membership = struct.pack("4s4s", socket.inet_aton(self.group), socket.inet_aton(self.interface))
+      sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+    else:
+      sock.bind((self.host, self.port))
+    sock.setblocking(False)
+    return sock
+
+  def _datagram(self, data: bytes):
+    if self._closed:
+      return
+    self.datagrams += 1
+    self.bytes_received += len(data)
+
+    if self.demuxer is not None:
+      pes = self.demuxer.feed(data)
+      for pts, payload in pes:
+        self._pes_offsets.append(pts, len(payload))
+        self._pending += payload
+    else:
+      self._pending += data
+
+    packets = []
+    consumed = self.parser._decode_chunk(memoryview(self._pending), packets, final=False,
+                                         decode_packet=self._decode_packet)
+    del self._pending[:consumed]
+    self._pes_offsets.consume(consumed)
+    for packet in packets:
+      self._enqueue(packet)
+
+  def _enqueue(self, packet: Packet):
+    self.packets += 1
+    try:
+      self._queue.put_nowait(packet)
+    except asyncio.QueueFull:
+      self.queue_dropped += 1
+
+  async def _report_stats(self):
+    last = self.stats()
+    last_time = time.monotonic()
+    while True:
+      await asyncio.sleep(self.stats_interval)
+      now = time.monotonic()
+      current = self.stats()
+      elapsed = now - last_time
+      stats = dict(current)
+      stats["packets_per_s"] = (current["packets"] - last["packets"]) / elapsed
+      stats["bytes_per_s"] = (current["bytes"] - last["bytes"]) / elapsed
+      stats["dropped_per_s"] = (current["queue_dropped"] - last["queue_dropped"]) / elapsed
+      self.last_stats = stats
+      self.logger.info("{:.1f} packets/s, {:.1f} kB/s, {} queued, {} dropped (queue), {} dropped (TS)".format(
+                       stats["packets_per_s"], stats["bytes_per_s"] / 1e3, stats["queued"],
+                       stats["queue_dropped"], stats["ts_dropped"]))
+      if self.on_stats is not None:
+        self.on_stats(stats)
+      last = current
+      last_time = now
+
+class _LiveProtocol(asyncio.DatagramProtocol):
+  def __init__(self, source: LiveKLVSource):
+    self.source = source
+
+  def datagram_received(self, data: bytes, addr):
+    self.source._datagram(data)
+
+  def error_received(self, exc: Exception):
+    self.source.logger.warn("UDP receive error: {}".format(exc))
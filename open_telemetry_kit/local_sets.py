@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+
+from .klv_common import bytes_to_int, bytes_to_float, bytes_to_str, read_len_at, read_ber_oid_at
+from .klv_common import imapb_params, imapb_reverse
+
+from collections.abc import Mapping
+import logging
+from typing import Any, Callable, Dict, Iterator, List, Set, Tuple, Union
+
+logger = logging.getLogger("OTK.local_sets")
+
+# Table-driven decoding of the local sets nested in ST 0601 packets.
+#
+# A LocalSetSpec describes one standard as data: a table mapping each tag to
+# (name, kind, argument), where kind selects one of the value decoders below.
+# A LocalSet is a read-only mapping over the raw bytes of a set. The bytes are
+# only walked (with the BER-OID and BER length routines of klv_common) when
+# the set is first accessed and each value is only decoded when it is first
+# read, so nested sets that are never looked at cost next to nothing.
+#
+# Value kinds:
+#   uint, int      big endian integer
+#   str, utf16     UTF-8 / UTF-16BE string
+#   bytes          raw bytes
+#   enum           unsigned integer looked up in the argument table
+#   float          integer mapped from the argument's (domain, range)
+#   imapb          MISB ST 1201 IMAPB over the argument's (min, max)
+#   set            nested local set of the argument's spec
+#   series         series of BER length prefixed local sets of the argument's spec
+#   element        ST 0601 element class (see ST_0601)
+#
+# Tags missing from a spec are kept as raw bytes under "Tag <n>".
+#
+# A tag listed in a spec's repeatable tags (e.g. the ST 0806 POI and AOI sets)
+# may appear any number of times and its value is the list of every
+# occurrence's value. The items of a series repeated in the same set are
+# joined into one list. Any other repeated tag keeps its last occurrence.
+
+FieldSpec = Tuple[str, str, Any]
+
+class LocalSetSpec():
+  # fields may be a function returning the table, called on first use
+  def __init__(self, name: str,
+               fields: Union[Dict[int, FieldSpec], Callable[[], Dict[int, FieldSpec]]],
+               id_name: str = None, repeatable: Set[int] = frozenset()):
+    self.name = name
+    self._fields = fields
+    # Some packs (e.g. ST 0903 VTarget packs) start with a BER-OID identifier
+    # before their tags
+    self.id_name = id_name
+    self.repeatable = frozenset(repeatable)
+
+  @property
+  def fields(self) -> Dict[int, FieldSpec]:
+    if callable(self._fields):
+      self._fields = self._fields()
+    return self._fields
+
+  def __reduce__(self):
+    return (LocalSetSpec, (self.name, self.fields, self.id_name, self.repeatable))
+
+_imapb_cache = {}
+
+def _decode_imapb(value: bytes, bounds: Tuple[float, float]) -> float:
+  params = _imapb_cache.get((bounds, len(value)))
+  if params is None:
+    params = _imapb_cache[(bounds, len(value))] = imapb_params(bounds[0], bounds[1], len(value))
+  return imapb_reverse(bytes_to_int(value), bounds[0], params)
+
+def _decode_enum(value: bytes, table: Dict[int, str]) -> Union[str, int]:
+  code = bytes_to_int(value)
+  return table.get(code, code)
+
+def _decode_series(value: bytes, spec: LocalSetSpec) -> List['LocalSet']:
+  items = []
+  offset = 0
+  while offset < len(value):
+    item_len, offset = read_len_at(value, offset)
+    items.append(LocalSet(spec, value[offset:offset + item_len]))
+    offset += item_len
+  return items
+
+def _decode_element(value: bytes, element_cls) -> Any:
+  element = element_cls.fromMISB(value)
+  return element.value if element is not None else None
+
+_DECODERS = {"uint" : lambda value, _: bytes_to_int(value),
+             "int" : lambda value, _: bytes_to_int(value, True),
+             "str" : lambda value, _: bytes_to_str(value),
+             "utf16" : lambda value, _: str(value, "utf-16-be"),
+             "bytes" : lambda value, _: bytes(value),
+             "enum" : _decode_enum,
+             "float" : lambda value, scale: bytes_to_float(value, scale[0], scale[1]),
+             "imapb" : _decode_imapb,
+             "set" : lambda value, spec: LocalSet(spec, value),
+             "series" : _decode_series,
+             "element" : _decode_element}
+
+# Values of a set decoded by element.fromMISB may be slices of the whole
+# stream's buffer. Slices of an immutable bytes object are kept as they are;
+# anything else (a bytearray being refilled, an mmap) is copied.
+def _retain(value) -> Union[bytes, memoryview]:
+  if isinstance(value, memoryview) and isinstance(value.obj, bytes):
+    return value
+  return bytes(value)
+
+class LocalSet(Mapping):
+  def __init__(self, spec: LocalSetSpec, buf: Union[bytes, memoryview]):
+    self.spec = spec
+    self.buf = _retain(buf)
+    # key -> (tag, [(offset, length), ...]), built on first access
+    self._index = None
+    self._values = {}
+
+  def __reduce__(self):
+    return (LocalSet, (self.spec, bytes(self.buf)))
+
+  def _build_index(self) -> Dict[str, Tuple[int, List[Tuple[int, int]]]]:
+    index = {}
+    fields = self.spec.fields
+    repeatable = self.spec.repeatable
+    offset = 0
+    buf = self.buf
+    try:
+      if self.spec.id_name is not None:
+        start = offset
+        _, offset = read_ber_oid_at(buf, offset)
+        index[self.spec.id_name] = (None, [(start, offset - start)])
+
+      while offset < len(buf):
+        tag, offset = read_ber_oid_at(buf, offset)
+        elem_len, offset = read_len_at(buf, offset)
+        if offset + elem_len > len(buf):
+          raise IndexError
+        field = fields.get(tag)
+        key = field[0] if field else "Tag " + str(tag)
+        if key in index and (tag in repeatable or (field is not None and field[1] == "series")):
+          index[key][1].append((offset, elem_len))
+        else:
+          index[key] = (tag, [(offset, elem_len)])
+        offset += elem_len
+    except IndexError:
+      logger.warn("{} ended in the middle of an element. Ignoring the rest of the set...".format(self.spec.name))
+
+    return index
+
+  def _get_index(self) -> Dict[str, Tuple[int, List[Tuple[int, int]]]]:
+    if self._index is None:
+      self._index = self._build_index()
+    return self._index
+
+  def __getitem__(self, key: str) -> Any:
+    if key in self._values:
+      return self._values[key]
+
+    tag, spans = self._get_index()[key]
+    if tag in self.spec.repeatable:
+      decoded = [self._decode(key, tag, span) for span in spans]
+    elif len(spans) > 1:
+      # A repeated series
+      decoded = [item for span in spans for item in self._decode(key, tag, span)]
+    else:
+      decoded = self._decode(key, tag, spans[0])
+
+    self._values[key] = decoded
+    return decoded
+
+  def _decode(self, key: str, tag: int, span: Tuple[int, int]) -> Any:
+    offset, length = span
+    value = self.buf[offset:offset + length]
+    if tag is None:
+      return read_ber_oid_at(value, 0)[0]
+    if tag in self.spec.fields:
+      _, kind, arg = self.spec.fields[tag]
+      try:
+        return _DECODERS[kind](value, arg)
+      except (ValueError, IndexError, KeyError):
+        logger.warn("Unable to decode '{}' of {}. Keeping raw bytes...".format(key, self.spec.name))
+    return bytes(value)
+
+  # The undecoded bytes of key's value, for callers with their own decoder: a
+  # list of each occurrence's bytes for repeatable tags and the occurrences
+  # joined together for a repeated series
+  def raw(self, key: str) -> Union[bytes, memoryview, List[Union[bytes, memoryview]]]:
+    tag, spans = self._get_index()[key]
+    values = [self.buf[offset:offset + length] for offset, length in spans]
+    if tag in self.spec.repeatable:
+      return values
+    return values[0] if len(values) == 1 else b"".join(values)
+
+  def __contains__(self, key: str) -> bool:
+    return key in self._get_index()
+
+  def __iter__(self) -> Iterator[str]:
+    return iter(self._get_index())
+
+  def __len__(self) -> int:
+    return len(self._get_index())
+
+  def __repr__(self) -> str:
+    return "LocalSet('{}', {} bytes)".format(self.spec.name, len(self.buf))
+
+  def __str__(self) -> str:
+    return str(self.toJson())
+
+  def toJson(self) -> Dict[str, Any]:
+    return {key : _json_value(self[key]) for key in self}
+
+def _json_value(value: Any) -> Any:
+  if isinstance(value, LocalSet):
+    return value.toJson()
+  if isinstance(value, list):
+    return [_json_value(item) for item in value]
+  if isinstance(value, bytes):
+    return str(value)
+  return value
+
+# MISB ST 0102 Security Metadata Local Set
+
+_CLASSIFICATIONS = {1 : "UNCLASSIFIED",
+                    2 : "RESTRICTED",
+                    3 : "CONFIDENTIAL",
+                    4 : "SECRET",
+                    5 : "TOP SECRET"}
+
+_COUNTRY_CODING_METHODS = {1 : "ISO-3166 Two Letter",
+                           2 : "ISO-3166 Three Letter",
+                           3 : "FIPS 10-4 Two Letter",
+                           4 : "FIPS 10-4 Four Letter",
+                           5 : "ISO-3166 Numeric",
+                           6 : "1059 Two Letter",
+                           7 : "1059 Three Letter",
+                           10 : "FIPS 10-4 Mixed",
+                           11 : "ISO 3166 Mixed",
+                           12 : "STANAG 1059 Mixed",
+                           13 : "GENC Two Letter",
+                           14 : "GENC Three Letter",
+                           15 : "GENC Numeric",
+                           16 : "GENC Mixed",
+                           64 : "GENC AdminSub"}
+
+ST_0102 = LocalSetSpec("Security Local Set", {
+  1 : ("Security Classification", "enum", _CLASSIFICATIONS),
+  2 : ("Classifying Country and Releasing Instructions Country Coding Method", "enum", _COUNTRY_CODING_METHODS),
+  3 : ("Classifying Country", "str", None),
+  4 : ("Security-SCI/SHI Information", "str", None),
+  5 : ("Caveats", "str", None),
+  6 : ("Releasing Instructions", "str", None),
+  7 : ("Classified By", "str", None),
+  8 : ("Derived From", "str", None),
+  9 : ("Classification Reason", "str", None),
+  10 : ("Declassification Date", "str", None),
+  11 : ("Classification and Marking System", "str", None),
+  12 : ("Object Country Coding Method", "enum", _COUNTRY_CODING_METHODS),
+  13 : ("Object Country Codes", "utf16", None),
+  14 : ("Classification Comments", "str", None),
+  15 : ("UMID Video", "bytes", None),
+  16 : ("UMID Audio", "bytes", None),
+  17 : ("UMID Data", "bytes", None),
+  18 : ("UMID System", "bytes", None),
+  19 : ("Stream ID", "uint", None),
+  20 : ("Transport Stream ID", "uint", None),
+  21 : ("Item Designator ID", "bytes", None),
+  22 : ("Version", "uint", None),
+  23 : ("Classifying Country and Releasing Instructions Country Coding Method Version Date", "str", None),
+  24 : ("Object Country Coding Method Version Date", "str", None),
+})
+
+# MISB ST 0806 Remote Video Terminal Local Set
+
+_INT32 = (-(2**31 - 1), 2**31 - 1)
+
+ST_0806_POI = LocalSetSpec("RVT Point of Interest Local Set", {
+  1 : ("POI/AOI Number", "uint", None),
+  2 : ("POI Latitude", "float", (_INT32, (-90, 90))),
+  3 : ("POI Longitude", "float", (_INT32, (-180, 180))),
+  4 : ("POI Altitude", "float", ((0, 2**16 - 1), (-900, 19000))),
+  5 : ("POI/AOI Type", "uint", None),
+  6 : ("POI/AOI Text", "str", None),
+  7 : ("POI/AOI Source Icon", "str", None),
+  8 : ("POI/AOI Label", "str", None),
+  9 : ("Operation ID", "str", None),
+})
+
+ST_0806_AOI = LocalSetSpec("RVT Area of Interest Local Set", {
+  1 : ("POI/AOI Number", "uint", None),
+  5 : ("POI/AOI Type", "uint", None),
+  6 : ("POI/AOI Text", "str", None),
+  8 : ("POI/AOI Label", "str", None),
+  9 : ("Operation ID", "str", None),
+  10 : ("Corner Latitude Point 1", "float", (_INT32, (-90, 90))),
+  11 : ("Corner Longitude Point 1", "float", (_INT32, (-180, 180))),
+  12 : ("Corner Latitude Point 3", "float", (_INT32, (-90, 90))),
+  13 : ("Corner Longitude Point 3", "float", (_INT32, (-180, 180))),
+})
+
+ST_0806 = LocalSetSpec("RVT Local Set", {
+  1 : ("Checksum", "uint", None),
+  2 : ("Precision Time Stamp", "uint", None),
+  3 : ("Platform True Airspeed", "uint", None),
+  4 : ("Platform Indicated Airspeed", "uint", None),
+  5 : ("Telemetry Accuracy Indicator", "bytes", None),
+  6 : ("Frag Circle Radius", "uint", None),
+  7 : ("Frame Code", "uint", None),
+  8 : ("UAS LS Version Number", "uint", None),
+  9 : ("Video Data Rate", "uint", None),
+  10 : ("Digital Video File Format", "str", None),
+  11 : ("User Defined Local Set", "bytes", None),
+  12 : ("Point of Interest Local Set", "set", ST_0806_POI),
+  13 : ("Area of Interest Local Set", "set", ST_0806_AOI),
+}, repeatable={12, 13})
+
+# MISB ST 0903 Video Moving Target Indicator Local Set
+
+ST_0903_VTARGET = LocalSetSpec("VTarget Pack", {
+  1 : ("Target Centroid", "uint", None),
+  2 : ("Boundary Top Left", "uint", None),
+  3 : ("Boundary Bottom Right", "uint", None),
+  4 : ("Target Priority", "uint", None),
+  5 : ("Target Confidence Level", "uint", None),
+  6 : ("Target History", "uint", None),
+  7 : ("Percentage of Target Pixels", "uint", None),
+  8 : ("Target Color", "uint", None),
+  9 : ("Target Intensity", "uint", None),
+  10 : ("Target Location Offset Latitude", "imapb", (-19.2, 19.2)),
+  11 : ("Target Location Offset Longitude", "imapb", (-19.2, 19.2)),
+  12 : ("Target Height", "imapb", (-900, 19000)),
+  13 : ("Bounding Box Top Left Latitude Offset", "imapb", (-19.2, 19.2)),
+  14 : ("Bounding Box Top Left Longitude Offset", "imapb", (-19.2, 19.2)),
+  15 : ("Bounding Box Bottom Right Latitude Offset", "imapb", (-19.2, 19.2)),
+  16 : ("Bounding Box Bottom Right Longitude Offset", "imapb", (-19.2, 19.2)),
+  17 : ("Target Location", "bytes", None),
+  18 : ("Target Boundary Series", "bytes", None),
+  19 : ("Centroid Pixel Row", "uint", None),
+  20 : ("Centroid Pixel Column", "uint", None),
+  21 : ("FPA Index", "bytes", None),
+  22 : ("Algorithm ID", "uint", None),
+  101 : ("VMask Local Set", "bytes", None),
+  102 : ("VObject Local Set", "bytes", None),
+  103 : ("VFeature Local Set", "bytes", None),
+  104 : ("VTracker Local Set", "bytes", None),
+  105 : ("VChip Local Set", "bytes", None),
+  106 : ("VChip Series", "bytes", None),
+  107 : ("VObject Series", "bytes", None),
+}, id_name="Target ID")
+
+ST_0903_ALGORITHM = LocalSetSpec("Algorithm Local Set", {
+  1 : ("ID", "uint", None),
+  2 : ("Name", "str", None),
+  3 : ("Version", "str", None),
+  4 : ("Class", "str", None),
+  5 : ("Number of Frames", "uint", None),
+})
+
+ST_0903_ONTOLOGY = LocalSetSpec("Ontology Local Set", {
+  1 : ("ID", "uint", None),
+  2 : ("Parent ID", "uint", None),
+  3 : ("Ontology", "str", None),
+  4 : ("Ontology Class", "str", None),
+})
+
+ST_0903 = LocalSetSpec("VMTI Local Set", {
+  1 : ("Checksum", "uint", None),
+  2 : ("Precision Time Stamp", "uint", None),
+  3 : ("VMTI System Name", "str", None),
+  4 : ("VMTI LS Version Number", "uint", None),
+  5 : ("Total Number of Targets Detected", "uint", None),
+  6 : ("Number of Reported Targets", "uint", None),
+  7 : ("Motion Imagery Frame Number", "uint", None),
+  8 : ("Frame Width", "uint", None),
+  9 : ("Frame Height", "uint", None),
+  10 : ("VMTI Source Sensor", "str", None),
+  11 : ("VMTI Sensor Horizontal FOV", "imapb", (0, 180)),
+  12 : ("VMTI Sensor Vertical FOV", "imapb", (0, 180)),
+  13 : ("MIIS ID", "bytes", None),
+  101 : ("VTarget Series", "series", ST_0903_VTARGET),
+  102 : ("Algorithm Series", "series", ST_0903_ALGORITHM),
+  103 : ("Ontology Series", "series", ST_0903_ONTOLOGY),
+})
+
+# MISB ST 1607 Segment and Amend Local Sets hold ST 0601 elements, decoded
+# with the ST 0601 element classes themselves
+
+def _st_0601_fields() -> Dict[int, FieldSpec]:
+  from .misb_0601 import MISB0601
+
+  fields = {}
+  def add_subclasses(cls):
+    for subcls in cls.__subclasses__():
+      if isinstance(subcls.misb_tag, int):
+        fields[subcls.misb_tag] = (subcls.misb_name, "element", subcls)
+      add_subclasses(subcls)
+
+  add_subclasses(MISB0601)
+  return fields
+
+ST_0601 = LocalSetSpec("ST 0601 Local Set", _st_0601_fields)
+ST_1607_SEGMENT = LocalSetSpec("Segment Local Set", _st_0601_fields)
+ST_1607_AMEND = LocalSetSpec("Amend Local Set", _st_0601_fields)
+
+# Standards without a table yet: every element is kept as "Tag <n>" bytes
+
+ST_1206 = LocalSetSpec("SAR Motion Imagery Local Set", {})
+ST_1002 = LocalSetSpec("Range Image Local Set", {})
+ST_1601 = LocalSetSpec("Geo-Registration Local Set", {})
+ST_1602 = LocalSetSpec("Composite Imaging Local Set", {})
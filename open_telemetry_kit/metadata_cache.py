@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+import atexit
+import copy
+import json
+import logging
+import os
+import stat
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+# Cache of ffprobe output so a file is probed once per conversion (and, with
+# a persistent store, once per catalog scan) rather than once by the
+# detector and again by every parser.
+#
+# Entries are keyed by absolute path and are only valid while the file's
+# size, mtime (ns) and inode are unchanged; a file that was modified or
+# replaced is probed again. The in-memory cache keeps the max_entries most
+# recently used entries. A store, if given, is checked on a miss and updated
+# on every probe:
+#
+#   cache = MetadataCache(store="probe_cache.sqlite")   # or "probe_cache.json"
+#   detector.set_metadata_cache(cache)
+#
+# The SQLite store can be shared by several processes. The JSON store is
+# written every flush_interval new entries and at exit, merging with what
+# other processes wrote in the meantime; prefer SQLite for large catalogs.
+
+logger = logging.getLogger("OTK.metadata_cache")
+
+# (size, mtime_ns, inode)
+FileStamp = Tuple[int, int, int]
+
+# Raises OSError for missing files and anything that isn't a regular file
+def file_stamp(path: str) -> FileStamp:
+  st = os.stat(path)
+  if not stat.S_ISREG(st.st_mode):
+    raise OSError("'{}' is not a regular file".format(path))
+  return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+class SQLiteMetadataStore():
+  def __init__(self, path: str, timeout: float = 30.0):
+    import sqlite3
+    self.path = path
+    self._lock = threading.Lock()
+    self._db = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+    with self._db:
+      self._db.execute("CREATE TABLE IF NOT EXISTS metadata ("
+                       "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, "
+                       "accessed REAL, json TEXT)")
+
+  def get(self, path: str, stamp: FileStamp) -> Dict[str, Any]:
+    with self._lock:
+      row = self._db.execute("SELECT size, mtime_ns, inode, json FROM metadata WHERE path = ?", (path,)).fetchone()
+    if row is None or tuple(row[:3]) != stamp:
+      return None
+    return json.loads(row[3])
+
+  def put(self, path: str, stamp: FileStamp, metadata: Dict[str, Any]):
+    with self._lock, self._db:
+      self._db.execute("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?, ?)",
+                       (path,) + tuple(stamp) + (time.time(), json.dumps(metadata)))
+
+  def clear(self):
+    with self._lock, self._db:
+      self._db.execute("DELETE FROM metadata")
+
+  def flush(self):
+    pass
+
+  def close(self):
+    with self._lock:
+      self._db.close()
+
+class JSONMetadataStore():
+  # New entries written before the file is rewritten
+  flush_interval = 64
+
+  def __init__(self, path: str):
+    self.path = path
+    self._lock = threading.Lock()
+    self._entries = self._load()
+    self._pending = {}
+    atexit.register(self.flush)
+
+  def _load(self) -> Dict[str, Any]:
+    try:
+      with open(self.path, 'r') as store_file:
+        return json.load(store_file)
+    except FileNotFoundError:
+      return {}
+    except ValueError:
+      logger.warn("Could not read metadata cache '{}'. Starting empty.".format(self.path))
+      return {}
+
+  def get(self, path: str, stamp: FileStamp) -> Dict[str, Any]:
+    with self._lock:
+      entry = self._entries.get(path)
+    if entry is None or tuple(entry["stamp"]) != stamp:
+      return None
+    return copy.deepcopy(entry["metadata"])
+
+  def put(self, path: str, stamp: FileStamp, metadata: Dict[str, Any]):
+    entry = {"stamp" : list(stamp), "metadata" : copy.deepcopy(metadata)}
+    with self._lock:
+      self._entries[path] = entry
+      self._pending[path] = entry
+      flush = len(self._pending) >= self.flush_interval
+    if flush:
+      self.flush()
+
+  def clear(self):
+    with self._lock:
+      self._entries = {}
+      self._pending = {}
+      if os.path.exists(self.path):
+        os.remove(self.path)
+
+  def flush(self):
+    with self._lock:
+      if not self._pending:
+        return
+      # Keep what other processes have written since we loaded
+      entries = self._load()
+      entries.update(self._pending)
+      tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+      with open(tmp_path, 'w') as store_file:
+        json.dump(entries, store_file)
+      os.replace(tmp_path, self.path)
+      self._entries.update(entries)
+      self._pending = {}
+
+  def close(self):
+    self.flush()
+    atexit.unregister(self.flush)
+
+def open_store(path: str):
+  if os.path.splitext(path)[1].lower() == ".json":
+    return JSONMetadataStore(path)
+  return SQLiteMetadataStore(path)
+
+class MetadataCache():
+  def __init__(self, max_entries: int = 256, store = None):
+    # store is a SQLiteMetadataStore, JSONMetadataStore or the path of one
+    # (.json for JSON, anything else for SQLite)
+    if isinstance(store, str):
+      store = open_store(store)
+    self.store = store
+    self.max_entries = max_entries
+    self.hits = 0
+    self.misses = 0
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  def get(self, src: str) -> Dict[str, Any]:
+    path = os.path.abspath(src)
+    try:
+      stamp = file_stamp(path)
+    except OSError:
+      return None
+    metadata = self._get(path, stamp)
+    return copy.deepcopy(metadata) if metadata is not None else None
+
+  def _get(self, path: str, stamp: FileStamp) -> Dict[str, Any]:
+    with self._lock:
+      entry = self._entries.get(path)
+      if entry is not None:
+        if entry[0] == stamp:
+          self._entries.move_to_end(path)
+          self.hits += 1
+          return entry[1]
+        del self._entries[path]
+
+    if self.store is not None:
+      metadata = self.store.get(path, stamp)
+      if metadata is not None:
+        self._remember(path, stamp, metadata)
+        with self._lock:
+          self.hits += 1
+        return metadata
+
+    with self._lock:
+      self.misses += 1
+    return None
+
+  def _remember(self, path: str, stamp: FileStamp, metadata: Dict[str, Any]):
+    with self._lock:
+      self._entries[path] = (stamp, metadata)
+      self._entries.move_to_end(path)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  # The stamp of src to store metadata under, None if src isn't a local file
+  # and can't be cached
+  def stamp(self, src: str) -> FileStamp:
+    try:
+      return file_stamp(os.path.abspath(src))
+    except OSError:
+      return None
+
+  # stamp should be taken before probing src (see get_or_probe); by default
+  # it is taken now
+  def put(self, src: str, metadata: Dict[str, Any], stamp: FileStamp = None):
+    path = os.path.abspath(src)
+    if stamp is None:
+      stamp = self.stamp(path)
+      if stamp is None:
+        return
+    metadata = copy.deepcopy(metadata)
+    self._remember(path, stamp, metadata)
+    if self.store is not None:
+      self.store.put(path, stamp, metadata)
+
+  # Returns the cached metadata of src, calling probe(src) on a miss. Sources
+  # that aren't local files (URLs, devices) are always probed.
+  def get_or_probe(self, src: str, probe: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+    path = os.path.abspath(src)
+    try:
+      stamp = file_stamp(path)
+    except OSError:
+      return probe(src)
+
+    metadata = self._get(path, stamp)
+    if metadata is None:
+      metadata = probe(src)
+      # The stamp from before probing, so a file modified while being
+      # probed is probed again next time
+      self.put(path, metadata, stamp)
+      return metadata
+    return copy.deepcopy(metadata)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self.hits = 0
+      self.misses = 0
+    if self.store is not None:
+      self.store.clear()
+
+  def close(self):
+    if self.store is not None:
+      self.store.close()
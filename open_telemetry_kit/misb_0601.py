@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
 from .klv_common import bytes_to_int, bytes_to_float, bytes_to_str
+from .klv_common import IMAPBParams, imapb_params, imapb_reverse
+from .local_sets import LocalSet, LocalSetSpec
 import logging
 from abc import ABCMeta
 from abc import abstractmethod
@@ -66,6 +68,20 @@ class FloatMISB(MISB0601):
   def _invalid(cls) -> bytes:
     pass
 
+  # ST 1201 constants of IMAPB elements are computed once, when the element
+  # class is defined, for every length up to 8 bytes
+  def __init_subclass__(cls, **kwargs):
+    super().__init_subclass__(**kwargs)
+    if cls.__dict__.get('_domain') == 'IMAPB':
+      cls._imapb = {l : imapb_params(cls._range[0], cls._range[1], l) for l in range(1, 9)}
+
+  @classmethod
+  def imapbParams(cls, length: int) -> IMAPBParams:
+    params = cls._imapb.get(length)
+    if params is None:
+      params = cls._imapb[length] = imapb_params(cls._range[0], cls._range[1], length)
+    return params
+
   @classmethod
   def fromMISB(cls, value):
     if isinstance(cls._invalid, bytes) and value == cls._invalid:
@@ -73,8 +89,12 @@ class FloatMISB(MISB0601):
       c.value = None
       return c
     elif cls._domain == 'IMAPB':
-      l = len(value)
-      return cls(bytes_to_float(value, (0, 2**(8*l)-1), cls._range))
+      value = imapb_reverse(bytes_to_int(value), cls._range[0], cls.imapbParams(len(value)))
+      if value is None:
+        c = cls(0)
+        c.value = None
+        return c
+      return cls(value)
     else:
       return cls(bytes_to_float(value, cls._domain, cls._range))
 
@@ -82,3 +102,16 @@ class StrMISB(MISB0601):
   @classmethod
   def fromMISB(cls, value):
     return cls(bytes_to_str(value))
+
+# Elements holding a nested local set, described by _spec (see local_sets.py).
+# The set is decoded lazily, when its values are first accessed.
+class LocalSetMISB(MISB0601):
+  @property
+  @classmethod
+  @abstractmethod
+  def _spec(cls) -> LocalSetSpec:
+    pass
+
+  @classmethod
+  def fromMISB(cls, value):
+    return cls(LocalSet(cls._spec, value))
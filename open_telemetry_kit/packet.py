@@ -8,6 +8,30 @@ from .element import Element
 class Packet(UserDict):
   def __init__(self, elements: Dict[str, Element] = {}):
     UserDict.__init__(self, elements)
+    # Information about the packet itself rather than the telemetry it
+    # carries (e.g. whether its checksum was valid). Not written by toJson.
+    self.metadata = {}
 
   def toJson(self) -> Dict[str, Element]:
-    return self.data
\ No newline at end of file
+    return self.data
+
+# A Packet whose elements are decoded on first access. Undecoded elements are
+# stored as (element class, offset, length) tuples referring to buf and are
+# replaced by the result of the class' fromMISB the first time they are read.
+class LazyPacket(Packet):
+  def __init__(self, buf: memoryview):
+    Packet.__init__(self)
+    self.buf = buf
+
+  def __getitem__(self, key: str) -> Element:
+    value = self.data[key]
+    if type(value) is tuple:
+      element_cls, offset, length = value
+      value = element_cls.fromMISB(self.buf[offset:offset + length])
+      self.data[key] = value
+    return value
+
+  def toJson(self) -> Dict[str, Element]:
+    for key in self.data:
+      self[key]
+    return self.data
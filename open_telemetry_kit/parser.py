@@ -1,18 +1,38 @@
 from .telemetry import Telemetry
 from .element import Element
+from . import profiling
 from abc import ABCMeta
 from abc import abstractmethod
+import functools
+import os
+from typing import Set
 
 class Parser(metaclass=ABCMeta):
   def __init__(self, source, 
                convert_to_epoch: bool = False,
-               require_timestamp: bool = False):
+               require_timestamp: bool = False,
+               detection: 'Detection' = None):
     self.source = source
     self.convert_to_epoch = convert_to_epoch
     self.require_timestamp = require_timestamp
+    # detector.Detection of source, if already detected. Parsers of embedded
+    # telemetry use its probe output and stream index instead of probing.
+    self.detection = detection
+    # Canonical element names (Element.name) requested from the current read()
+    # None means every element is kept
+    self.fields = None
     self.element_dict = {}
     self.__build_dict(Element)
 
+  # Every subclass's read() and read_buffer() is timed as a "parser.read" or
+  # "parser.read_buffer" stage
+  def __init_subclass__(cls, **kwargs):
+    super().__init_subclass__(**kwargs)
+    if "read" in cls.__dict__:
+      cls.read = _profiled_read(cls.__dict__["read"], "parser.read")
+    if "read_buffer" in cls.__dict__:
+      cls.read_buffer = _profiled_read(cls.__dict__["read_buffer"], "parser.read_buffer")
+
   def __build_dict(self, elem):
     try:
       for name in elem.names:
@@ -35,6 +55,31 @@ class Parser(metaclass=ABCMeta):
   def tel_type(self) -> str:
     pass
 
+  # Elements whose canonical name is not in fields are skipped before they
+  # are constructed. fields=None reads every element.
   @abstractmethod
-  def read(self) -> Telemetry:
-    pass
\ No newline at end of file
+  def read(self, fields: Set[str] = None) -> Telemetry:
+    pass
+
+  def _wants(self, name: str) -> bool:
+    return self.fields is None or name in self.fields
+
+
+def _profiled_read(read, stage_name: str):
+  @functools.wraps(read)
+  def profiled_read(self, *args, **kwargs):
+    if not profiling.enabled():
+      return read(self, *args, **kwargs)
+
+    with profiling.stage(stage_name, parser=type(self).__name__, source=str(self.source)) as s:
+      tel = read(self, *args, **kwargs)
+      num_bytes = None
+      if stage_name == "parser.read_buffer":
+        if args and isinstance(args[0], (bytes, bytearray, memoryview, str)):
+          num_bytes = len(args[0])
+      elif isinstance(self.source, str) and os.path.isfile(self.source):
+        num_bytes = os.path.getsize(self.source)
+      s.count(num_bytes=num_bytes, num_packets=len(tel) if tel is not None else None)
+      return tel
+
+  return profiled_read
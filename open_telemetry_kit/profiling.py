@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+# Timing of the stages of a conversion: probing (detector.read_video_metadata),
+# ffmpeg extraction (detector.read_embedded_subtitles, detector.read_klv),
+# Parser.read and the writers.
+#
+# Stages are only timed while at least one listener is registered. Each
+# finished stage is passed to every listener as a StageRecord; with no
+# listeners stage() returns a shared no-op so instrumented code pays for a
+# single list check.
+#
+#   with Profile() as profile:
+#     tel = create_telemetry_parser("flight.mp4").read()
+#     telemetryToJson(tel, "flight.json")
+#   print(profile.summary())
+#
+# or, to export every stage as it finishes:
+#
+#   add_listener(lambda record: statsd.timing(record.name, record.wall_time))
+#
+# Instrumenting code:
+#
+#   with stage("detector.read_klv", source=src) as s:
+#     klv = ...
+#     s.count(num_bytes=len(klv))
+
+logger = logging.getLogger("OTK.profiling")
+
+_listeners = []
+_local = threading.local()
+
+class StageRecord():
+  def __init__(self, name: str, parent: str, depth: int, metadata: Dict[str, Any]):
+    self.name = name
+    # Name of the enclosing stage on the same thread, None at the top level
+    self.parent = parent
+    self.depth = depth
+    self.metadata = metadata
+    self.wall_time = 0.0
+    # CPU time of this process, and of child processes (ffmpeg, ffprobe) that
+    # were waited for during the stage
+    self.cpu_time = 0.0
+    self.child_cpu_time = 0.0
+    self.num_bytes = None
+    self.num_packets = None
+    # Class name of the exception that ended the stage, if any
+    self.error = None
+
+  def toJson(self) -> Dict[str, Any]:
+    return {"name" : self.name,
+            "parent" : self.parent,
+            "depth" : self.depth,
+            "wall_time" : self.wall_time,
+            "cpu_time" : self.cpu_time,
+            "child_cpu_time" : self.child_cpu_time,
+            "bytes" : self.num_bytes,
+            "packets" : self.num_packets,
+            "error" : self.error,
+            "metadata" : self.metadata}
+
+  def __str__(self) -> str:
+    return str(self.toJson())
+
+  def __repr__(self) -> str:
+    return "StageRecord('{}', {:.6f}s)".format(self.name, self.wall_time)
+
+class _NullStage():
+  __slots__ = ()
+
+  def __enter__(self) -> '_NullStage':
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback) -> bool:
+    return False
+
+  def count(self, num_bytes: int = None, num_packets: int = None):
+    pass
+
+_NULL_STAGE = _NullStage()
+
+def _stack() -> List['_Stage']:
+  try:
+    return _local.stack
+  except AttributeError:
+    _local.stack = []
+    return _local.stack
+
+class _Stage():
+  __slots__ = ("record", "_wall", "_cpu", "_child_cpu")
+
+  def __init__(self, name: str, metadata: Dict[str, Any]):
+    stack = _stack()
+    parent = stack[-1].record.name if stack else None
+    self.record = StageRecord(name, parent, len(stack), metadata)
+
+  def __enter__(self) -> '_Stage':
+    _stack().append(self)
+    times = os.times()
+    self._child_cpu = times.children_user + times.children_system
+    self._cpu = time.process_time()
+    self._wall = time.perf_counter()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback) -> bool:
+    record = self.record
+    record.wall_time = time.perf_counter() - self._wall
+    record.cpu_time = time.process_time() - self._cpu
+    times = os.times()
+    record.child_cpu_time = times.children_user + times.children_system - self._child_cpu
+    if exc_type is not None:
+      record.error = exc_type.__name__
+
+    stack = _stack()
+    if stack and stack[-1] is self:
+      stack.pop()
+
+    for listener in list(_listeners):
+      try:
+        listener(record)
+      except Exception:
+        # Instrumentation must never break a conversion
+        logger.exception("Stage listener {} failed".format(listener))
+    return False
+
+  # Adds to the bytes and packets processed by the stage
+  def count(self, num_bytes: int = None, num_packets: int = None):
+    record = self.record
+    if num_bytes is not None:
+      record.num_bytes = (record.num_bytes or 0) + num_bytes
+    if num_packets is not None:
+      record.num_packets = (record.num_packets or 0) + num_packets
+
+def stage(name: str, **metadata):
+  if not _listeners:
+    return _NULL_STAGE
+  return _Stage(name, metadata)
+
+def enabled() -> bool:
+  return bool(_listeners)
+
+def add_listener(listener: Callable[[StageRecord], None]):
+  if listener not in _listeners:
+    _listeners.append(listener)
+
+def remove_listener(listener: Callable[[StageRecord], None]):
+  if listener in _listeners:
+    _listeners.remove(listener)
+
+# Collects the StageRecords of every stage finished while it is active
+class Profile():
+  def __init__(self):
+    self.records = []
+    self._lock = threading.Lock()
+
+  def __call__(self, record: StageRecord):
+    with self._lock:
+      self.records.append(record)
+
+  def __enter__(self) -> 'Profile':
+    add_listener(self)
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback) -> bool:
+    remove_listener(self)
+    return False
+
+  # Totals per stage name, in the order stages first finished
+  def summary(self) -> Dict[str, Dict[str, Any]]:
+    totals = {}
+    for record in self.records:
+      total = totals.get(record.name)
+      if total is None:
+        total = totals[record.name] = {"calls" : 0, "wall_time" : 0.0, "cpu_time" : 0.0,
+                                       "child_cpu_time" : 0.0, "bytes" : 0, "packets" : 0}
+      total["calls"] += 1
+      total["wall_time"] += record.wall_time
+      total["cpu_time"] += record.cpu_time
+      total["child_cpu_time"] += record.child_cpu_time
+      total["bytes"] += record.num_bytes or 0
+      total["packets"] += record.num_packets or 0
+    return totals
+
+  def toJson(self) -> List[Dict[str, Any]]:
+    return [record.toJson() for record in self.records]
@@ -11,7 +11,7 @@ from datetime import timedelta
 from dateutil import parser as dup
 import re
 import os
-from typing import Dict
+from typing import Dict, Iterable, Set, Tuple, Union
 import logging
 
 class SRTParser(Parser):
@@ -21,33 +21,28 @@ class SRTParser(Parser):
                source: str, 
                is_embedded: bool = False, 
                convert_to_epoch: bool = False, 
-               require_timestamp: bool = False):
+               require_timestamp: bool = False,
+               detection: detector.Detection = None):
     super().__init__(source, 
                      convert_to_epoch = convert_to_epoch, 
-                     require_timestamp = require_timestamp)
+                     require_timestamp = require_timestamp,
+                     detection = detection)
     self.is_embedded = is_embedded
     self.beg_timestamp = 0
     self.convert_to_epoch = convert_to_epoch
     self.logger = logging.getLogger("OTK.SRTParser")
 
-  def read(self) -> Telemetry:
+  def read(self, fields: Set[str] = None) -> Telemetry:
+    self.fields = fields
     tel = Telemetry()
 
     _, _, ext = detector.split_path(self.source)
     if self.is_embedded and ext != ".srt":
       if self.require_timestamp:
-        video_metadata = detector.read_video_metadata(self.source)
-        if video_metadata and "streams" in video_metadata \
-           and "tags" in video_metadata["streams"][0]     \
-           and "creation_time" in video_metadata["streams"][0]["tags"]:
-
-          video_datetime = video_metadata["streams"][0]["tags"]["creation_time"]
-          self.beg_timestamp = dup.parse(video_datetime).timestamp()
-          self.logger.info("Setting video creation time to: {}".format(self.beg_timestamp))
-        else:
-          self.logger.warn("Could not find creation time for video.")
-
-      srt = detector.read_embedded_subtitles(self.source, "srt")
+        self._set_begin_timestamp()
+
+      stream_index = self.detection.stream_index if self.detection is not None else None
+      srt = detector.read_embedded_subtitles(self.source, "srt", stream_index)
       self._process(srt.splitlines(True), tel)
 
     else:
@@ -59,6 +54,33 @@ class SRTParser(Parser):
 
     return tel
 
+  # srt is the subtitles as a string or an iterable of lines (e.g. a text
+  # file). With require_timestamp the creation time of the video is taken
+  # from detection, or by probing source if there is none.
+  def read_buffer(self, srt: Union[str, Iterable[str]], fields: Set[str] = None) -> Telemetry:
+    self.fields = fields
+    tel = Telemetry()
+    if self.require_timestamp and self.is_embedded:
+      self._set_begin_timestamp()
+    if isinstance(srt, str):
+      srt = srt.splitlines(True)
+    self._process(srt, tel)
+
+    if len(tel) == 0:
+      self.logger.warn("No telemetry was found. Returning empty Telemetry()")
+
+    return tel
+
+  def _set_begin_timestamp(self):
+    detection = self.detection
+    if detection is None:
+      detection = detector.Detection(self.source, metadata=detector.read_video_metadata(self.source))
+    if detection.creation_time:
+      self.beg_timestamp = dup.parse(detection.creation_time).timestamp()
+      self.logger.info("Setting video creation time to: {}".format(self.beg_timestamp))
+    else:
+      self.logger.warn("Could not find creation time for video.")
+
   def _process(self, srt: str, tel: Telemetry):
     block = ""
     for line in srt:
@@ -69,8 +91,8 @@ class SRTParser(Parser):
           sec_line_end = block.find('\n', sec_line_beg)
           timeframe = block[sec_line_beg : sec_line_end]
           data = block[sec_line_end + 1 : ]
-          self._extractTimeframe(timeframe, packet)
-          data = self._extractDatetime(data, packet)
+          timeframe = self._extractTimeframe(timeframe, packet)
+          data = self._extractDatetime(data, packet, timeframe)
           self._extractData(data, packet)
           if len(packet) > 0:
             self.logger.debug("Adding new packet.")
@@ -88,22 +110,33 @@ class SRTParser(Parser):
 
   # Example timeframe:
   # 00:00:00,033 --> 00:00:00,066
-  def _extractTimeframe(self, line: str, packet: Dict[str, Element]):
+  # Returns (begin, end) in seconds or None if the timeframe was not parsed
+  def _extractTimeframe(self, line: str, packet: Dict[str, Element]) -> Tuple[float, float]:
+    want_tfb = self._wants(TimeframeBeginElement.name)
+    want_tfe = self._wants(TimeframeEndElement.name)
+    # Other than being stored the timeframe is only used to estimate missing timestamps
+    if not want_tfb and not want_tfe and not self.require_timestamp:
+      return None
+
     sep_pos = line.find("-->")
     if sep_pos > -1:
       tfb = (dup.parse(line[:sep_pos].strip()) - dup.parse("00:00:00")).total_seconds()
-      packet[TimeframeBeginElement.name] = TimeframeBeginElement(tfb)
+      if want_tfb:
+        packet[TimeframeBeginElement.name] = TimeframeBeginElement(tfb)
       tfe = (dup.parse(line[sep_pos+3:].strip()) - dup.parse("00:00:00")).total_seconds()
-      packet[TimeframeEndElement.name] = TimeframeEndElement(tfe)
+      if want_tfe:
+        packet[TimeframeEndElement.name] = TimeframeEndElement(tfe)
+      return (tfb, tfe)
     else:
       # Timeframes in this format are one of the few defined requirements in srt
       # If one wasn't found either parsing failed or this file doesn't follow the standard
       self.logger.error("No timeframe was found. It is likely something went wrong with parsing")
+      return None
 
   # Example datetimes
   # 2019-09-25 01:22:35,118,697
   # Jun 19, 2019 4:47:39 PM
-  def _extractDatetime(self, block: str, packet: Dict[str, Element]):
+  def _extractDatetime(self, block: str, packet: Dict[str, Element], timeframe: Tuple[float, float]):
     # This should find any reasonably formatted (and some not so reasonably formatted) datetimes
     # Looks for:
     # 1+ alphanum, [space, tab, '/', '-',  or .'], 1+ digits, [space, tab, '/', '-',  or .']       Date 
@@ -123,10 +156,11 @@ class SRTParser(Parser):
         dt = dt[:dt.rfind(micro_syn)] + dt[dt.rfind(micro_syn)+1:]
       
       if (self.convert_to_epoch):
-        self.logger.debug("Converting datetime to epoch")
-        dt = dup.parse(dt).timestamp()
-        packet[TimestampElement.name] = TimestampElement(dt)
-      else:
+        if self._wants(TimestampElement.name):
+          self.logger.debug("Converting datetime to epoch")
+          dt = dup.parse(dt).timestamp()
+          packet[TimestampElement.name] = TimestampElement(dt)
+      elif self._wants(DatetimeElement.name):
         packet[DatetimeElement.name] = DatetimeElement(dt)
 
       return block[0 : match.start()] + block[match.end():]
@@ -134,10 +168,10 @@ class SRTParser(Parser):
     elif self.require_timestamp:
       if self.beg_timestamp != 0:
         self.logger.debug("No datetime was found. Using timeframe and video creation time to estimate timestamp")
-        tfb = packet[TimeframeBeginElement.name].value
-        tfe = packet[TimeframeEndElement.name].value
+        tfb, tfe = timeframe
         avg = (tfb+tfe) / 2
-        packet[TimestampElement.name] = TimestampElement(self.beg_timestamp + avg)
+        if self._wants(TimestampElement.name):
+          packet[TimestampElement.name] = TimestampElement(self.beg_timestamp + avg)
 
       else:
         self.logger.critical("Could not find any time elements when require_timestamp was set")
@@ -158,9 +192,8 @@ class SRTParser(Parser):
     else:
       self._extractUnlabledList(block, packet)
 
-    if LatitudeElement.name not in packet or  \
-       LongitudeElement.name not in packet or \
-       AltitudeElement.name not in packet:
+    if any(self._wants(name) and name not in packet
+           for name in (LatitudeElement.name, LongitudeElement.name, AltitudeElement.name)):
       self.logger.warn("No or only partial GPS data found")
 
   # Looks for telemetry of the form:
@@ -196,8 +229,9 @@ class SRTParser(Parser):
         try:
           val = match[0]
           if label in self.element_dict:
-            packet[self.element_dict[label].name] = self.element_dict[label](val)
-          else:
+            if self._wants(self.element_dict[label].name):
+              packet[self.element_dict[label].name] = self.element_dict[label](val)
+          elif self._wants(label):
             self.logger.warn("Adding unknown element ({} : {})".format(label, val))
             packet[label] = UnknownElement(val)
         except:
@@ -234,8 +268,9 @@ class SRTParser(Parser):
         try:
           val = match[0]
           if label in self.element_dict:
-            packet[self.element_dict[label].name] = self.element_dict[label](val)
-          else:
+            if self._wants(self.element_dict[label].name):
+              packet[self.element_dict[label].name] = self.element_dict[label](val)
+          elif self._wants(label):
             self.logger.warn("Adding unknown element ({} : {})".format(label, val))
             packet[label] = UnknownElement(val)
         except:
@@ -258,30 +293,26 @@ class SRTParser(Parser):
       self.logger.error("Could not find GPS coordinates where expected")
 
     if label == "GPS":
-      if block[gps_end - 1] == 'M':
-        packet[LatitudeElement.name] = LatitudeElement(coords[0])
-        packet[LongitudeElement.name] = LongitudeElement(coords[1])
-      #long, lat
-      else:
-        packet[LongitudeElement.name] = LongitudeElement(coords[0])
-        packet[LatitudeElement.name] = LatitudeElement(coords[1])
+      lat_cls, lon_cls, alt_cls = LatitudeElement, LongitudeElement, AltitudeElement
+    else: #label == "HOME"
+      lat_cls, lon_cls, alt_cls = HomeLatitudeElement, HomeLongitudeElement, HomeAltitudeElement
 
-      if len(coords) == 3:
-        # If a 'BAROMETER' value exists this will get overwritten
-        # This is expected and desired behavior
-        packet[AltitudeElement.name] = AltitudeElement(coords[2])
+    #lat, long
+    if block[gps_end - 1] == 'M':
+      lat, lon = coords[0], coords[1]
+    #long, lat
+    else:
+      lon, lat = coords[0], coords[1]
 
-    else: #label == "HOME"
-      if block[gps_end - 1] == 'M':
-        packet[HomeLatitudeElement.name] = HomeLatitudeElement(coords[0])
-        packet[HomeLongitudeElement.name] = HomeLongitudeElement(coords[1])
-      #long, lat
-      else:
-        packet[HomeLongitudeElement.name] = HomeLongitudeElement(coords[0])
-        packet[HomeLatitudeElement.name] = HomeLatitudeElement(coords[1])
+    if self._wants(lat_cls.name):
+      packet[lat_cls.name] = lat_cls(lat)
+    if self._wants(lon_cls.name):
+      packet[lon_cls.name] = lon_cls(lon)
 
-      if len(coords) == 3:
-        packet[HomeAltitudeElement.name] = HomeAltitudeElement(coords[2])
+    if len(coords) == 3 and self._wants(alt_cls.name):
+      # If a 'BAROMETER' value exists this will get overwritten
+      # This is expected and desired behavior
+      packet[alt_cls.name] = alt_cls(coords[2])
 
     return gps_end
 
@@ -304,8 +335,9 @@ class SRTParser(Parser):
       key = data[i]
       if key in self.element_dict:
         element_cls = self.element_dict[key]
-        packet[element_cls.name] = element_cls(data[i+1])
-      else:
+        if self._wants(element_cls.name):
+          packet[element_cls.name] = element_cls(data[i+1])
+      elif self._wants(key):
         self.logger.warn("Adding unknown element ({} : {})".format(key, data[i+1]))
         packet[key] = UnknownElement(data[i+1])
 
@@ -313,8 +345,11 @@ class SRTParser(Parser):
   def _extractUnlabledList(self, block: str, packet: Dict[str, Element]):
     data = block.strip().split(", ")
     if len(data) > 0 and len(data) <= 4:
-      packet[LatitudeElement.name] = LatitudeElement(data[0])
-      packet[LongitudeElement.name] = LongitudeElement(data[1])
-      packet[AltitudeElement.name] = AltitudeElement(data[2].strip('m'))
-      if len(data) > 3:
+      if self._wants(LatitudeElement.name):
+        packet[LatitudeElement.name] = LatitudeElement(data[0])
+      if self._wants(LongitudeElement.name):
+        packet[LongitudeElement.name] = LongitudeElement(data[1])
+      if self._wants(AltitudeElement.name):
+        packet[AltitudeElement.name] = AltitudeElement(data[2].strip('m'))
+      if len(data) > 3 and self._wants(PlatformHeadingAngleElement.name):
         packet[PlatformHeadingAngleElement.name] = PlatformHeadingAngleElement(data[3][0:-1])
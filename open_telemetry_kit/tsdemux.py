@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+
+from bisect import bisect_right
+import logging
+import mmap
+import os
+from typing import List, Tuple
+
+logger = logging.getLogger("OTK.tsdemux")
+
+# Minimal MPEG-TS demuxer extracting KLV metadata (MISB ST 1402) without
+# ffmpeg. Handles 188 byte transport packets and 192 byte M2TS packets.
+#
+# The PAT and PMTs are parsed to find the KLV streams: stream_type 0x15
+# (metadata carried in PES, synchronous KLV) or 0x06 (private data,
+# asynchronous KLV) with a registration or metadata descriptor whose format
+# identifier is "KLVA". The payloads of their PES packets are reassembled and
+# returned along with their PTS (90 kHz ticks, None if the PES has none).
+
+TS_SYNC = 0x47
+TS_PACKET_SIZE = 188
+
+PAT_PID = 0x0000
+PAT_TABLE_ID = 0x00
+PMT_TABLE_ID = 0x02
+KLV_STREAM_TYPES = {0x06, 0x15}
+REGISTRATION_DESCRIPTOR = 0x05
+METADATA_DESCRIPTOR = 0x26
+METADATA_STREAM_ID = 0xFC
+# PES stream_ids whose packets have no optional PES header
+_NO_PES_HEADER = {0xBC, 0xBE, 0xBF, 0xF0, 0xF1, 0xF2, 0xF8, 0xFF}
+
+def _crc32_table() -> List[int]:
+  table = []
+  for byte in range(256):
+    crc = byte << 24
+    for _ in range(8):
+      crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else (crc << 1)
+    table.append(crc & 0xFFFFFFFF)
+  return table
+
+_CRC32_TABLE = _crc32_table()
+
+# CRC-32/MPEG-2. A PSI section including its CRC_32 field yields 0.
+def crc32_mpeg(data: bytes) -> int:
+  crc = 0xFFFFFFFF
+  for byte in data:
+    crc = ((crc << 8) & 0xFFFFFFFF) ^ _CRC32_TABLE[(crc >> 24) ^ byte]
+  return crc
+
+def _read_pts(b: bytes, offset: int) -> int:
+  return (((b[offset] >> 1) & 0x07) << 30) | (b[offset + 1] << 22) | ((b[offset + 2] >> 1) << 15) | \
+         (b[offset + 3] << 7) | (b[offset + 4] >> 1)
+
+def _has_klva(descriptors: bytes) -> bool:
+  offset = 0
+  while offset + 2 <= len(descriptors):
+    tag = descriptors[offset]
+    length = descriptors[offset + 1]
+    body = descriptors[offset + 2:offset + 2 + length]
+    if tag in (REGISTRATION_DESCRIPTOR, METADATA_DESCRIPTOR) and b"KLVA" in body:
+      return True
+    offset += 2 + length
+  return False
+
+# Synchronous metadata (stream_id 0xFC) wraps the KLV in metadata Access Unit
+# cells, each with a 5 byte header ending in the cell's data length. The
+# payload is returned unchanged unless the cells tile it exactly.
+def _strip_au_cells(payload: bytes) -> bytes:
+  cells = []
+  offset = 0
+  while offset + 5 <= len(payload):
+    length = (payload[offset + 3] << 8) | payload[offset + 4]
+    cells.append(payload[offset + 5:offset + 5 + length])
+    offset += 5 + length
+
+  if cells and offset == len(payload):
+    return b"".join(cells)
+  return payload
+
+class TSDemuxer():
+  def __init__(self):
+    self.packet_size = None
+    # PIDs of the PMTs listed in the PAT and of the KLV streams in the PMTs
+    self.pmt_pids = set()
+    self.klv_pids = set()
+    # Number of transport packets dropped because of lost sync, transport
+    # errors or continuity counter discontinuities
+    self.packets_dropped = 0
+    self._pending = b""
+    self._sections = {}
+    self._last_sections = {}
+    self._pes = {}
+    self._continuity = {}
+
+  # Demuxes the next bytes of the transport stream, which may end in the
+  # middle of a transport packet. Returns the (pts, payload) of every KLV
+  # PES packet completed by data.
+  def feed(self, data: bytes) -> List[Tuple[int, bytes]]:
+    if self._pending:
+      data = self._pending + bytes(data)
+    buf = memoryview(data)
+    out = []
+
+    if self.packet_size is None:
+      self.packet_size = self._detect_packet_size(buf)
+      if self.packet_size is None:
+        self._pending = bytes(buf)
+        return out
+
+    size = self.packet_size
+    header = size - TS_PACKET_SIZE
+    offset = 0
+    while offset + size <= len(buf):
+      if buf[offset + header] != TS_SYNC:
+        offset = self._resync(buf, offset)
+        continue
+
+      self._packet(buf, offset + header, out)
+      offset += size
+
+    self._pending = bytes(buf[offset:])
+    return out
+
+  # Returns the KLV PES packets still being assembled at the end of the stream
+  def flush(self) -> List[Tuple[int, bytes]]:
+    out = []
+    for pid in list(self._pes):
+      self._finish_pes(pid, out)
+    return out
+
+  def _detect_packet_size(self, buf: memoryview) -> int:
+    for size in (TS_PACKET_SIZE, 192):
+      header = size - TS_PACKET_SIZE
+      if len(buf) >= 3 * size and all(buf[header + i * size] == TS_SYNC for i in range(3)):
+        return size
+
+    if len(buf) >= 3 * 192:
+      logger.error("Unable to find MPEG-TS sync bytes.")
+      return TS_PACKET_SIZE
+    return None
+
+  # Finds the next offset where two consecutive packets start with sync
+  # bytes, or a single one at the end of buf
+  def _resync(self, buf: memoryview, offset: int) -> int:
+    size = self.packet_size
+    header = size - TS_PACKET_SIZE
+    start = offset
+    offset += 1
+    while offset + header < len(buf):
+      if buf[offset + header] == TS_SYNC and \
+         (offset + header + size >= len(buf) or buf[offset + header + size] == TS_SYNC):
+        break
+      offset += 1
+
+    self.packets_dropped += 1
+    logger.warn("Lost MPEG-TS sync. Skipped {} bytes.".format(offset - start))
+    return offset
+
+  def _packet(self, buf: memoryview, offset: int, out: List[Tuple[int, bytes]]):
+    flags = buf[offset + 1]
+    pid = ((flags & 0x1F) << 8) | buf[offset + 2]
+    if flags & 0x80:
+      self.packets_dropped += 1
+      logger.warn("Transport error in MPEG-TS packet. Skipping Packet...")
+      if pid in self._pes:
+        del self._pes[pid]
+      return
+
+    is_klv = pid in self.klv_pids
+    if not is_klv and pid != PAT_PID and pid not in self.pmt_pids:
+      return
+
+    control = buf[offset + 3]
+    if not control & 0x10:
+      # Adaptation field only
+      return
+
+    continuity = control & 0x0F
+    last = self._continuity.get(pid)
+    self._continuity[pid] = continuity
+    if last == continuity:
+      # Duplicate packet
+      return
+    discontinuity = control & 0x20 and buf[offset + 4] and buf[offset + 5] & 0x80
+    if last is not None and continuity != (last + 1) & 0x0F and not discontinuity:
+      self.packets_dropped += 1
+      if pid in self._pes:
+        logger.warn("MPEG-TS continuity error on PID {}. Dropping PES packet...".format(pid))
+        del self._pes[pid]
+      self._sections.pop(pid, None)
+
+    start = offset + 4
+    if control & 0x20:
+      start += 1 + buf[offset + 4]
+    end = offset + TS_PACKET_SIZE
+    if start >= end:
+      return
+
+    payload = buf[start:end]
+    unit_start = flags & 0x40
+    if is_klv:
+      self._pes_data(pid, unit_start, payload, out)
+    else:
+      self._psi_data(pid, unit_start, payload)
+
+  def _pes_data(self, pid: int, unit_start: int, payload: memoryview, out: List[Tuple[int, bytes]]):
+    if unit_start:
+      self._finish_pes(pid, out)
+      self._pes[pid] = bytearray(payload)
+    elif pid in self._pes:
+      self._pes[pid] += payload
+    else:
+      return
+
+    # Complete PES packets of known length don't have to wait for the next one
+    pes = self._pes[pid]
+    if len(pes) >= 6:
+      length = (pes[4] << 8) | pes[5]
+      if length and len(pes) >= 6 + length:
+        self._finish_pes(pid, out)
+
+  def _finish_pes(self, pid: int, out: List[Tuple[int, bytes]]):
+    pes = self._pes.pop(pid, None)
+    if pes is None:
+      return
+    if len(pes) < 6 or pes[0:3] != b"\x00\x00\x01":
+      logger.warn("Invalid PES packet on PID {}. Skipping Packet...".format(pid))
+      return
+
+    stream_id = pes[3]
+    length = (pes[4] << 8) | pes[5]
+    if length:
+      if len(pes) < 6 + length:
+        logger.warn("Incomplete PES packet on PID {}. Skipping Packet...".format(pid))
+        return
+      del pes[6 + length:]
+
+    pts = None
+    if stream_id in _NO_PES_HEADER:
+      payload = bytes(pes[6:])
+    else:
+      if len(pes) < 9 or len(pes) < 9 + pes[8]:
+        logger.warn("Invalid PES header on PID {}. Skipping Packet...".format(pid))
+        return
+      if pes[7] & 0x80 and pes[8] >= 5:
+        pts = _read_pts(pes, 9)
+      payload = bytes(pes[9 + pes[8]:])
+
+    if stream_id == METADATA_STREAM_ID:
+      payload = _strip_au_cells(payload)
+    out.append((pts, payload))
+
+  def _psi_data(self, pid: int, unit_start: int, payload: memoryview):
+    section = self._sections.get(pid)
+    if unit_start:
+      pointer = payload[0]
+      if section is not None:
+        section += payload[1:1 + pointer]
+        self._parse_sections(pid, section)
+      section = bytearray(payload[1 + pointer:])
+    elif section is None:
+      return
+    else:
+      section += payload
+
+    self._sections[pid] = self._parse_sections(pid, section)
+
+  # Parses every complete section at the start of data and returns the rest,
+  # or None if the rest is stuffing
+  def _parse_sections(self, pid: int, data: bytearray) -> bytearray:
+    while len(data) >= 3 and data[0] != 0xFF:
+      total = 3 + (((data[1] & 0x0F) << 8) | data[2])
+      if len(data) < total:
+        return data
+
+      section = bytes(data[:total])
+      del data[:total]
+      # Tables are repeated constantly; only changed ones are checked and parsed
+      if self._last_sections.get((pid, section[0])) == section:
+        continue
+      if total < 12 or crc32_mpeg(section) != 0:
+        logger.warn("Invalid PSI section on PID {}. Skipping Section...".format(pid))
+        continue
+
+      self._last_sections[(pid, section[0])] = section
+      if pid == PAT_PID and section[0] == PAT_TABLE_ID:
+        self._parse_pat(section)
+      elif pid in self.pmt_pids and section[0] == PMT_TABLE_ID:
+        self._parse_pmt(section)
+
+    return None
+
+  def _parse_pat(self, section: bytes):
+    for offset in range(8, len(section) - 4 - 3, 4):
+      program = (section[offset] << 8) | section[offset + 1]
+      if program != 0:
+        self.pmt_pids.add(((section[offset + 2] & 0x1F) << 8) | section[offset + 3])
+
+  def _parse_pmt(self, section: bytes):
+    program_info_length = ((section[10] & 0x0F) << 8) | section[11]
+    program_descriptors = section[12:12 + program_info_length]
+    offset = 12 + program_info_length
+    end = len(section) - 4
+    while offset + 5 <= end:
+      stream_type = section[offset]
+      pid = ((section[offset + 1] & 0x1F) << 8) | section[offset + 2]
+      info_length = ((section[offset + 3] & 0x0F) << 8) | section[offset + 4]
+      descriptors = section[offset + 5:offset + 5 + info_length]
+      if stream_type in KLV_STREAM_TYPES and \
+         (_has_klva(descriptors) or _has_klva(program_descriptors)):
+        if pid not in self.klv_pids:
+          logger.info("Found KLV stream on PID {}".format(pid))
+        self.klv_pids.add(pid)
+      offset += 5 + info_length
+
+# Start offsets and PTS of PES payloads concatenated into a single buffer.
+# Used to find the PES, and so the PTS, a KLV packet was carried in.
+class PESOffsets():
+  def __init__(self):
+    self.starts = []
+    self.pts = []
+    self.end = 0
+
+  def append(self, pts: int, length: int):
+    self.starts.append(self.end)
+    self.pts.append(pts)
+    self.end += length
+
+  def pts_at(self, offset: int) -> int:
+    idx = bisect_right(self.starts, offset) - 1
+    return self.pts[idx] if idx >= 0 else None
+
+  # Drops the first num_bytes of the buffer
+  def consume(self, num_bytes: int):
+    idx = max(bisect_right(self.starts, num_bytes) - 1, 0)
+    self.starts = [max(start - num_bytes, 0) for start in self.starts[idx:]]
+    self.pts = self.pts[idx:]
+    self.end -= num_bytes
+
+# Returns the (pts, payload) of every KLV PES packet in the transport stream
+# file at src, or None if it has no KLV stream
+def read_ts_klv(src: str) -> List[Tuple[int, bytes]]:
+  demuxer = TSDemuxer()
+  with open(src, 'rb') as ts_file:
+    if os.fstat(ts_file.fileno()).st_size == 0:
+      return None
+
+    with mmap.mmap(ts_file.fileno(), 0, access=mmap.ACCESS_READ) as ts_map:
+      pes = demuxer.feed(ts_map)
+      pes += demuxer.flush()
+
+  if not demuxer.klv_pids:
+    return None
+  return pes
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+from .telemetry import Telemetry
+from .elements import TimestampElement, VMTILocalSetElement
+from .klv_common import read_len_at, read_ber_oid_at
+from .local_sets import LocalSet
+
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, Tuple
+
+# Columnar store of the MISB ST 0903 VTarget packs carried in VMTI local sets
+# (ST 0601 tag 74).
+#
+# A frame can report hundreds of targets, so targets are never turned into
+# objects: the VTarget Series of each VMTI set is walked directly and the
+# fields tracking needs are appended to flat arrays. Frames are stored sorted
+# by timestamp and frame_offsets[i]:frame_offsets[i + 1] are the rows of the
+# targets of frame i.
+#
+# Target columns:
+#   target_id      uint64  Target ID
+#   centroid       uint64  Target Centroid pixel number, 0 if not reported.
+#                          Packs without one that give a Centroid Pixel Row
+#                          and Column use (row - 1) * frame width + column.
+#   top_left       uint64  Boundary Top Left pixel number, 0 if not reported
+#   bottom_right   uint64  Boundary Bottom Right pixel number, 0 if not reported
+#   confidence     int16   Target Confidence Level (0-100), -1 if not reported
+#
+# Pixel numbers count from 1 across rows of frame_widths[i] pixels; see
+# pixel_to_row_col().
+#
+#   tel = KLVParser("flight.ts").read(fields={"Precision Time Stamp", "VMTI Local Set"})
+#   targets = VMTITargets.fromTelemetry(tel)
+#   rows = targets.range(start_ts, end_ts)
+
+_TARGET_COLUMNS = [("target_id", 'Q'),
+                   ("centroid", 'Q'),
+                   ("top_left", 'Q'),
+                   ("bottom_right", 'Q'),
+                   ("confidence", 'h')]
+
+_VTARGET_SERIES = "VTarget Series"
+_FRAME_WIDTH = "Frame Width"
+_TIMESTAMP = "Precision Time Stamp"
+
+def pixel_to_row_col(pixel: int, frame_width: int) -> Tuple[int, int]:
+  return divmod(pixel - 1, frame_width)
+
+class VMTITargets():
+  def __init__(self):
+    self.timestamps = array('q')
+    self.frame_offsets = array('Q', [0])
+    self.frame_widths = array('I')
+    self.columns = {name : array(typecode) for name, typecode in _TARGET_COLUMNS}
+
+  def __len__(self) -> int:
+    return len(self.columns["target_id"])
+
+  @property
+  def num_frames(self) -> int:
+    return len(self.timestamps)
+
+  @classmethod
+  def fromTelemetry(cls, tel: Telemetry) -> 'VMTITargets':
+    return cls.fromFrames(_telemetry_frames(tel))
+
+  # From the output of KLVParser.read_columns()
+  @classmethod
+  def fromColumns(cls, columns: Dict[str, Any]) -> 'VMTITargets':
+    vmti_sets = _column(columns, VMTILocalSetElement)
+    if vmti_sets is None:
+      return cls()
+    timestamps = _column(columns, TimestampElement)
+    if timestamps is None:
+      timestamps = [None] * len(vmti_sets)
+    return cls.fromFrames(zip(timestamps, vmti_sets))
+
+  # frames yields (timestamp, VMTI LocalSet) pairs, in any order. Frames
+  # without a packet timestamp (None or NaN) use the VMTI set's own
+  # Precision Time Stamp and are dropped if it has none either.
+  @classmethod
+  def fromFrames(cls, frames: Iterable[Tuple[int, LocalSet]]) -> 'VMTITargets':
+    timed = []
+    for ts, vmti in frames:
+      if vmti is None:
+        continue
+      if ts is None or ts != ts:
+        ts = vmti.get(_TIMESTAMP)
+      if ts is not None:
+        timed.append((int(ts), vmti))
+    frames = sorted(timed, key=lambda frame: frame[0])
+
+    targets = cls()
+    for ts, vmti in frames:
+      targets._add_frame(ts, vmti)
+    return targets
+
+  def _add_frame(self, timestamp: int, vmti: LocalSet):
+    frame_width = vmti.get(_FRAME_WIDTH) or 0
+    self.timestamps.append(timestamp)
+    self.frame_widths.append(frame_width)
+    if _VTARGET_SERIES in vmti:
+      self._add_targets(vmti.raw(_VTARGET_SERIES), frame_width)
+    self.frame_offsets.append(len(self))
+
+  # Walks a VTarget Series: BER length prefixed packs, each a BER-OID
+  # Target ID followed by tags
+  def _add_targets(self, series: memoryview, frame_width: int):
+    target_ids = self.columns["target_id"]
+    centroids = self.columns["centroid"]
+    top_lefts = self.columns["top_left"]
+    bottom_rights = self.columns["bottom_right"]
+    confidences = self.columns["confidence"]
+
+    # Indexing bytes is cheaper than indexing a memoryview
+    series = bytes(series)
+    offset = 0
+    end = len(series)
+    try:
+      while offset < end:
+        pack_len, offset = read_len_at(series, offset)
+        pack_end = min(offset + pack_len, end)
+        target_id, pos = read_ber_oid_at(series, offset)
+        # Indexed by tag: centroid, top left, bottom right, priority, confidence
+        values = [None, 0, 0, 0, 0, -1]
+        row = column = 0
+        while pos < pack_end:
+          # Tags and lengths are almost always a single byte
+          tag = series[pos]
+          length = series[pos + 1]
+          if tag < 128 and length < 128:
+            pos += 2
+          else:
+            tag, pos = read_ber_oid_at(series, pos)
+            length, pos = read_len_at(series, pos)
+          if 0 < tag <= 5:
+            values[tag] = int.from_bytes(series[pos:pos + length], byteorder="big")
+          elif tag == 19:
+            row = int.from_bytes(series[pos:pos + length], byteorder="big")
+          elif tag == 20:
+            column = int.from_bytes(series[pos:pos + length], byteorder="big")
+          pos += length
+
+        # Rows and columns count from 1
+        if values[1] == 0 and row and column and frame_width:
+          values[1] = (row - 1) * frame_width + column
+
+        target_ids.append(target_id)
+        centroids.append(values[1])
+        top_lefts.append(values[2])
+        bottom_rights.append(values[3])
+        confidences.append(values[5])
+        offset = pack_end
+    except IndexError:
+      # A truncated pack; keep the targets read so far
+      pass
+
+  def _rows(self, first_frame: int, last_frame: int) -> Dict[str, array]:
+    lo = self.frame_offsets[first_frame]
+    hi = self.frame_offsets[last_frame]
+    rows = {name : values[lo:hi] for name, values in self.columns.items()}
+    timestamps = array('q')
+    for frame in range(first_frame, last_frame):
+      count = self.frame_offsets[frame + 1] - self.frame_offsets[frame]
+      timestamps.extend([self.timestamps[frame]] * count)
+    rows["timestamp"] = timestamps
+    return rows
+
+  # The targets of the frame with the given timestamp (empty if there is no
+  # such frame)
+  def frame(self, timestamp: int) -> Dict[str, array]:
+    first = bisect_left(self.timestamps, timestamp)
+    last = bisect_right(self.timestamps, timestamp, first)
+    return self._rows(first, last)
+
+  # The targets of every frame with start_ts <= timestamp <= end_ts, in
+  # timestamp order, with a timestamp column giving each target's frame
+  def range(self, start_ts: int, end_ts: int) -> Dict[str, array]:
+    first = bisect_left(self.timestamps, start_ts)
+    last = bisect_right(self.timestamps, end_ts, first)
+    return self._rows(first, max(first, last))
+
+def _column(columns: Dict[str, Any], element_cls):
+  column = columns.get(element_cls.misb_name)
+  if column is None:
+    column = columns.get(element_cls.name)
+  return column
+
+def _element_value(packet, element_cls):
+  element = packet.get(element_cls.misb_name)
+  if element is None:
+    element = packet.get(element_cls.name)
+  return element.value if element is not None else None
+
+def _telemetry_frames(tel: Telemetry) -> Iterable[Tuple[int, LocalSet]]:
+  for packet in tel:
+    vmti = _element_value(packet, VMTILocalSetElement)
+    if vmti is not None:
+      yield (_element_value(packet, TimestampElement), vmti)
@@ -3,20 +3,45 @@
 from .telemetry import Telemetry
 from .packet import Packet
 from .element import Element
+from .profiling import stage
+
+import os
 
 def telemetryToJson(tel: Telemetry, file: str, ind: int = 3):
   import json
-  with open(file, 'w') as f:
-    json.dump(tel, f, default=lambda o: o.toJson(), indent=ind)
+  with stage("writers.telemetryToJson", file=file) as s:
+    with open(file, 'w') as f:
+      json.dump(tel, f, default=lambda o: o.toJson(), indent=ind)
+    s.count(num_bytes=os.path.getsize(file), num_packets=len(tel))
 
 def telemetryToJsonStream(tel: Telemetry, ind: int = 3):
   import json
-  return json.dumps(tel, default=lambda o: o.toJson(), indent=ind)
+  with stage("writers.telemetryToJsonStream") as s:
+    json_str = json.dumps(tel, default=lambda o: o.toJson(), indent=ind)
+    s.count(num_bytes=len(json_str), num_packets=len(tel))
+  return json_str
 
 def telemetryToCSV(tel: Telemetry, file: str):
   import csv
-  with open(file, 'w') as f:
-    writer = csv.DictWriter(f, fieldnames=tel[0].keys())
-    writer.writeheader()
-    for packet in tel:
-      writer.writerow(packet)
\ No newline at end of file
+  with stage("writers.telemetryToCSV", file=file) as s:
+    with open(file, 'w') as f:
+      writer = csv.DictWriter(f, fieldnames=tel[0].keys())
+      writer.writeheader()
+      for packet in tel:
+        writer.writerow(packet)
+    s.count(num_bytes=os.path.getsize(file), num_packets=len(tel))
+
+def telemetryToKLV(tel: Telemetry, file: str):
+  from .klv_encoder import KLVEncoder
+  with stage("writers.telemetryToKLV", file=file) as s:
+    with open(file, 'wb') as f:
+      klv = KLVEncoder().encode(tel)
+      f.write(klv)
+    s.count(num_bytes=len(klv), num_packets=len(tel))
+
+def telemetryToKLVStream(tel: Telemetry) -> bytes:
+  from .klv_encoder import KLVEncoder
+  with stage("writers.telemetryToKLVStream") as s:
+    klv = bytes(KLVEncoder().encode(tel))
+    s.count(num_bytes=len(klv), num_packets=len(tel))
+  return klv
@@ -48,10 +48,9 @@ telemetry = parser.read()
 write.telemetryToJson(telemetry, dest)
 
 # Example telemetry manipulation
-# Filters out anything thats not a GPS element
-# gps = Telemetry()
-# for packet in telemetry:
-#   gps.append({ k:v for k, v in packet.items() if k in ['latitude', 'longitude', 'altitude']})
+# Only reads GPS elements. Anything else is skipped by the parser before it
+# is converted to an Element
+# gps = parser.read(fields={'latitude', 'longitude', 'altitude'})
 
 # Write gps only Telemetry object to JSON
 # write.telemetryToJson(gps, dest)
\ No newline at end of file
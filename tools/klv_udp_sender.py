@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+# Replays a transport stream (or raw KLV) file over UDP for testing
+# open_telemetry_kit.live.LiveKLVSource.
+#
+# Usage: python3 tools/klv_udp_sender.py file.ts [--host 239.0.0.1] [--port 15000]
+#          [--bitrate 2000000] [--loop]
+#
+# Transport streams are sent as 7 TS packets (1316 bytes) per datagram, the
+# usual MPEG-TS over UDP payload. The send rate is paced to --bitrate.
+
+import argparse
+import socket
+import time
+
+DATAGRAM_SIZE = 7 * 188
+
+def main():
+  arg_parser = argparse.ArgumentParser(description="Replay a KLV transport stream over UDP")
+  arg_parser.add_argument("file")
+  arg_parser.add_argument("--host", default="127.0.0.1")
+  arg_parser.add_argument("--port", type=int, default=15000)
+  arg_parser.add_argument("--bitrate", type=float, default=2e6, help="bits per second")
+  arg_parser.add_argument("--ttl", type=int, default=1, help="multicast TTL")
+  arg_parser.add_argument("--loop", action="store_true", help="replay the file forever")
+  args = arg_parser.parse_args()
+
+  with open(args.file, 'rb') as data_file:
+    data = data_file.read()
+
+  sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+  sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, args.ttl)
+
+  interval = DATAGRAM_SIZE * 8 / args.bitrate
+  datagrams = 0
+  start = time.monotonic()
+  while True:
+    for offset in range(0, len(data), DATAGRAM_SIZE):
+      sock.sendto(data[offset:offset + DATAGRAM_SIZE], (args.host, args.port))
+      datagrams += 1
+      delay = start + datagrams * interval - time.monotonic()
+      if delay > 0:
+        time.sleep(delay)
+
+    if not args.loop:
+      break
+
+  elapsed = time.monotonic() - start
+  print("Sent {} datagrams ({:.2f} MB) in {:.2f} s".format(datagrams, len(data) / 1e6, elapsed))
+
+if __name__ == "__main__":
+  main()